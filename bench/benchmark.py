@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+#benchmark - time common Wadder operations on synthetic WAD files
+#Copyright 2022 Eric Duhamel
+#
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+    usage: python3 bench/benchmark.py <parameters>
+    examples:
+      python3 bench/benchmark.py --output=before.json
+        time every case on a generated WAD and save the results
+      python3 bench/benchmark.py --compare=before.json --output=after.json
+        time every case again and print how each one has changed
+
+    A fixture WAD is written to a temporary directory with
+    "bench/fixtures.py" and each case is run '--repeat=' times. The
+    fastest and median times are kept, along with the commit, Python
+    version and fixture parameters, so that results from different
+    commits can be compared.
+
+    --case=name
+
+        Run only the named case. May be given more than once. Cases:
+        directory_parse, name_lookup, lump_extraction, patch_decode,
+        palette_mapping, level_decode and map_rendering.
+
+    --compare=filename
+
+        Print each case's fastest time against a saved result.
+
+    --flats=N
+    --linedefs=N
+    --lumps=N
+    --patches=N
+
+        Fixture parameters (see "bench/fixtures.py"). Default to 256
+        flats, 20000 linedefs, 50000 lumps and 256 patches.
+
+    --output=filename
+
+        Save the results as JSON.
+
+    --repeat=N
+
+        Run each case N times. Defaults to 5.
+"""
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import fixtures
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+import drawmap
+from xwadder import Doom, levels, patch, wads
+
+parameters = dict(flats=256, linedefs=20000, lumps=50000, patches=256)
+
+def main():
+    options = dict(parameters)
+    cases, repeat, output, compare = [], 5, None, None
+    for arg in sys.argv[1:]:
+        if arg[0:7] == "--case=":
+            cases.append(arg[7:])
+        elif arg[0:10] == "--compare=":
+            compare = arg[10:]
+        elif arg[0:9] == "--output=":
+            output = arg[9:]
+        elif arg[0:9] == "--repeat=":
+            repeat = int(arg[9:])
+        elif arg == "--help":
+            print(__doc__)
+            return
+        else:
+            for key in parameters:
+                if arg[0:len(key) + 3] == "--" + key + "=":
+                    options[key] = int(arg[len(key) + 3:])
+    for name in cases:
+        if name not in benchmarks:
+            print("benchmark: no case named", name)
+            return
+    results = run(options, cases or list(benchmarks), repeat)
+    if compare:
+        with open(compare) as file:
+            print_comparison(json.load(file), results)
+    if output:
+        with open(output, 'w') as file:
+            json.dump(results, file, indent=1)
+        print("benchmark: saved results to", output)
+
+def run(options, cases, repeat):
+    """Return the results of timing 'cases' on a new fixture WAD."""
+    results = dict(commit=get_commit(), python=platform.python_version(),
+                   platform=platform.platform(), parameters=options,
+                   repeat=repeat, cases={})
+    with tempfile.TemporaryDirectory() as dirname:
+        path = os.path.join(dirname, "fixture.wad")
+        fixtures.write_wad(path, **options)
+        for name in cases:
+            setup, case = benchmarks[name]
+            state = setup(path)
+            times = []
+            for n in range(repeat):
+                began = time.perf_counter()
+                case(state)
+                times.append(time.perf_counter() - began)
+            results['cases'][name] = dict(best=min(times),
+                                          median=statistics.median(times))
+            print("%-16s %9.4f s" % (name, min(times)))
+            wad = state.get('wad')
+            if wad:
+                wad.close()
+    return results
+
+def print_comparison(old, new):
+    """Print the fastest time of each case against an older result."""
+    print("compared with", old.get('commit'))
+    if old.get('parameters') != new['parameters']:
+        print("benchmark: warning: fixture parameters differ")
+    for name, result in new['cases'].items():
+        if name in old['cases']:
+            before, after = old['cases'][name]['best'], result['best']
+            print("%-16s %9.4f s -> %9.4f s  %+6.1f%%" % (
+                name, before, after, (after - before) / before * 100))
+
+def get_commit():
+    """Return the git commit of the working tree, or None."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+            text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+            check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# setup and case functions; setup runs once, untimed
+
+def open_wad(path):
+    return dict(path=path)
+
+def open_mapped(path):
+    wad = wads.Wad(path)
+    wad.map_file()
+    return dict(wad=wad)
+
+def open_lumps(path):
+    state = open_mapped(path)
+    wad = state['wad']
+    state['patches'] = [wad.get_lump(i) for i in wad.locate_namespace("P")]
+    state['flats'] = [wad.get_lump(i) for i in wad.locate_namespace("F")]
+    state['playpal'] = wad.get_lump(wad.locate("PLAYPAL"))
+    state['colormap'] = Doom.Colormap(wad.get_lump(wad.locate("COLORMAP")))
+    return state
+
+def open_map(path):
+    state = open_mapped(path)
+    wad = state['wad']
+    state['level'] = levels.load_level(wad, levels.find_maps(wad)[0][1])
+    lumps = state['level'].lumps
+    state['linedefs'] = Doom.load_linedefs(lumps['LINEDEFS'])
+    state['vertexes'] = Doom.load_vertexes(lumps['VERTEXES'])
+    return state
+
+def directory_parse(state):
+    wads.Wad(state['path'])
+
+def name_lookup(state):
+    wad = state['wad']
+    names = [entry['name'] for entry in wad.directory[::1000]]
+    for name in names:
+        wad.locate_name(name)
+
+def lump_extraction(state):
+    wad = state['wad']
+    for i in range(len(wad.directory)):
+        wad.get_lump(i)
+
+def patch_decode(state):
+    for data in state['patches']:
+        patch.Picture(io.BytesIO(data)).get_pixels()
+
+def palette_mapping(state):
+    colormap, playpal = state['colormap'], state['playpal']
+    for data in state['flats']:
+        for level in range(0, 32, 4):
+            patch.get_rgb(colormap.translate(data, level), playpal)
+
+def level_decode(state):
+    level = Doom.Level()
+    level.lumps = state['level'].lumps
+    for name in ('THINGS', 'LINEDEFS', 'SIDEDEFS', 'VERTEXES', 'SECTORS'):
+        level.get_columns(name)
+    Doom.build_sectors(level.get_columns('LINEDEFS'),
+                       level.get_columns('SIDEDEFS'),
+                       level.get_columns('VERTEXES'))
+
+def map_rendering(state):
+    vertexes = state['vertexes']
+    scale = drawmap.get_scale(vertexes, 2048)
+    width, height, rows = drawmap.draw_map(state['linedefs'], vertexes,
+                                           scale)
+    for row in rows:
+        pass
+
+benchmarks = dict(
+    directory_parse=(open_wad, directory_parse),
+    name_lookup=(open_mapped, name_lookup),
+    lump_extraction=(open_mapped, lump_extraction),
+    patch_decode=(open_lumps, patch_decode),
+    palette_mapping=(open_lumps, palette_mapping),
+    level_decode=(open_map, level_decode),
+    map_rendering=(open_map, map_rendering),
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+#fixtures - generate synthetic WAD files for testing and benchmarks
+#Copyright 2022 Eric Duhamel
+#
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+    usage: python3 bench/fixtures.py <parameters> <filename>
+    examples:
+      python3 bench/fixtures.py test.wad
+        write a small WAD with one map, some patches and some flats
+      python3 bench/fixtures.py --lumps=100000 --linedefs=30000 big.wad
+        write a WAD with a huge directory and a large map
+
+    Like "contrib/bootstrap.py", lumps are packed with 'struct' and the
+    WAD is written header, lumps, then directory. Every lump is random
+    data drawn from a seeded generator, so the same parameters always
+    give the same file, byte for byte.
+
+    --flats=N
+
+        Write N 64x64 flats between F_START and F_END. Defaults to 16.
+
+    --linedefs=N
+
+        Give each map a grid of square sectors with at least N linedefs.
+        Defaults to 1000.
+
+    --lumps=N
+
+        Write N more lumps of 16 to 256 bytes, to make a large
+        directory. Defaults to 0.
+
+    --maps=N
+
+        Write N maps, MAP01 onward. Defaults to 1.
+
+    --patches=N
+
+        Write N pictures between P_START and P_END. Defaults to 16.
+
+    --seed=N
+
+        Seed the random generator. Defaults to 0.
+"""
+import random
+import struct
+import sys
+
+defaults = dict(flats=16, linedefs=1000, lumps=0, maps=1, patches=16,
+                seed=0)
+textures = (b"STARTAN3", b"BROWN1", b"BRICK1", b"COMPTALL", b"METAL")
+
+def main():
+    args = [arg for arg in sys.argv[1:] if arg[0:2] != "--"]
+    if len(args) == 1:
+        options = dict(defaults)
+        for arg in sys.argv:
+            for key in defaults:
+                if arg[0:len(key) + 3] == "--" + key + "=":
+                    options[key] = int(arg[len(key) + 3:])
+        count = write_wad(args[0], **options)
+        print("fixtures: wrote", count, "lumps to", args[0])
+    else:
+        print("invoked:", sys.argv[0])
+        print("usage:")
+        print("  python3 bench/fixtures.py [filename]")
+        print("for more help: python3 bench/fixtures.py --help")
+        if "--help" in sys.argv:
+            print(__doc__)
+
+def write_wad(path, flats=16, linedefs=1000, lumps=0, maps=1, patches=16,
+              seed=0):
+    """Write a synthetic IWAD and return the number of lumps in it."""
+    rng = random.Random(seed)
+    flat_names = [b"FLAT%04d" % i for i in range(max(flats, 1))]
+    directory = []
+    with open(path, 'wb') as file:
+        file.write(bytes(12))
+        def add(name, data=b""):
+            directory.append((file.tell(), len(data), name))
+            file.write(data)
+        add(b"PLAYPAL", make_playpal(rng))
+        add(b"COLORMAP", make_colormap())
+        for i in range(maps):
+            add(b"MAP%02d" % (i + 1))
+            for name, data in make_map(rng, linedefs, flat_names):
+                add(name, data)
+        add(b"P_START")
+        for i in range(patches):
+            add(b"PATCH%03d" % i, make_patch(rng, rng.randrange(16, 129),
+                                              rng.randrange(16, 129)))
+        add(b"P_END")
+        add(b"F_START")
+        for name in flat_names[:flats]:
+            add(name, rng.randbytes(4096))
+        add(b"F_END")
+        for i in range(lumps):
+            add(b"LUMP%04X" % (i % 65536), rng.randbytes(rng.randrange(16,
+                                                                       257)))
+        offset = file.tell()
+        for entry in directory:
+            file.write(struct.pack("<ii8s", *entry))
+        file.seek(0)
+        file.write(struct.pack("<4sii", b"IWAD", len(directory), offset))
+    return len(directory)
+
+def make_playpal(rng):
+    """Return 14 palettes of random colors, the last 13 tinted red."""
+    base = rng.randbytes(768)
+    playpal = bytearray(base)
+    for i in range(1, 14):
+        playpal += bytes(min(255, c + i * 8) if n % 3 == 0 else c
+                         for n, c in enumerate(base))
+    return bytes(playpal)
+
+def make_colormap():
+    """Return 34 light maps, each darkening indices toward zero."""
+    return b"".join(bytes(x * (32 - level) // 32 for x in range(256))
+                    for level in range(32)) + bytes(range(256)) + bytes(256)
+
+def make_patch(rng, width, height):
+    """Return a picture of random columns, each one to three posts."""
+    columns = []
+    for x in range(width):
+        column, top = bytearray(), 0
+        for n in range(rng.randrange(1, 4)):
+            if top >= height or top > 254:
+                break
+            length = rng.randrange(1, min(height - top, 255 - top) + 1)
+            column += bytes((top, length, 0))
+            column += rng.randbytes(length) + b"\0"
+            top += length + rng.randrange(0, 8)
+        columns.append(bytes(column + b"\xff"))
+    offsets, offset = [], 8 + 4 * width
+    for column in columns:
+        offsets.append(offset)
+        offset += len(column)
+    return (struct.pack("<HHhh", width, height, width // 2, height) +
+            struct.pack("<%dI" % width, *offsets) + b"".join(columns))
+
+def make_map(rng, linedefs, flat_names):
+    """Return (name, data) for the lumps of a grid of square sectors.
+
+    'k' by 'k' sectors take 2k(k+1) linedefs; 'k' is the smallest that
+    gives at least 'linedefs' lines. Lines inside the grid are
+    two-sided and every line's front side faces into a sector. Sidedef
+    numbers are 16-bit, which limits a map to about 32000 linedefs.
+    """
+    k = 1
+    while 2 * k * (k + 1) < linedefs:
+        k += 1
+    cell = max(1, min(128, 32000 // k))
+    def vertex(x, y):
+        return y * (k + 1) + x
+    if 2 * k * (k + 1) * 2 - 4 * k > 65535:
+        raise ValueError("fixtures: too many sidedefs for a binary map")
+    vertexes = b"".join(struct.pack("<hh", x * cell - 16000,
+                                    y * cell - 16000)
+                        for y in range(k + 1) for x in range(k + 1))
+    lines, sides = [], []
+    def add_line(start, end, front, back):
+        sides.append(front)
+        if back is None:
+            lines.append((start, end, 1, 0, 0, len(sides) - 1, 0xffff))
+        else:
+            sides.append(back)
+            lines.append((start, end, 4, 0, 0, len(sides) - 2,
+                          len(sides) - 1))
+    for y in range(k + 1):
+        for x in range(k):
+            south = (y - 1) * k + x if y > 0 else None
+            north = y * k + x if y < k else None
+            if south is None:
+                add_line(vertex(x + 1, y), vertex(x, y), north, None)
+            else:
+                add_line(vertex(x, y), vertex(x + 1, y), south, north)
+    for x in range(k + 1):
+        for y in range(k):
+            west = y * k + x - 1 if x > 0 else None
+            east = y * k + x if x < k else None
+            if east is None:
+                add_line(vertex(x, y + 1), vertex(x, y), west, None)
+            else:
+                add_line(vertex(x, y), vertex(x, y + 1), east, west)
+    linedef_data = b"".join(struct.pack("<7H", *line) for line in lines)
+    sidedef_data = bytearray()
+    for start, end, flags, special, tag, front, back in lines:
+        if back == 0xffff:
+            sidedef_data += struct.pack("<hh8s8s8sh", 0, 0, b"-", b"-",
+                                        rng.choice(textures), sides[front])
+        else:
+            for side in (front, back):
+                sidedef_data += struct.pack("<hh8s8s8sh", 0, 0,
+                                            rng.choice(textures),
+                                            rng.choice(textures), b"-",
+                                            sides[side])
+    sector_data = b"".join(struct.pack(
+        "<hh8s8shhh", rng.randrange(0, 64, 8), 128, rng.choice(flat_names),
+        rng.choice(flat_names), rng.randrange(96, 256, 16),
+        9 if rng.random() < 0.01 else 0, 0) for i in range(k * k))
+    things = b"".join(struct.pack(
+        "<5h", rng.randrange(-16000, -16000 + k * cell),
+        rng.randrange(-16000, -16000 + k * cell), rng.randrange(0, 360, 45),
+        rng.choice((1, 9, 3001, 3004, 2011)), rng.choice((7, 4, 3, 12)))
+        for i in range(max(1, k * k // 4)))
+    return [(b"THINGS", things), (b"LINEDEFS", linedef_data),
+            (b"SIDEDEFS", bytes(sidedef_data)), (b"VERTEXES", vertexes),
+            (b"SEGS", b""), (b"SSECTORS", b""), (b"NODES", b""),
+            (b"SECTORS", sector_data), (b"REJECT", b""),
+            (b"BLOCKMAP", b"")]
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+#checker - find damage in WAD files
+#Copyright 2022 Eric Duhamel
+#
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+    usage: python3 checker.py <parameters> <filename> [filename ...]
+    examples:
+      python3 checker.py DOOM2.WAD
+        print one line of JSON for each problem found in DOOM2.WAD
+      python3 checker.py --format=text --jobs=4 *.wad
+        check every WAD with four worker processes, for reading
+
+    Each WAD's header and directory are checked for entries past the
+    end of the file and lumps overlapping each other, the header or the
+    directory. Then maps, pictures, flats, palettes, texture
+    definitions, UDMF TEXTMAP and extended nodes lumps are checked for
+    whole records, offsets inside the lump and references to things
+    that exist. Nothing is printed for a WAD without problems. A
+    summary is printed to standard error, and the exit status is 1 if
+    any error was found.
+
+    --format=jsonl
+    --format=csv
+    --format=text
+
+        Print one JSON object per finding (the default), a table of
+        comma-separated values, or one line of text per finding. Each
+        finding has the WAD filename, the index and name of the entry
+        (empty for the file as a whole), its level ("error" or
+        "warning") and a message.
+
+    --jobs=N
+
+        Use N worker processes. Defaults to the number of processors.
+"""
+import csv
+import json
+import os
+import sys
+
+from xwadder import check
+
+fields = ("wad", "index", "name", "level", "message")
+
+def main():
+    args = [arg for arg in sys.argv[1:] if arg[0:2] != "--"]
+    if args and all(os.path.isfile(arg) for arg in args):
+        format, jobs = "jsonl", os.cpu_count()
+        for arg in sys.argv:
+            if arg[0:9] == "--format=":
+                format = arg[9:]
+            elif arg[0:7] == "--jobs=":
+                jobs = int(arg[7:])
+        if format not in ("jsonl", "csv", "text"):
+            print("checker: unknown format", format)
+            sys.exit(2)
+        totals = dict(error=0, warning=0)
+        writer = csv.writer(sys.stdout) if format == "csv" else None
+        if writer:
+            writer.writerow(fields)
+        for findings in check.scan(args, jobs):
+            for item in findings:
+                totals[item['level']] += 1
+                if writer:
+                    writer.writerow([item[field] for field in fields])
+                elif format == "jsonl":
+                    print(json.dumps(item, separators=(",", ":")))
+                else:
+                    where = item['wad']
+                    if item['index'] is not None:
+                        where += ": %d %s" % (item['index'], item['name'])
+                    print("%s: %s: %s" % (where, item['level'],
+                                          item['message']))
+            sys.stdout.flush()
+        print("checker:", totals['error'], "errors and", totals['warning'],
+              "warnings in", len(args), "files", file=sys.stderr)
+        sys.exit(1 if totals['error'] else 0)
+    else:
+        print("invoked:", sys.argv[0])
+        print("usage:")
+        print("  python3 checker.py [filename ...]")
+        print("for more help: python3 -c 'import checker; help(checker)'")
+
+if __name__ == "__main__":
+    try: main()
+    except KeyboardInterrupt: print("Keyboard Interrupt (Control-C)...")
+    sys.exit()
@@ -14,59 +14,565 @@
 #
 #You should have received a copy of the GNU General Public License
 #along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+    usage: python3 drawmap.py <filename> <map name> <parameters>
+    examples:
+      python3 drawmap.py DOOM2.WAD MAP01
+        draw MAP01 of DOOM2.WAD to MAP01.png
+      python3 drawmap.py --max-size=1024 DOOM.WAD E1M1
+        draw E1M1 scaled to fit within 1024x1024 pixels
+
+    --all
+
+        Draw every map in the WAD from a pool of worker processes and
+        write a summary of the files and timings to 'index.json'. No
+        map name is needed.
+
+    --band=N
+
+        Draw the map N rows at a time so that no more than N rows of
+        pixels are held in memory. By default the whole map is drawn
+        at once.
+
+    --cache=dirname
+    --cache-size=N
+
+        Keep raster images in a cache directory of at most N megabytes
+        (256 by default), named by a hash of the map's lumps, the
+        flats, palette and colormap used to fill it, the scale and the
+        format, so a map drawn before from any WAD is copied instead of
+        drawn again.
+
+    --fill
+
+        Fill each sector with its floor flat, shaded to the sector's
+        light level with the WAD's COLORMAP, and draw with the WAD's
+        PLAYPAL. Only raster formats are filled.
+
+    --format=png
+    --format=ppm
+    --format=svg
+    --format=lines
+
+        Save the map as a PNG (the default) or Netpbm raster, as an SVG
+        drawing, or as a compact binary list of lines (see
+        'save_lines').
+
+    --jobs=N
+
+        Use N worker processes for '--all'. Defaults to the number of
+        processors.
+
+    --max-size=N
+
+        Scale the map down to fit within N by N pixels. Defaults to
+        4096 unless '--scale=' is given.
+
+    --output=dirname
+
+        Save files in 'dirname' instead of the current directory.
+
+    --profile
+    --profile=filename
+
+        Time each stage (reading, decoding, filling, rendering and
+        writing) and count bytes read, lumps decoded and pixels
+        rendered. The breakdown is printed at the end, or saved as JSON
+        to 'filename', or as cProfile statistics if 'filename' ends in
+        '.prof'. With '--all' the work of the worker processes is timed
+        only as a whole.
+
+    --scale=F
+
+        Draw F pixels per map unit, e.g. 0.25 for one pixel per four
+        units.
+"""
+import concurrent.futures
+import json
+import multiprocessing
 import os
+import struct
 import sys
+import time
 
-from xwadder import Doom, levels, wads
+from xwadder import Doom, cache, flats, instrument, levels, patch, png, wads
 
-from PIL import Image, ImageDraw
+# background, two-sided, one-sided, special and secret lines
+palette = bytes((0, 0, 0, 96, 96, 96, 176, 176, 176, 224, 192, 64,
+                 208, 64, 208))
+line_groups = ("two-sided", "one-sided", "special", "secret")
+_worker = {}  # state of an '--all' worker process
 
 def main():
-    if len(sys.argv) > 2 and os.path.isfile(sys.argv[1]):
-        filename = sys.argv[1]
-        map_name = sys.argv[2]
+    args = [arg for arg in sys.argv[1:] if arg[0:2] != "--"]
+    if args and (len(args) > 1 or "--all" in sys.argv) and os.path.isfile(
+            args[0]):
+        filename = args[0]
+        options = dict(scale=None, max_size=4096, band=0, format="png",
+                       fill="--fill" in sys.argv)
+        jobs, output = os.cpu_count(), os.getcwd()
+        cache_dir, cache_size = None, 256
+        profile = [arg[10:] for arg in sys.argv if arg[0:9] == "--profile"]
+        if profile:
+            instrument.start(profile[-1] or None)
+        for arg in sys.argv:
+            if arg[0:7] == "--band=":
+                options['band'] = int(arg[7:])
+            elif arg[0:8] == "--cache=":
+                cache_dir = arg[8:]
+            elif arg[0:13] == "--cache-size=":
+                cache_size = int(arg[13:])
+            elif arg[0:9] == "--format=":
+                options['format'] = arg[9:]
+            elif arg[0:7] == "--jobs=":
+                jobs = int(arg[7:])
+            elif arg[0:11] == "--max-size=":
+                options['max_size'] = int(arg[11:])
+            elif arg[0:9] == "--output=":
+                output = arg[9:]
+                if not os.path.isdir(output):
+                    os.makedirs(output)
+            elif arg[0:8] == "--scale=":
+                options['scale'] = float(arg[8:])
+        if cache_dir:
+            options['cache'] = cache.RenderCache(cache_dir, cache_size << 20)
         wad = wads.Wad(filename)
-        map = levels.Level()
-        locate = wad.locate_name(map_name)
-        for i in range(locate, locate + 11):
-            name, lump = wad.get_entry(i)['name'], wad.get_lump(i)
-            map.add_lump(name, lump)
-        print("drawmap: map lumps")
-        for key in map.lumps.keys():
-            print("  ", key)
-        if map.lumps['VERTEXES'] and map.lumps['LINEDEFS']:
-            print("drawmap: combining line definitions with vertices")
-            vertexes = Doom.load_vertexes(map.lumps['VERTEXES'])
-            linedefs = Doom.load_linedefs(map.lumps['LINEDEFS'])
-            print("drawmap: rendering map")
-            image = draw_map(linedefs, vertexes)
-            savename = "".join([map_name, ".png"])
-            print("drawmap: saving to", savename)
-            image.save(savename, 'PNG')
+        maps = dict(levels.find_maps(wad))
+        if "--all" in sys.argv:
+            render_all(wad, options, output, jobs)
+        elif args[1] in maps:
+            render_map(wad, args[1], maps[args[1]], options, output, True)
+        else:
+            print("drawmap: no map named", args[1])
+        if profile:
+            instrument.finish(profile[-1] or None)
     else:
         print("invoked:", sys.argv[0])
         print("usage:")
         print("  python3 drawmap.py [filename] [map name]")
+        print("  python3 drawmap.py --all [filename]")
+        print("for more help: python3 -c 'import drawmap; help(drawmap)'")
+
+def render_map(wad, map_name, index, options, dirname, verbose=False):
+    """Draw the map whose marker is at 'index' and save it.
+
+    Return a summary of the output file, its size in pixels and the
+    seconds taken.
+    """
+    say = print if verbose else lambda *args: None
+    began = time.perf_counter()
+    format, scale = options['format'], options['scale']
+    map = levels.load_level(wad, index)
+    say("drawmap: map lumps")
+    for key in map.lumps.keys():
+        say("  ", key)
+    summary = dict(map=map_name, index=index, file=None)
+    if map.lumps.get('VERTEXES') and map.lumps.get('LINEDEFS'):
+        say("drawmap: combining line definitions with vertices")
+        hexen = 'BEHAVIOR' in map.lumps
+        vertexes = Doom.load_vertexes(map.lumps['VERTEXES'])
+        linedefs = Doom.load_linedefs(map.lumps['LINEDEFS'], hexen)
+        savename = os.path.join(dirname, ".".join([map_name, format]))
+        if format in ("svg", "lines"):
+            say("drawmap: saving", format, "to", savename)
+            save = save_svg if format == "svg" else save_lines
+            save(linedefs, vertexes, savename)
+        else:
+            if scale is None:
+                scale = get_scale(vertexes, options['max_size'])
+            fill = bool(options['fill'] and map.lumps.get('SIDEDEFS')
+                        and map.lumps.get('SECTORS'))
+            renders, key = options.get('cache'), None
+            if renders:
+                key = get_key(wad, map, format, scale, hexen, fill)
+            if key and renders.fetch(key, format, savename):
+                width, height = get_size(vertexes, scale)
+                say("drawmap: copied", width, "x", height, "from the cache",
+                    "to", savename)
+            else:
+                colors, line_colors, sectors = palette, range(5), None
+                if fill:
+                    say("drawmap: building sector outlines")
+                    colors, line_colors, sectors = load_fill(
+                        wad, map, linedefs, vertexes)
+                say("drawmap: rendering map at scale", scale)
+                width, height, rows = draw_map(linedefs, vertexes, scale,
+                                               options['band'], sectors,
+                                               line_colors)
+                say("drawmap: saving", width, "x", height, "to", savename)
+                with instrument.stage("render"):
+                    save_map(rows, width, height, savename, format, colors)
+                if key:
+                    renders.store(key, format, savename)
+            summary.update(width=width, height=height, scale=scale)
+        summary['file'] = savename
+    summary['seconds'] = round(time.perf_counter() - began, 4)
+    return summary
+
+@instrument.timed("render_all")
+def render_all(wad, options, dirname, jobs):
+    """Draw every map in a WAD from a pool of worker processes.
+
+    The WAD is mapped into memory before the workers start. Where
+    processes are forked, every worker shares that one mapping and its
+    parsed directory instead of reading the file again. A summary of
+    every map is written to 'index.json' in 'dirname'.
+    """
+    began = time.perf_counter()
+    maps = levels.find_maps(wad)
+    wad.map_file()
+    _worker['wad'] = wad
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context(
+        "fork" if "fork" in methods else None)
+    summaries = []
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=jobs, mp_context=context, initializer=_render_init,
+            initargs=(wad.filename, options, dirname)) as executor:
+        futures = [executor.submit(_render_worker, name, index)
+                   for name, index in maps]
+        for x, future in enumerate(
+                concurrent.futures.as_completed(futures), 1):
+            summary = future.result()
+            summaries.append(summary)
+            print("drawmap: %d/%d %s %.2fs" % (x, len(maps), summary['map'],
+                                               summary['seconds']))
+    summaries.sort(key=lambda summary: summary['index'])
+    path = os.path.join(dirname, "index.json")
+    with open(path, 'w') as file:
+        json.dump(dict(wad=wad.filename, maps=summaries,
+                       seconds=round(time.perf_counter() - began, 4)),
+                  file, indent=1)
+    print("drawmap: saved summary to", path)
+    return summaries
+
+def _render_init(filename, options, dirname):
+    """Prepare a worker, mapping the WAD only if it was not inherited."""
+    if 'wad' not in _worker:
+        _worker['wad'] = wads.Wad(filename)
+        _worker['wad'].map_file()
+    _worker.update(options=options, dirname=dirname)
+
+def _render_worker(map_name, index):
+    """Draw one map in a worker process."""
+    return render_map(_worker['wad'], map_name, index, _worker['options'],
+                      _worker['dirname'])
+
+@instrument.timed("fill")
+def load_fill(wad, map, linedefs, vertexes):
+    """Return a palette, line colors and sector fills for a map.
+
+    Each sector fill is a pair of the sector's outline from
+    'Doom.build_sectors' and its floor flat shaded to its light level,
+    or None if the flat is missing. Flats are read and shaded once per
+    name and light level.
+    """
+    sidedefs = Doom.load_sidedefs(map.lumps['SIDEDEFS'])
+    sectors = Doom.load_sectors(map.lumps['SECTORS'])
+    n = wad.locate("PLAYPAL")
+    playpal = wad.get_lump(n)[:768] if n is not None else patch.default_map
+    n = wad.locate("COLORMAP")
+    colormap = Doom.Colormap(wad.get_lump(n)) if n is not None else None
+    nearest = Doom.get_quantizer(playpal).get_nearest
+    line_colors = [nearest(*palette[x: x + 3]) for x in range(0, 15, 3)]
+    indices = {}
+    for i in wad.locate_namespace("F"):
+        indices[wad.get_entry(i)['name']] = i
+    shapes = Doom.build_sectors(linedefs, sidedefs, vertexes,
+                                len(sectors['floorpic']))
+    shaded, fills = {}, []
+    for shape, pic, light in zip(shapes, sectors['floorpic'],
+                                 sectors['light']):
+        level = colormap.get_level(light) if colormap else 0
+        key = (pic, level)
+        if key not in shaded:
+            shaded[key] = None
+            if pic in indices:
+                pixels = wad.get_lump(indices[pic])
+                if colormap:
+                    pixels = colormap.translate(pixels, level)
+                shaded[key] = (key, pixels) + flats.get_size(len(pixels))
+        fills.append((shape, shaded[key]))
+    return playpal, line_colors, fills
+
+def get_key(wad, map, format, scale, hexen=False, fill=False):
+    """Return the render cache key of a map drawn at 'scale'.
+
+    The key hashes the lumps the drawing is made from: VERTEXES and
+    LINEDEFS, and to fill sectors also SIDEDEFS, SECTORS, PLAYPAL,
+    COLORMAP and every floor flat the sectors name.
+    """
+    parts = [map.lumps['VERTEXES'], map.lumps['LINEDEFS'], palette, format,
+             scale, hexen, fill]
+    if fill:
+        parts += [map.lumps['SIDEDEFS'], map.lumps['SECTORS']]
+        for name in ("PLAYPAL", "COLORMAP"):
+            n = wad.locate(name)
+            parts.append(wad.get_lump(n) if n is not None else name)
+        indices = {}
+        for i in wad.locate_namespace("F"):
+            indices[wad.get_entry(i)['name']] = i
+        sectors = Doom.load_sectors(map.lumps['SECTORS'])
+        for pic in sorted(set(sectors['floorpic'])):
+            parts.append(pic)
+            if pic in indices:
+                parts.append(wad.get_lump(indices[pic]))
+    return cache.get_key(*parts)
+
+def get_bounds(vertexes):
+    """Return the left, bottom, right and top extents of the vertices."""
+    xs, ys = vertexes['x'], vertexes['y']
+    if not xs:
+        return 0, 0, 0, 0
+    return min(xs), min(ys), max(xs), max(ys)
+
+def get_scale(vertexes, max_size):
+    """Return the largest scale, up to 1, that fits within max_size."""
+    left, bottom, right, top = get_bounds(vertexes)
+    extent = max(right - left, top - bottom) + 1
+    return min(1.0, (max_size - 1) / extent)
+
+def get_size(vertexes, scale):
+    """Return the width and height of a map drawn at 'scale'."""
+    left, bottom, right, top = get_bounds(vertexes)
+    return (int((right - left) * scale + 0.5) + 1,
+            int((top - bottom) * scale + 0.5) + 1)
+
+def get_colors(linedefs):
+    """Return the palette index used to draw each linedef."""
+    colors = []
+    for flags, type, back in zip(linedefs['flags'], linedefs['type'],
+                                 linedefs['back']):
+        if flags & 32:  # secret
+            colors.append(4)
+        elif type:
+            colors.append(3)
+        elif back == 0xffff:
+            colors.append(2)
+        else:
+            colors.append(1)
+    return colors
+
+def draw_map(linedefs, vertexes, scale=1.0, band=0, sectors=None,
+             line_colors=range(5)):
+    """Rasterize linedefs into palette-indexed rows of pixels.
+
+    Return the width and height of the image and a generator of its
+    rows from top to bottom. Map Y coordinates point up, so they are
+    flipped. The image is drawn 'band' rows at a time (all at once if
+    0) into a buffer of one byte per pixel, so peak memory is 'width' *
+    'band' bytes however large the map is.
+
+    'sectors' is an optional list of sector fills (see 'load_fill')
+    drawn beneath the lines, which are drawn with the palette indices
+    in 'line_colors'.
+    """
+    left, bottom, right, top = get_bounds(vertexes)
+    xs = [int((x - left) * scale + 0.5) for x in vertexes['x']]
+    ys = [int((top - y) * scale + 0.5) for y in vertexes['y']]
+    width, height = get_size(vertexes, scale)
+    band = band if band > 0 else height
+    instrument.count("pixels_rendered", width * height)
+    buckets = [[] for x in range(0, height, band)]
+    count = len(xs)
+    lines = sorted(zip(get_colors(linedefs), linedefs['start'],
+                       linedefs['end']))
+    for color, start, end in lines:
+        if start >= count or end >= count:
+            continue
+        x0, y0, x1, y1 = xs[start], ys[start], xs[end], ys[end]
+        if y0 > y1:
+            x0, y0, x1, y1 = x1, y1, x0, y0
+        line = (line_colors[color], x0, y0, x1, y1)
+        for b in range(y0 // band, y1 // band + 1):
+            buckets[b].append(line)
+    fills = [[] for bucket in buckets]
+    for shape, flat in sectors or ():
+        if shape['bbox'] is None or flat is None:
+            continue
+        edges = []
+        for loop in shape['loops']:
+            previous = loop[-1]
+            for vertex in loop:
+                fx0 = (vertexes['x'][previous] - left) * scale
+                fy0 = (top - vertexes['y'][previous]) * scale
+                fx1 = (vertexes['x'][vertex] - left) * scale
+                fy1 = (top - vertexes['y'][vertex]) * scale
+                if fy0 > fy1:
+                    fx0, fy0, fx1, fy1 = fx1, fy1, fx0, fy0
+                if fy0 < fy1:
+                    edges.append((fy0, fy1, fx0, (fx1 - fx0) / (fy1 - fy0)))
+                previous = vertex
+        y0 = int((top - shape['bbox'][3]) * scale)
+        y1 = min(int((top - shape['bbox'][1]) * scale) + 1, height - 1)
+        for b in range(y0 // band, y1 // band + 1):
+            fills[b].append((y0, y1, edges, flat))
+    # the map column and row under every pixel, wrapped by each flat
+    us = [int(left + x / scale) for x in range(width)]
+    vs = [int(y / scale - top) for y in range(height)]
+    rows = _draw_bands(buckets, fills, width, height, band, us, vs)
+    return width, height, rows
+
+def _draw_bands(buckets, fills, width, height, band, us, vs):
+    """Yield the rows of each band after drawing its sectors and lines.
+
+    A flat whose width divides 256 is drawn by translating the map
+    columns, wrapped at 256, through one of its rows. A wider flat, or
+    one of another width, is drawn one pixel at a time.
+    """
+    tables, wrapped = {}, bytes(u & 255 for u in us)
+    for b, lines in enumerate(buckets):
+        first = b * band
+        rows = min(band, height - first)
+        buffer = bytearray(width * rows)
+        for y0, y1, edges, flat in fills[b]:
+            key, pixels, w, h = flat
+            for y in range(max(y0, first), min(y1, first + rows - 1) + 1):
+                v = vs[y] % h
+                table = tables.get((key, v))
+                if table is None:
+                    row = pixels[v * w: v * w + w]
+                    if 256 % w:
+                        table = (row, w)
+                    else:
+                        table = bytes(row[u % w] for u in range(256))
+                    tables[key, v] = table
+                fill_row(buffer, (y - first) * width, width, y, edges,
+                         us if 256 % w else wrapped, table)
+        for line in lines:
+            draw_line(buffer, width, first, rows, *line)
+        for r in range(rows):
+            yield buffer[r * width: r * width + width]
+
+def fill_row(buffer, offset, width, y, edges, us, table):
+    """Fill the spans of row 'y' inside a set of polygon edges.
+
+    Each edge is a tuple of its top and bottom Y, the X at its top and
+    the change in X per row. Spans between pairs of crossings are
+    filled using the even-odd rule, so holes are left unfilled, by
+    translating the flat columns 'us' under the span through 'table', a
+    row of the flat repeated to 256 bytes. If 'table' is instead a pair
+    of a row and its width, 'us' are map columns and each is wrapped by
+    that width.
+    """
+    crossings = sorted(x + (y - y0) * slope for y0, y1, x, slope in edges
+                       if y0 <= y < y1)
+    for a, b in zip(crossings[0::2], crossings[1::2]):
+        xa, xb = max(int(a + 0.5), 0), min(int(b + 0.5), width - 1)
+        if xa > xb:
+            continue
+        if isinstance(table, tuple):
+            row, w = table
+            buffer[offset + xa: offset + xb + 1] = bytes(
+                row[u % w] for u in us[xa: xb + 1])
+        else:
+            buffer[offset + xa: offset + xb + 1] = \
+                us[xa: xb + 1].translate(table)
+
+def draw_line(buffer, width, first, rows, color, x0, y0, x1, y1):
+    """Draw a line from (x0, y0) down to (x1, y1) within a band.
+
+    The line is drawn as one horizontal run per row, worked out with
+    integer arithmetic, and only the rows from 'first' to 'first' +
+    'rows' are touched. 'y0' must not be greater than 'y1'.
+    """
+    dx, dy = x1 - x0, y1 - y0
+    top, bottom = max(y0, first), min(y1, first + rows - 1)
+    for y in range(top, bottom + 1):
+        if dy:
+            # x at half a row above and below the center of row y
+            lo = max(2 * (y - y0) - 1, 0)
+            hi = min(2 * (y - y0) + 1, 2 * dy)
+            xa = x0 + (dx * lo + dy) // (2 * dy)
+            xb = x0 + (dx * hi + dy) // (2 * dy)
+        else:
+            xa, xb = x0, x1
+        if xa > xb:
+            xa, xb = xb, xa
+        offset = (y - first) * width
+        buffer[offset + xa: offset + xb + 1] = bytes((color,)) * (xb - xa + 1)
+
+def save_map(rows, width, height, path, format="png", colors=palette):
+    """Stream rows of palette indices to a PNG or Netpbm file."""
+    with open(path, 'wb') as file:
+        if format == "png":
+            writer = png.Writer(file, width, height, 'indexed', colors)
+            for row in rows:
+                writer.write_row(row)
+            writer.close()
+        else:
+            file.write(bytes("P6 %d %d 255 " % (width, height), 'ascii'))
+            for row in rows:
+                file.write(patch.get_rgb(row, colors + bytes(768)))
+    return path
+
+def save_lines(linedefs, vertexes, path):
+    """Save linedefs as a compact binary list of line segments.
+
+    The file starts with the 4 bytes 'LINE' and the number of lines as
+    a 32-bit unsigned integer, followed by 9 bytes per line: x1, y1,
+    x2 and y2 as 16-bit signed integers in map units, then a group
+    number from 0 to 3 (see 'line_groups'). All values are little
+    endian.
+    """
+    xs, ys = vertexes['x'], vertexes['y']
+    count = len(xs)
+    record = struct.Struct("<hhhhB")
+    with open(path, 'wb') as file:
+        file.write(b"LINE")
+        file.write(bytes(4))
+        total, buffer = 0, bytearray()
+        for color, start, end in zip(get_colors(linedefs),
+                                     linedefs['start'], linedefs['end']):
+            if start < count and end < count:
+                buffer += record.pack(xs[start], ys[start], xs[end],
+                                      ys[end], color - 1)
+                total += 1
+                if len(buffer) >= 1 << 16:
+                    file.write(buffer)
+                    buffer.clear()
+        file.write(buffer)
+        file.seek(4)
+        file.write(struct.pack("<I", total))
+    return path
+
+def save_svg(linedefs, vertexes, path):
+    """Stream linedefs to an SVG drawing in map units.
 
-def draw_map(linedefs, vertexes):
-    # determine map dimensions
-    left, top, right, bottom = 0, 0, 0, 0
-    for vertex in vertexes:
-        if vertex['x'] < left: left = vertex['x']
-        if vertex['x'] > right: right = vertex['x']
-        if vertex['y'] < top: top = vertex['y']
-        if vertex['y'] > bottom: bottom = vertex['y']
-    width, height = right - left, bottom - top
-    # draw the map
-    image = Image.new('RGB', (width, height), (0, 0, 0))
-    draw = ImageDraw.Draw(image)
-    for linedef in linedefs:
-        start = vertexes[linedef['start']]
-        stend = vertexes[linedef['end']]
-        x1, y1 = start['x'] - left, start['y'] - top
-        x2, y2 = stend['x'] - left, stend['y'] - top
-        draw.line((x1, y1, x2, y2), fill=(176, 176, 176))
-    return image
+    Lines are grouped into one path element per group in
+    'line_groups', so the document has a handful of elements however
+    many linedefs there are. Each path is written in pieces as it is
+    built. Y coordinates are flipped to point down.
+    """
+    left, bottom, right, top = get_bounds(vertexes)
+    xs, ys = vertexes['x'], vertexes['y']
+    count = len(xs)
+    colors = get_colors(linedefs)
+    with open(path, 'w') as file:
+        file.write('<svg xmlns="http://www.w3.org/2000/svg" '
+                   'viewBox="0 0 %d %d" width="%d" height="%d">\n'
+                   % (right - left + 1, top - bottom + 1,
+                      right - left + 1, top - bottom + 1))
+        file.write('<rect width="100%" height="100%" fill="#000"/>\n')
+        for group, name in enumerate(line_groups, 1):
+            rgb = palette[group * 3: group * 3 + 3].hex()
+            file.write('<path class="%s" stroke="#%s" fill="none" '
+                       'vector-effect="non-scaling-stroke" d="'
+                       % (name, rgb))
+            pieces = []
+            for color, start, end in zip(colors, linedefs['start'],
+                                         linedefs['end']):
+                if color == group and start < count and end < count:
+                    pieces.append("M%d %dL%d %d" % (
+                        xs[start] - left, top - ys[start],
+                        xs[end] - left, top - ys[end]))
+                    if len(pieces) >= 4096:
+                        file.write("".join(pieces))
+                        pieces.clear()
+            file.write("".join(pieces))
+            file.write('"/>\n')
+        file.write("</svg>\n")
+    return path
 
 if __name__ == "__main__":
     try: main()
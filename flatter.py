@@ -18,15 +18,22 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 import os
 import sys
 
+from xwadder import lumps, png
+
 def main():
     filename = sys.argv[-1]
     if os.path.isfile(filename):
         if len(sys.argv) < 3:
             check_file(filename)
         colormap, height, width = graymap(), 64, 64
+        lightmap, level = None, 0
         for arg in sys.argv:
-            if arg[0:9] == "--height=":
+            if arg[0:11] == "--colormap=":
+                lightmap = load_colormap(arg[11:])
+            elif arg[0:9] == "--height=":
                 height = int(arg[9:])
+            elif arg[0:8] == "--light=":
+                level = int(arg[8:])
             elif arg[0:10] == "--playpal=":
                 path = arg[10:]
                 colormap = load_playpal(path)
@@ -35,8 +42,18 @@ def main():
                 name = os.path.splitext(filename)[0]
                 print("flatter: saving color values to", name + ".pgm")
                 save_graymap(flat, name + ".pgm")
+            elif arg == "--save-png":
+                flat = load_flat(filename)
+                if lightmap:
+                    flat = shade_flat(flat, lightmap, level)
+                name = os.path.splitext(filename)[0]
+                print("flatter: saving indexed color values to", name + ".png")
+                png.save_png(name + ".png", width, height, flat, 'indexed',
+                             colormap)
             elif arg == "--save-pixmap":
                 flat = load_flat(filename)
+                if lightmap:
+                    flat = shade_flat(flat, lightmap, level)
                 pixmap = get_pixmap(flat, colormap)
                 name = os.path.splitext(filename)[0]
                 print("flatter: saving colormapped values to", name + ".ppm")
@@ -53,6 +70,8 @@ def check_file(filename):
         print("flatter: filesize", filesize, "may be a 'flat' lump")
     else:
         print("flatter: filesize", filesize, "likely not a 'flat' lump")
+    print("flatter: header looks like a '%s' lump" %
+          lumps.sniff_file(filename))
 
 def get_pixmap(bytemap, colormap):
     """Render a pixmap using color values and a transparency mask."""
@@ -68,6 +87,11 @@ def graymap():
         map.extend((i, i, i))
     return map
 
+def load_colormap(filename):
+    """Load the 34 256-byte light maps of a COLORMAP lump."""
+    with open(filename, 'rb') as file:
+        return file.read(8704)
+
 def load_flat(filename):
     """Return color value bytes from a binary file."""
     with open(filename, 'rb') as file:
@@ -78,6 +102,11 @@ def load_playpal(filename):
     with open(filename, 'rb') as file:
         return file.read(768)
 
+def shade_flat(bytemap, lightmap, level):
+    """Translate color values through one light map of a COLORMAP."""
+    table = lightmap[level * 256: level * 256 + 256]
+    return bytemap.translate(table)
+
 def save_graymap(bytemap, name):
     """Save bytes to a 4096-pixel Portable GrayMap."""
     with open(name, 'wb') as file:
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+#grepper - search the data of lumps in WAD files
+#Copyright 2022 Eric Duhamel
+#
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+    usage: python3 grepper.py <parameters> <pattern> <filename> [...]
+    examples:
+      python3 grepper.py "Thing [0-9]+" *.wad
+        find DeHackEd thing blocks in the lumps of every WAD
+      python3 grepper.py --name=MAPINFO --ignore-case sky1 *.wad
+        find the sky settings in MAPINFO lumps
+      python3 grepper.py --format=text --namespace=F "\\x00{64}" a.wad
+        find flats with a row of color zero
+      python3 grepper.py --type=text --fixed Doom *.wad
+        find a word in every lump of plain text
+
+    The pattern is a regular expression matched against the bytes of
+    each lump, one lump at a time, so a match never spans two lumps.
+    Characters in the pattern stand for the bytes of the same value.
+    The exit status is 0 if anything matched and 1 otherwise.
+
+    --fixed
+
+        Match the pattern literally instead of as a regular expression.
+
+    --format=jsonl
+    --format=csv
+    --format=text
+
+        Print one JSON object per match (the default), a table of
+        comma-separated values, or one line of text per match. Each
+        match has the WAD filename, the index and name of the lump, the
+        offset of the match in the lump and the matched bytes.
+
+    --ignore-case
+
+        Match letters of either case.
+
+    --jobs=N
+
+        Use N worker processes. Defaults to the number of processors.
+
+    --name=pattern
+
+        Search only lumps with names matching a pattern such as
+        'DEHACKED' or 'MAP*'.
+
+    --namespace=letter
+
+        Search only lumps between markers such as F_START and F_END for
+        'F', or S_START and S_END for 'S'.
+
+    --type=kind
+
+        Search only lumps of one kind, such as 'text', 'patch', 'flat',
+        'map_lump' or 'mus', as told from their names, namespaces and
+        headers. See 'xwadder.lumps' for every kind.
+"""
+import csv
+import json
+import os
+import sys
+
+from xwadder import search
+
+fields = ("wad", "index", "name", "offset", "match")
+
+def main():
+    args = [arg for arg in sys.argv[1:] if arg[0:2] != "--"]
+    if len(args) > 1 and all(os.path.isfile(arg) for arg in args[1:]):
+        format, jobs, namespace, name = "jsonl", os.cpu_count(), None, None
+        kind = None
+        for arg in sys.argv:
+            if arg[0:9] == "--format=":
+                format = arg[9:]
+            elif arg[0:7] == "--jobs=":
+                jobs = int(arg[7:])
+            elif arg[0:7] == "--name=":
+                name = arg[7:]
+            elif arg[0:12] == "--namespace=":
+                namespace = arg[12:]
+            elif arg[0:7] == "--type=":
+                kind = arg[7:]
+        if format not in ("jsonl", "csv", "text"):
+            print("grepper: unknown format", format)
+            sys.exit(2)
+        pattern = search.compile_pattern(args[0], "--fixed" in sys.argv,
+                                         "--ignore-case" in sys.argv)
+        writer = csv.writer(sys.stdout) if format == "csv" else None
+        if writer:
+            writer.writerow(fields)
+        found = 0
+        for hits in search.scan(args[1:], pattern, jobs, namespace, name,
+                                kind):
+            for hit in hits:
+                if writer:
+                    writer.writerow([hit[field] for field in fields])
+                elif format == "jsonl":
+                    print(json.dumps(hit, separators=(",", ":")))
+                else:
+                    print("%s: %d %s: %d: %s" % (
+                        hit['wad'], hit['index'], hit['name'],
+                        hit['offset'], hit['match']))
+            found += len(hits)
+        sys.exit(0 if found else 1)
+    else:
+        print("invoked:", sys.argv[0])
+        print("usage:")
+        print("  python3 grepper.py [pattern] [filename ...]")
+        print("for more help: python3 -c 'import grepper; help(grepper)'")
+
+if __name__ == "__main__":
+    try: main()
+    except KeyboardInterrupt: print("Keyboard Interrupt (Control-C)...")
+    sys.exit()
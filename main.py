@@ -23,14 +23,63 @@ Usage: main.py [filename] [arguments]
 'filename' is used to load a WAD file and the following arguments
 operate on the WAD.
 
+--cache=[dirname]
+--cache-size=[N]
+
+    Keep the images rendered by '--render=' in a cache directory of at
+    most N megabytes (256 by default), named by a hash of the lump,
+    palette and format, so a picture already rendered from any WAD is
+    copied from the cache instead of drawn again.
+
 --find=[string]
 
     Print every entry named beginning with 'string'.
 
+--format=[ppm or png]
+
+    Save images from '--save-patch=' and '--render=' as Netpbm (the
+    default) or PNG files.
+
+--jobs=[N]
+
+    Use N worker processes for '--render='. Defaults to the number of
+    processors.
+
+--light=[N]
+
+    Shade pictures saved after this argument with COLORMAP map N, from
+    0 (full brightness) to 31 (darkest).
+
 --list=[N]
 
     Print the metadata for N entries.
 
+--output=[dirname]
+
+    Write images rendered by '--render=' to 'dirname'.
+
+--profile
+--profile=[filename]
+
+    Time each stage of the work and count bytes read, lumps decoded,
+    pixels rendered and so on. The breakdown is printed when all other
+    arguments are done, or saved as JSON to 'filename', or if
+    'filename' ends in '.prof' saved as cProfile statistics.
+
+--render=[namespace or pattern]
+
+    Render every matching lump as a raster image file. 'namespace' is
+    one of 'sprites', 'patches' or 'flats'; anything else is a name
+    pattern such as 'TROO*' or 'SKY?'. Lumps are decoded in parallel
+    and progress is printed as images are written. Images are named
+    after their lumps, with '-' and the lump's index added to a name
+    that more than one lump has.
+
+--save-atlas=[name]
+
+    Pack every flat between F_START and F_END into one PNG image
+    'name.png' with the position of each flat in 'name.json'.
+
 --save-lump=[N]
 
     Save Nth lump as a raw '.lmp' file.
@@ -47,24 +96,46 @@ operate on the WAD.
 
     Set the starting point for '--list='.
 """
+import collections
+import concurrent.futures
+import io
 import os
 import sys
 import tempfile
 
-from xwadder import patch, wads, Doom
+from xwadder import cache, flats, instrument, patch, png, wads, Doom
+
+namespaces = dict(sprites="S", patches="P", flats="F")
+_worker = {}  # state of a '--render=' worker process
 
 def _main():
     if len(sys.argv) > 1:
         path = sys.argv[1]
         if os.path.isfile(path):
+            profile = [arg[10:] for arg in sys.argv
+                       if arg[0:9] == "--profile"]
+            if profile:
+                instrument.start(profile[-1] or None)
             wad = wads.Wad(path)
             if len(sys.argv) > 2:
                 _parse(wad, sys.argv)
+            if profile:
+                instrument.finish(profile[-1] or None)
 
 def _parse(wad, args):
     start = 0  # start at index 0 by default
+    colormap, level = None, 0
+    jobs, output = os.cpu_count(), os.getcwd()
+    format = "ppm"
+    renders, cache_size = None, 256
     for arg in args:
-        if arg[0: 7] == "--find=":
+        if arg[0: 8] == "--cache=":
+            renders = cache.RenderCache(arg[8: ], cache_size << 20)
+        elif arg[0: 13] == "--cache-size=":
+            cache_size = int(arg[13: ])
+            if renders:
+                renders.max_bytes = cache_size << 20
+        elif arg[0: 7] == "--find=":
             name = arg[7: ]
             index, x = wad.locate(name), 0
             while isinstance(index, int):
@@ -72,16 +143,42 @@ def _parse(wad, args):
                 print(entry)
                 x = x + 1
                 index = wad.locate(name, x)
+        elif arg[0: 9] == "--format=":
+            format = arg[9: ]
+        elif arg[0: 7] == "--jobs=":
+            jobs = int(arg[7: ])
         elif arg[0: 7] == "--list=":
             number = int(arg[7: ])
             stop = start + int(number)
             for n in range(start, stop):
                 entry = wad.get_entry(n)
                 print(entry)
+        elif arg[0: 9] == "--output=":
+            output = arg[9: ]
+            if not os.path.isdir(output):
+                os.makedirs(output)
+        elif arg[0: 9] == "--render=":
+            _render(wad, arg[9: ], output, jobs, colormap, level, format,
+                    renders)
+        elif arg[0: 13] == "--save-atlas=":
+            name = os.path.join(output, arg[13: ])
+            wad.map_file()
+            atlas = flats.Atlas(wad, wad.locate_namespace("F"))
+            n = wad.locate("PLAYPAL")
+            playpal = wad.get_lump(n) if n is not None else None
+            for path in atlas.save(name, playpal):
+                print("saved flat atlas to", path)
         elif arg[0: 12] == "--save-lump=":
             n = int(arg[12: ])
             path = wad.save_lump(n, os.getcwd())
             print("saved lump data to", path)
+        elif arg[0: 8] == "--light=":
+            level = int(arg[8: ])
+            n = wad.locate("COLORMAP")
+            if n is None:
+                print("main: no COLORMAP lump, pictures will not be shaded")
+            else:
+                colormap = Doom.Colormap(wad.get_lump(n))
         elif arg[0: 11] == "--save-map=":
             name = arg[11: ]
             if not os.path.isdir(name):
@@ -97,10 +194,109 @@ def _parse(wad, args):
             n = wad.locate("PLAYPAL")
             playpal = wad.get_lump(n)
             name = os.path.basename(path)
-            picture.save_image(name, playpal=playpal)
+            picture.save_image(name, playpal=playpal, colormap=colormap,
+                               level=level, format=format)
         elif arg[0: 8] == "--start=":
             start = int(arg[8: ])
 
+@instrument.timed("render")
+def _render(wad, query, dirname, jobs, colormap=None, level=0,
+            format="ppm", renders=None):
+    """Render every picture or flat in a namespace or matching a name
+    pattern, skipping lumps of other kinds, through a 'cache.RenderCache'
+    if given.
+    """
+    kinds = wad.get_kinds()
+    if query.lower() in namespaces:
+        indices = wad.locate_namespace(namespaces[query.lower()])
+    else:
+        indices = wad.locate_glob(query)
+    n = wad.locate("PLAYPAL")
+    playpal = wad.get_lump(n) if n is not None else patch.default_map
+    if colormap:
+        playpal = colormap.get_playpal(playpal, level)
+    indices = [i for i in indices if kinds[i] in ("flat", "patch")]
+    names = collections.Counter(wad.get_entry(i)['name'] for i in indices)
+    tasks = []
+    for i in indices:  # a repeated name is told apart by its index
+        name = wad.get_entry(i)['name']
+        if names[name] > 1:
+            name = "%s-%d" % (name, i)
+        tasks.append((i, kinds[i] == "flat", name))
+    total = len(tasks)
+    chunksize = max(1, total // (max(jobs, 1) * 8))
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=jobs, initializer=_render_init,
+            initargs=(wad.filename, playpal, dirname, format,
+                      renders)) as executor:
+        results = executor.map(_render_lump, tasks, chunksize=chunksize)
+        failed = 0
+        for x, (index, error) in enumerate(results, 1):
+            if error:
+                failed += 1
+                print("\rmain: could not render lump %d %s: %s" % (
+                    index, wad.get_entry(index)['name'], error),
+                    file=sys.stderr)
+            print("\rrendered", x, "of", total, end="", file=sys.stderr)
+    if total:
+        print(file=sys.stderr)
+    if failed:
+        print("main:", failed, "of", total, "lumps could not be rendered",
+              file=sys.stderr)
+
+def _render_init(filename, playpal, dirname, format, renders):
+    """Map the WAD once in each worker process."""
+    global _worker
+    wad = wads.Wad(filename)
+    wad.map_file()
+    _worker = dict(wad=wad, playpal=playpal, dirname=dirname, format=format,
+                   renders=renders)
+
+def _render_lump(task):
+    """Write one lump as an image, returning its index and None, or
+    its index and the error that stopped it, so that one damaged lump
+    does not stop the others.
+    """
+    try:
+        _write_lump(*task)
+    except Exception as error:  # anything a damaged lump may raise
+        return task[0], "%s: %s" % (type(error).__name__, error)
+    return task[0], None
+
+def _write_lump(index, flat, filename):
+    """Write one lump as an image, returning the path.
+
+    With a render cache, the lump is decoded only if no image of the
+    same data, palette and format is cached.
+    """
+    wad, playpal = _worker['wad'], _worker['playpal']
+    format, renders = _worker['format'], _worker['renders']
+    lump = wad.get_lump(index)
+    name = os.path.join(_worker['dirname'], filename)
+    if renders is None:
+        return _draw_lump(lump, flat, name, playpal, format)
+    ext = "png" if format == "png" else "ppm"
+    key = cache.get_key(lump, playpal, flat, ext)
+    return renders.render(key, ext, name + "." + ext, lambda path:
+                          _draw_lump(lump, flat, name, playpal, format))
+
+def _draw_lump(lump, flat, name, playpal, format):
+    """Decode a flat or picture and save it as 'name' plus an extension
+    for 'format', returning the path.
+    """
+    if flat:
+        width, height = flats.get_size(len(lump))
+        if format == "png":
+            return png.save_png(name + ".png", width, height, lump,
+                                'indexed', playpal)
+        path = name + ".ppm"
+        with open(path, 'wb') as file:
+            file.write(bytes("P6 %d %d 255 " % (width, height), 'ascii'))
+            file.write(patch.get_rgb(lump[:width * height], playpal))
+        return path
+    picture = patch.Picture(io.BytesIO(lump))
+    return picture.save_image(name, playpal=playpal, format=format)
+
 if __name__ == "__main__":
     try: _main()
     except KeyboardInterrupt: print("Keyboard Interrupt (Control-C)...")
@@ -19,18 +19,46 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 import os
 import sys
 
+from xwadder import Doom, png
+
 def main():
     filename = sys.argv[-1]
     if os.path.isfile(filename):
         if len(sys.argv) < 3:
             check_file(filename)
-        index = 0
+        index, bits = 0, 5
         playpal = load_playpal(filename, index)
         for arg in sys.argv:
-            if arg[0:8] == "--index=":
+            if arg[0:7] == "--bits=":
+                bits = int(arg[7:])
+                if not 1 <= bits <= 8:
+                    print("paller: --bits= must be from 1 to 8, not", bits)
+                    print("usage: python3 paller.py --bits=[1-8] "
+                          "--quantize=[image] [filename]")
+                    sys.exit(2)
+            elif arg[0:8] == "--index=":
                 index = int(arg[8:])
                 print("paller: using palette", index)
                 playpal = load_playpal(filename, index)
+            elif arg[0:11] == "--quantize=":
+                path = arg[11:]
+                width, height, rgb = load_pixmap(path)
+                quantizer = Doom.get_quantizer(playpal, bits)
+                indices = quantizer.quantize(rgb, width,
+                                             dither="--dither" in sys.argv,
+                                             exact="--exact" in sys.argv)
+                name = os.path.splitext(path)[0] + ".lmp"
+                print("paller: saving", width, "x", height,
+                      "palette indices to", name)
+                save_lump(indices, name)
+            elif arg == "--make-colormap":
+                name = os.path.splitext(filename)[0] + "-COLORMAP.lmp"
+                print("paller: saving 34 light maps to", name)
+                save_lump(make_colormap(playpal), name)
+            elif arg == "--make-playpal":
+                name = os.path.splitext(filename)[0] + "-PLAYPAL.lmp"
+                print("paller: saving 14 palettes to", name)
+                save_lump(make_playpal(playpal), name)
             elif arg == "--print":
                 for i in range(0, 768, 3):
                     print(playpal[i:i+3].hex())
@@ -42,6 +70,10 @@ def main():
                 if arg == "--save-lump":
                     print("paller: saving lump data to", name + ".lmp")
                     save_lump(playpal, name + ".lmp")
+                if arg == "--save-png":
+                    print("paller: saving colors to", name + ".png")
+                    png.save_png(name + ".png", 16, 16, bytes(range(256)),
+                                 'indexed', playpal)
                 if arg == "--save-pixmap" in sys.argv:
                     print("paller: saving colors to", name + ".ppm")
                     save_pixmap(playpal, name + ".ppm")
@@ -62,11 +94,99 @@ def check_file(filename):
         print("paller: this is likely not a palette lump")
 
 def load_playpal(filename, index):
+    if os.path.splitext(filename)[1] == ".txt":
+        return read_hexmap(filename)
     with open(filename, 'rb') as file:
         file.seek(768 * index)
         playpal = file.read(768)
     return playpal
 
+def load_pixmap(filename):
+    """Return width, height and RGB bytes of a binary Netpbm file.
+
+    Both P6 (pixmap) and P5 (graymap) files are accepted; gray values
+    are expanded to RGB.
+    """
+    with open(filename, 'rb') as file:
+        data = file.read()
+    fields, x = [], 0
+    while len(fields) < 4:
+        while data[x: x + 1].isspace():
+            x += 1
+        if data[x: x + 1] == b"#":
+            x = data.index(b"\n", x)
+            continue
+        end = x
+        while not data[end: end + 1].isspace():
+            end += 1
+        fields.append(data[x: end])
+        x = end
+    magic, width, height = fields[0], int(fields[1]), int(fields[2])
+    pixels = data[x + 1:]
+    if magic == b"P5":
+        gray = pixels[:width * height]
+        rgb = bytearray(len(gray) * 3)
+        rgb[0::3], rgb[1::3], rgb[2::3] = gray, gray, gray
+        return width, height, bytes(rgb)
+    return width, height, pixels[:width * height * 3]
+
+def make_colormap(playpal):
+    """Return a 34-map COLORMAP lump derived from one palette.
+
+    Maps 0-31 fade every color towards black, map 32 is the inverted
+    grayscale used by the invulnerability effect and map 33 is black.
+    Each of the 8,704 colors is matched to the palette with an exact
+    nearest-color search through a shared 'Doom.Quantizer', whose
+    block candidate lists keep each search to a handful of entries.
+    """
+    quantizer = Doom.get_quantizer(playpal)
+    nearest = quantizer.get_nearest
+    colors = quantizer.colors
+    colormap = bytearray()
+    for i in range(32):
+        brightness = (32 - i) / 32
+        colormap.extend(nearest(int(r * brightness), int(g * brightness),
+                                int(b * brightness))
+                        for r, g, b in colors)
+    for r, g, b in colors:
+        gray = 255 - (r + g + b) // 3
+        colormap.append(nearest(gray, gray, gray))
+    colormap.extend(bytes([nearest(0, 0, 0)]) * 256)
+    return bytes(colormap)
+
+def make_playpal(playpal):
+    """Return the 14 palettes of a PLAYPAL lump from a base palette.
+
+    The red (pain), gold (bonus) and green (radiation suit) palettes
+    are biased towards their target colors as in Doom's st_stuff.c.
+    Each biased palette is built with one translate table per color
+    channel instead of a calculation per color.
+    """
+    # (target color, bias) for palettes 1-13
+    tints = [((255, 0, 0), (i + 1) * 0.9 / 8) for i in range(8)]
+    tints += [((215, 186, 69), (i + 1) * 0.5 / 4) for i in range(4)]
+    tints += [((0, 255, 0), 0.125)]
+    base = bytes(playpal[:768])
+    channels = base[0::3], base[1::3], base[2::3]
+    palettes = bytearray(base)
+    for target, p in tints:
+        palette = bytearray(768)
+        for c in range(3):
+            table = bytes(min(max(int(v * (1 - p) + target[c] * p), 0), 255)
+                          for v in range(256))
+            palette[c::3] = channels[c].translate(table)
+        palettes.extend(palette)
+    return bytes(palettes)
+
+def read_hexmap(filename):
+    """Return a palette read from 256 hex-encoded lines of text."""
+    playpal = bytearray()
+    with open(filename) as file:
+        for line in file:
+            if line.strip():
+                playpal.extend(bytes.fromhex(line.strip()))
+    return bytes(playpal[:768])
+
 def save_graymap(bytemap, name):
     """Save bytes to a 4096-pixel Portable GrayMap."""
     with open(name, 'wb') as file:
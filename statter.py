@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+#statter - gather statistics of the maps in WAD files
+#Copyright 2022 Eric Duhamel
+#
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+    usage: python3 statter.py <parameters> <filename> [filename ...]
+    examples:
+      python3 statter.py DOOM2.WAD
+        print one line of JSON for each map in DOOM2.WAD
+      python3 statter.py --format=csv --cache=stats *.wad > maps.csv
+        tabulate every map of every WAD, caching results in 'stats'
+      python3 statter.py --save-index=textures.json *.wad
+        record which maps of every WAD use each texture and flat
+      python3 statter.py --index=textures.json --uses=SW1*
+        list the maps using any texture or flat named SW1...
+
+    --cache=dirname
+
+        Keep the statistics of each map in 'dirname', named by a hash
+        of the map's lumps, and reuse them on later runs.
+
+    --format=jsonl
+    --format=csv
+
+        Print one JSON object per map (the default), or a table of
+        comma-separated values with one row per map. The table holds
+        only the totals; per-type counts are in the JSON output.
+
+    --index=filename
+
+        Load a texture index saved with '--save-index=' for use with
+        '--uses=' and '--unused'. No WAD files are read to answer
+        '--uses='.
+
+    --jobs=N
+
+        Use N worker processes. Defaults to the number of processors.
+
+    --save-index=filename
+
+        Save an index of the wall textures and flats used by every map
+        of the WAD files, instead of printing statistics.
+
+    --total
+
+        Print only the statistics of all maps added together, as one
+        JSON object or one CSV row.
+
+    --unused
+
+        Print the name of every texture (from TEXTURE1 and TEXTURE2)
+        and flat defined in the WAD files which no map in the index
+        uses.
+
+    --uses=name
+
+        Print the WAD filename and map name of every map in the index
+        using a texture or flat named 'name', which may be a pattern
+        such as 'SW1*'.
+"""
+import csv
+import json
+import os
+import sys
+
+from xwadder import stats, textures, wads
+
+# columns of '--format=csv'
+csv_fields = ("wad", "map", "hash", "things", "linedefs", "sidedefs",
+              "vertexes", "sectors", "secrets", "secret_lines",
+              "min_x", "min_y", "max_x", "max_y")
+
+def main():
+    args = [arg for arg in sys.argv[1:] if arg[0:2] != "--"]
+    if any(arg[0:8] == "--index=" or arg[0:13] == "--save-index="
+           for arg in sys.argv):
+        use_index(args)
+    elif args and all(os.path.isfile(arg) for arg in args):
+        format, jobs, cache = "jsonl", os.cpu_count(), None
+        for arg in sys.argv:
+            if arg[0:8] == "--cache=":
+                cache = arg[8:]
+            elif arg[0:9] == "--format=":
+                format = arg[9:]
+            elif arg[0:7] == "--jobs=":
+                jobs = int(arg[7:])
+        results = stats.scan(args, jobs, cache)
+        if "--total" in sys.argv:
+            total = dict(wad=None, map=None, hash=None)
+            for result in results:
+                stats.add_stats(total, result)
+            results = [total] if total.get('maps') else []
+        if format == "csv":
+            write_csv(results, sys.stdout)
+        elif format == "jsonl":
+            write_jsonl(results, sys.stdout)
+        else:
+            print("statter: unknown format", format)
+    else:
+        print("invoked:", sys.argv[0])
+        print("usage:")
+        print("  python3 statter.py [filename ...]")
+        print("for more help: python3 -c 'import statter; help(statter)'")
+
+def use_index(filenames):
+    """Build, save or query a texture index in the order of arguments."""
+    index = textures.Index()
+    for arg in sys.argv:
+        if arg[0:8] == "--index=":
+            index = textures.Index.load(arg[8:])
+        elif arg[0:13] == "--save-index=":
+            for filename in filenames:
+                index.add_wad(wads.Wad(filename))
+            index.save(arg[13:])
+            print("statter: indexed", len(index.maps), "maps,",
+                  len(index.textures), "textures and", len(index.flats),
+                  "flats", file=sys.stderr)
+        elif arg == "--unused":
+            for filename in filenames:
+                wad = wads.Wad(filename)
+                names = []
+                for i in wad.locate_glob("TEXTURE[12]"):
+                    names += textures.read_texture_names(wad.get_lump(i))
+                flats = [wad.get_entry(i)['name']
+                         for i in wad.locate_namespace("F")]
+                for name in (index.get_unused(names, "textures") +
+                             index.get_unused(flats, "flats")):
+                    print(name)
+        elif arg[0:7] == "--uses=":
+            for filename, map_name in index.find(arg[7:]):
+                print(filename, map_name)
+
+def write_csv(results, file):
+    """Write the totals of each map as one row of a CSV table."""
+    writer = csv.writer(file)
+    writer.writerow(csv_fields)
+    for result in results:
+        bbox = result['bbox'] or [None] * 4
+        row = dict(result, min_x=bbox[0], min_y=bbox[1],
+                   max_x=bbox[2], max_y=bbox[3])
+        writer.writerow([row[field] for field in csv_fields])
+
+def write_jsonl(results, file):
+    """Write the statistics of each map as one line of JSON."""
+    for result in results:
+        file.write(json.dumps(result, separators=(",", ":")) + "\n")
+
+if __name__ == "__main__":
+    try: main()
+    except KeyboardInterrupt: print("Keyboard Interrupt (Control-C)...")
+    sys.exit()
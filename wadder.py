@@ -24,6 +24,19 @@
       python3 wadder.py --save=100 DOOM2.WAD
         save the 100th lump found in DOOM2.WAD
 
+    --daemon
+    --daemon=socket
+
+        Instead of reading a WAD, start a daemon which keeps every WAD
+        it is asked about mapped into memory with its directory read,
+        and answer queries on a Unix domain socket until interrupted.
+        While a daemon is running, later calls of this script query it
+        instead of reading the WAD themselves. The socket is taken from
+        the WADDER_SOCKET environment variable if set, or else put in
+        XDG_RUNTIME_DIR or a private per-user directory in the
+        temporary directory. A socket that belongs to another user is
+        never used.
+
     --data=filepos
     --data=size
     --data=name
@@ -48,10 +61,31 @@
         N.
 
     --find=string
+    --find=string,string...
 
         Find and print the entry for any lumps which have a name
-        starting with 'string'. Also save each matching lump if the
-        '--save' flag is set.
+        starting with 'string', or with any of several separated by
+        commas. Also save each matching lump if the '--save' flag is
+        set.
+
+    --format=jsonl
+    --format=csv
+    --format=tsv
+
+        Print the entries listed by '--list=N' or found by '--find=' as
+        JSON Lines, CSV or tab-separated values instead, for other
+        programs to read. Each row holds the index as a number and the
+        metadata chosen with '--data=' or '--data-only=', with names
+        trimmed of padding. CSV and TSV begin with a row of column
+        names. Rows are written in large batches, each one flushed as
+        soon as it is complete, so a pipe can read a long listing as it
+        is produced. Messages about saved lumps go to standard error.
+
+    --glob=pattern
+    --glob=pattern,pattern...
+
+        Like '--find=' for names matching any of the shell-style
+        patterns, such as 'SKY?' or '*_START'.
 
     --header-identification
     --header-numlumps
@@ -68,12 +102,37 @@
 
         Print the length of the directory.
 
+    --no-daemon
+
+        Read the WAD directly even if a daemon is running.
+
     --list=N
 
         Print a number of entries 'N' starting with the entry
         indicated by '--start=N'. Each entry is printed on a new line
         with a blank separator between each metadata.
 
+    --profile
+    --profile=filename
+
+        Time reading the directory, reading lumps and writing files, and
+        count read calls and bytes. The breakdown is printed at the end,
+        or saved as JSON to 'filename', or as cProfile statistics if
+        'filename' ends in '.prof'.
+
+    --rebuild=filename
+
+        Write a compacted copy of the WAD to 'filename', which may be
+        the WAD itself. The directory is unchanged, but identical lumps
+        share one copy of their data, space no entry refers to is
+        dropped, and the lumps of each map and each namespace are
+        stored together.
+
+    --regex=expression
+
+        Like '--find=' for names matching a regular expression in full,
+        such as 'E[1-4]M[1-9]'.
+
     --save
 
         Save the lump data from each entry listed as a binary file with
@@ -89,9 +148,14 @@
         Set the first entry to list when using '--list=N'. Defaults to
         the first entry [0].
 """
+import csv
+import io
+import json
 import os
 import sys
 
+from xwadder import instrument, query, wads
+
 def main():
     """Provide a command-line interface to Wadder functions."""
     # user-friendly checks and output
@@ -102,15 +166,40 @@ def main():
     elif "--help" in args:
         help()
         sys.exit()
+    elif [arg for arg in args if arg[0:8] == "--daemon"]:
+        from xwadder import daemon
+        path = [arg[9:] for arg in args if arg[0:9] == "--daemon="]
+        try: daemon.serve(path[-1] if path else None)
+        except KeyboardInterrupt: pass
+        sys.exit()
     elif os.path.isfile(args[-1]):
         filename = args[-1]
     else:
         sys.exit()
-    header = get_header(filename)
-    directory = get_directory(filename,
-                              header['infotableofs'],
-                              header['numlumps'])
+    profile = [arg[10:] for arg in args if arg[0:9] == "--profile"]
+    if profile:
+        instrument.start(profile[-1] or None)
+    directory = None
+    if not profile and "--no-daemon" not in args and len(args) > 2:
+        directory = RemoteDirectory.connect(filename)
+    if directory:
+        header = directory.header
+    else:
+        header = get_header(filename)
+        directory = get_directory(filename,
+                                  header['infotableofs'],
+                                  header['numlumps'])
+    def read_lump(entry):
+        if isinstance(directory, RemoteDirectory):
+            return directory.get_lump(entry)
+        return get_lump(filename, entry)
     datakeys = ["filepos", "size", "name"]
+    form = [arg[9:] for arg in args if arg[0:9] == "--format="]
+    if form and form[-1] not in EntryWriter.formats:
+        print("wadder: unknown format", form[-1])
+        sys.exit()
+    writer = None
+    log = sys.stderr if form else sys.stdout
     # print any header information requested
     for key in header.keys():
         if "--header-" + key in args:
@@ -133,39 +222,56 @@ def main():
             for value in entry.values():
                 print(value, end=" ")
             print()
-        elif arg[0:7] == "--find=":
-            match = arg[7:]
-            for i, entry in enumerate(directory):
-                if entry['name'][:len(match)] == match:
+        elif arg[0:7] in ("--find=", "--glob=") or arg[0:8] == "--regex=":
+            kind, text = arg[2:].split("=", 1)
+            kind = "prefix" if kind == "find" else kind
+            patterns = [text] if kind == "regex" else text.split(",")
+            found = find_entries(directory, patterns, kind)
+            if form:
+                writer = writer or EntryWriter(form[-1], datakeys)
+                writer.write(found)
+            for i, entry in found:
+                if not form:
                     if ("--index" or "-i") in args:
                         print(i, end=": ")
                     for data in get_data(entry, datakeys):
                         print(data, end=" ")
                     print()
-                    if "--save" in args:
-                        lump = get_lump(filename, entry)
-                        save_lump(lump, entry['name'])
+                if "--save" in args:
+                    lump = read_lump(entry)
+                    save_lump(lump, entry['name'], file=log)
         elif arg[0:8] == "--start=":
             start = int(arg[8:])
         elif arg == "--length":
             print(len(directory))
         elif arg[0:7] == "--list=":
             nstop = start + int(arg[7:])
-            for i in range(start, nstop):
-                entry = directory[i]
-                if ("--index" or "-i") in args:
-                    print(i, end=": ")
-                for data in get_data(entry, datakeys):
-                    print(data, end=" ")
-                print()
+            listed = tuple(enumerate(directory[start:nstop], start))
+            if form:
+                writer = writer or EntryWriter(form[-1], datakeys)
+                writer.write(listed)
+            for i, entry in listed:
+                if not form:
+                    if ("--index" or "-i") in args:
+                        print(i, end=": ")
+                    for data in get_data(entry, datakeys):
+                        print(data, end=" ")
+                    print()
                 if "--save" in args:
-                    lump = get_lump(filename, entry)
-                    save_lump(lump, entry['name'])
+                    lump = read_lump(entry)
+                    save_lump(lump, entry['name'], file=log)
+        elif arg[0:10] == "--rebuild=":
+            wad = wads.Wad(filename)
+            before = os.path.getsize(filename)
+            after, shared = wad.rebuild(arg[10:])
+            wad.close()
+            print("wadder: rebuilt", before, "bytes as", after, "bytes in",
+                  arg[10:] + ",", shared, "duplicate lumps shared")
         elif arg[0:7] == "--save=":
             start = int(arg[7:])
             entry = directory[start]
-            lump = get_lump(filename, entry)
-            save_lump(lump, entry['name'])
+            lump = read_lump(entry)
+            save_lump(lump, entry['name'], file=log)
     # cordially parse results if no commands are given
     if len(sys.argv) < 3:
         if header['header'][0:4] == b"IWAD":
@@ -177,6 +283,8 @@ def main():
         else:
             print("wadder: file does not have a WAD signature")
         print_header(header)
+    if profile:
+        instrument.finish(profile[-1] or None)
 
 def get_data(entry, keys):
     """Return a list of data from one entry."""
@@ -186,6 +294,19 @@ def get_data(entry, keys):
             datalist.append(entry[key])
     return tuple(datalist)
 
+def find_entries(directory, patterns, kind="prefix"):
+    """Return (index, entry) for entries with names matching a query.
+
+    'patterns' is a list of patterns of one 'kind' (see
+    'xwadder.query').
+    """
+    if isinstance(directory, RemoteDirectory):
+        return directory.find(patterns, kind)
+    table = query.NameTable(entry['name'].split("\0", 1)[0]
+                            for entry in directory)
+    return [(i, directory[i]) for i in table.find(patterns, kind)]
+
+@instrument.timed("directory")
 def get_directory(filename, offset, numlumps):
     """Return the directory as a list of dictionaries."""
     directory = []
@@ -202,6 +323,7 @@ def get_directory(filename, offset, numlumps):
                         size=size,
                         name=name)
                 directory.append(entry)
+    instrument.count("directory_entries", len(directory))
     return tuple(directory)
 
 def get_header(filename):
@@ -214,12 +336,15 @@ def get_header(filename):
     return dict(header=header,identification=ident,
                 numlumps=nlumps,infotableofs=offs)
 
+@instrument.timed("read")
 def get_lump(filename, entry):
     """Return lump data as binary data."""
     name = entry['name'].rstrip("\0") + ".lmp"
     with open(filename, 'rb') as file:
         file.seek(entry['filepos'])
         lump = file.read(entry['size'])
+    instrument.count("read_calls")
+    instrument.count("bytes_read", len(lump))
     return lump
 
 def print_header(header):
@@ -229,11 +354,132 @@ def print_header(header):
     print("total number of lumps:", header['numlumps'])
     print("location of directory:", header['infotableofs'])
 
-def save_lump(data, name, ext=".lmp"):
+@instrument.timed("write")
+def save_lump(data, name, ext=".lmp", file=sys.stdout):
     filename = name.rstrip("\0") + ext
-    print("wadder: saving lump data to binary file", filename)
+    if "/" in filename or "\\" in filename or ".." in filename:
+        print("wadder: not saving lump with unsafe name", repr(name),
+              file=file)
+        return
+    print("wadder: saving lump data to binary file", filename, file=file)
     with open(filename, 'w+b') as file:
         file.write(data)
+    instrument.count("bytes_written", len(data))
+
+class EntryWriter():
+    """Write directory entries as JSON Lines, CSV or TSV.
+
+    Rows are built a batch at a time and each batch is written to
+    'file' in one call and flushed, so that a reader at the other end
+    of a pipe receives whole rows as soon as they are ready.
+    """
+    batch_size = 8192
+    formats = ("jsonl", "csv", "tsv")
+
+    def __init__(self, form, keys, file=sys.stdout):
+        self.form = form
+        self.keys = ["index"] + [key for key in keys if key != "index"]
+        self.file = file
+        if form != "jsonl":
+            self.buffer = io.StringIO()
+            dialect = 'excel-tab' if form == "tsv" else 'excel'
+            self.csv = csv.writer(self.buffer, dialect, lineterminator="\n")
+            self.csv.writerow(self.keys)
+            self.flush()
+
+    def get_row(self, i, entry):
+        """Return the values of one entry with a numeric index."""
+        row = [i]
+        for key in self.keys[1:]:
+            value = entry.get(key)
+            row.append(value.rstrip("\0") if key == "name" else value)
+        return row
+
+    def write(self, entries):
+        """Write (index, entry) pairs, a batch at a time."""
+        entries = list(entries)
+        for x in range(0, len(entries), self.batch_size):
+            rows = [self.get_row(i, entry) for i, entry in
+                    entries[x: x + self.batch_size]]
+            if self.form == "jsonl":
+                keys = self.keys
+                text = "".join([json.dumps(dict(zip(keys, row))) + "\n"
+                                for row in rows])
+                self.file.write(text)
+                self.file.flush()
+            else:
+                self.csv.writerows(rows)
+                self.flush()
+
+    def flush(self):
+        """Write and flush the rows held in the CSV buffer."""
+        self.file.write(self.buffer.getvalue())
+        self.file.flush()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+
+
+class RemoteDirectory():
+    """The directory of a WAD held open by a daemon.
+
+    Entries are fetched from the daemon as they are needed, in the same
+    form as 'get_directory' returns them. See 'xwadder.daemon'.
+    """
+
+    def __init__(self, client, filename):
+        self.client = client
+        self.filename = os.path.abspath(filename)
+        reply = client.query(op="header", file=self.filename)
+        self.header = dict(header=bytes.fromhex(reply['header']),
+                           identification=reply['identification'],
+                           numlumps=reply['numlumps'],
+                           infotableofs=reply['infotableofs'])
+
+    @classmethod
+    def connect(cls, filename):
+        """Return the directory from a daemon, or None if none answers."""
+        from xwadder import daemon
+        try:
+            return cls(daemon.Client(), filename)
+        except OSError:
+            return None
+
+    def __len__(self):
+        return self.header['numlumps']
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            reply = self.client.query(op="list", file=self.filename,
+                                      start=start,
+                                      count=max(stop - start, 0))
+            return tuple(map(self.convert, reply['entries']))[::step]
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError("directory index out of range")
+        reply = self.client.query(op="entry", file=self.filename,
+                                  index=key)
+        return self.convert(reply['entry'])
+
+    def convert(self, entry):
+        """Return a daemon's entry in the form of 'get_directory'."""
+        return dict(index=str(entry['index']) + ":",
+                    filepos=entry['filepos'], size=entry['size'],
+                    name=entry['name'].ljust(8, "\0"))
+
+    def find(self, patterns, kind="prefix"):
+        """Return (index, entry) for entries matching a query."""
+        reply = self.client.query(op="query", file=self.filename,
+                                  patterns=patterns, kind=kind)
+        return [(entry['index'], self.convert(entry))
+                for entry in reply['entries']]
+
+    def get_lump(self, entry):
+        """Return lump data read by the daemon."""
+        index = int(entry['index'].rstrip(":"))
+        return self.client.query(op="extract", file=self.filename,
+                                 index=index)['data']
 
 def usage():
     print("invoked:", sys.argv[0])
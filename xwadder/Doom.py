@@ -25,11 +25,25 @@ behind.
 
 Map format: takes data from several lumps to form a complete set of
 level data. Can interpret and return the data in useful ways e.g. line
-and sector data for drawing a representation of the map geometry. NOT
-implemented.
+and sector data for drawing a representation of the map geometry.
+Lumps are decoded into columns of values, and 'build_sectors' rebuilds
+sector outlines from them. 'load_nodes' reads the BSP tree in vanilla
+or ZDoom extended (XNOD, XGLN, XGL2, XGL3) format, inflating the
+compressed variants (ZNOD, ZGLN, ...) as it goes.
+
+Colormap format: 34 maps of 256 palette indices each, used to shade
+pixel data to a light level with a single 'bytes.translate' call.
 
 [patch](https://doomwiki.org/wiki/Picture_format)
 """
+import array
+import hashlib
+import itertools
+import math
+import sys
+import zlib
+
+from xwadder import instrument, udmf
 
 def read_int(data):
     """Translate an signed byte sequence to number."""
@@ -54,16 +68,355 @@ def read_uint_array(data, size):
         array.append(value)
     return array
 
+# record layouts of binary map lumps as (field, type) pairs where the
+# type is an 'array' typecode, or '8s' for a null-padded 8-byte name
+layouts = dict(
+    THINGS=(('x', 'h'), ('y', 'h'), ('angle', 'h'), ('type', 'h'),
+            ('flags', 'h')),
+    LINEDEFS=(('start', 'H'), ('end', 'H'), ('flags', 'H'), ('type', 'H'),
+              ('tag', 'H'), ('front', 'H'), ('back', 'H')),
+    SIDEDEFS=(('xoffs', 'h'), ('yoffs', 'h'), ('upper', '8s'),
+              ('lower', '8s'), ('middle', '8s'), ('sector', 'h')),
+    VERTEXES=(('x', 'h'), ('y', 'h')),
+    SECTORS=(('floor', 'h'), ('ceiling', 'h'), ('floorpic', '8s'),
+             ('ceilingpic', '8s'), ('light', 'h'), ('special', 'h'),
+             ('tag', 'h')),
+    SEGS=(('start', 'H'), ('end', 'H'), ('angle', 'h'), ('linedef', 'H'),
+          ('direction', 'h'), ('offset', 'h')),
+    SSECTORS=(('count', 'H'), ('first', 'H')),
+    NODES=(('x', 'h'), ('y', 'h'), ('dx', 'h'), ('dy', 'h'),
+           ('right_top', 'h'), ('right_bottom', 'h'), ('right_left', 'h'),
+           ('right_right', 'h'), ('left_top', 'h'), ('left_bottom', 'h'),
+           ('left_left', 'h'), ('left_right', 'h'), ('right', 'H'),
+           ('left', 'H')),
+    )
+# Hexen format maps, identified by a BEHAVIOR lump
+hexen_layouts = dict(
+    THINGS=(('tid', 'h'), ('x', 'h'), ('y', 'h'), ('z', 'h'),
+            ('angle', 'h'), ('type', 'h'), ('flags', 'h'), ('special', 'B'),
+            ('arg0', 'B'), ('arg1', 'B'), ('arg2', 'B'), ('arg3', 'B'),
+            ('arg4', 'B')),
+    LINEDEFS=(('start', 'H'), ('end', 'H'), ('flags', 'H'),
+              ('type', 'B'), ('arg0', 'B'), ('arg1', 'B'), ('arg2', 'B'),
+              ('arg3', 'B'), ('arg4', 'B'), ('front', 'H'), ('back', 'H')),
+    )
+# ZDoom extended nodes, identified by the first four bytes of a NODES,
+# SSECTORS or ZNODES lump; 'I' is a 32-bit index and 'i' 16.16 fixed
+# point. A 'Z' signature in place of 'X' means the rest is compressed.
+_bbox = tuple((side + "_" + edge, 'h') for side in ("right", "left")
+              for edge in ("top", "bottom", "left", "right"))
+extended_layouts = dict(
+    XNOD=((('start', 'I'), ('end', 'I'), ('linedef', 'H'),
+           ('direction', 'B')),
+          (('x', 'h'), ('y', 'h'), ('dx', 'h'), ('dy', 'h')) + _bbox +
+          (('right', 'I'), ('left', 'I'))),
+    XGLN=((('start', 'I'), ('partner', 'I'), ('linedef', 'H'),
+           ('direction', 'B')),
+          (('x', 'h'), ('y', 'h'), ('dx', 'h'), ('dy', 'h')) + _bbox +
+          (('right', 'I'), ('left', 'I'))),
+    XGL2=((('start', 'I'), ('partner', 'I'), ('linedef', 'I'),
+           ('direction', 'B')),
+          (('x', 'h'), ('y', 'h'), ('dx', 'h'), ('dy', 'h')) + _bbox +
+          (('right', 'I'), ('left', 'I'))),
+    XGL3=((('start', 'I'), ('partner', 'I'), ('linedef', 'I'),
+           ('direction', 'B')),
+          (('x', 'i'), ('y', 'i'), ('dx', 'i'), ('dy', 'i')) + _bbox +
+          (('right', 'I'), ('left', 'I'))),
+    )
+
+def read_names(data, offset, size):
+    """Return the 8-byte name at 'offset' of every 'size'-byte record.
+
+    Names are decoded once each and interned, so a texture used by a
+    thousand sidedefs is a single string.
+    """
+    cache = {}
+    names = []
+    for x in range(offset, len(data) - 7, size):
+        raw = data[x: x + 8]
+        name = cache.get(raw)
+        if name is None:
+            text = raw.split(b"\0", 1)[0].decode('ascii', 'replace')
+            name = cache[raw] = sys.intern(text.upper())
+        names.append(name)
+    return names
+
+@instrument.timed("decode")
+def read_columns(data, layout):
+    """Decode fixed-size records into one column per field.
+
+    Every aligned multi-byte field is sliced out of a single 'array' of
+    the whole lump and byte fields out of the lump itself, so records
+    are never decoded one at a time. An unaligned field, as in the
+    11-byte segs of extended nodes, is first gathered a byte at a time
+    with one slice per byte. Return a dictionary of field name to
+    'array' (or list of names for '8s' fields).
+    """
+    sizes = [8 if code == '8s' else array.array(code).itemsize
+             for name, code in layout]
+    size = sum(sizes)
+    data = bytes(data[:len(data) - len(data) % size])
+    columns, words, offset = {}, {}, 0
+    for (name, code), length in zip(layout, sizes):
+        if code == '8s':
+            columns[name] = read_names(data, offset, size)
+        elif length == 1:
+            columns[name] = array.array(code, data[offset::size])
+        elif offset % length == 0 and size % length == 0:
+            if code not in words:
+                words[code] = array.array(code, data)
+                if sys.byteorder == 'big':
+                    words[code].byteswap()
+            columns[name] = words[code][offset // length:: size // length]
+        else:
+            field = bytearray(len(data) // size * length)
+            for i in range(length):
+                field[i::length] = data[offset + i::size]
+            columns[name] = array.array(code, field)
+            if sys.byteorder == 'big':
+                columns[name].byteswap()
+        offset += length
+    return columns
+
+def load_linedefs(data, hexen=False):
+    """Return LINEDEFS lump data as columns."""
+    return read_columns(data, (hexen_layouts if hexen else
+                               layouts)['LINEDEFS'])
+
+def load_sectors(data):
+    """Return SECTORS lump data as columns."""
+    return read_columns(data, layouts['SECTORS'])
+
+def load_sidedefs(data):
+    """Return SIDEDEFS lump data as columns."""
+    return read_columns(data, layouts['SIDEDEFS'])
+
+def load_things(data, hexen=False):
+    """Return THINGS lump data as columns."""
+    return read_columns(data, (hexen_layouts if hexen else
+                               layouts)['THINGS'])
+
+def load_vertexes(data):
+    """Return VERTEXES lump data as columns."""
+    return read_columns(data, layouts['VERTEXES'])
+
+@instrument.timed("decode")
+def load_nodes(data, vertex_count=0):
+    """Return the BSP tree of a map as columns.
+
+    'data' is a NODES lump, or a SSECTORS or ZNODES lump holding GL
+    nodes, in any of the vanilla or ZDoom extended formats. The result
+    is a dictionary of 'format' (the signature, or "DOOM"), 'vertexes'
+    (vertices added by the node builder, with 'x' and 'y' in map
+    units), 'original_vertexes' (the number of VERTEXES they follow),
+    and 'subsectors', 'segs' and 'nodes' columns. A seg vertex at or
+    above 'original_vertexes' is an added vertex. Vanilla NODES lumps
+    hold only the nodes, whose children are subsectors when the high
+    bit (0x8000, or 0x80000000 when extended) is set.
+    """
+    signature = bytes(data[:4])
+    instrument.count("lumps_decoded")
+    if signature[1:] not in (b"NOD", b"GLN", b"GL2", b"GL3"):
+        return dict(format="DOOM", vertexes=dict(x=array.array('d'),
+                                                 y=array.array('d')),
+                    original_vertexes=vertex_count,
+                    subsectors=read_columns(b"", layouts['SSECTORS']),
+                    segs=read_columns(b"", layouts['SEGS']),
+                    nodes=read_columns(data, layouts['NODES']))
+    seg_layout, node_layout = extended_layouts["X" + signature[1:].decode()]
+    stream = _NodeStream(data, signature[0:1] == b"Z")
+    original, count = stream.read_array('I', 2)
+    fixed = stream.read_array('i', count * 2)
+    vertexes = dict(x=array.array('d', (v / 65536 for v in fixed[0::2])),
+                    y=array.array('d', (v / 65536 for v in fixed[1::2])))
+    counts = stream.read_array('I', stream.read_array('I', 1)[0])
+    firsts = array.array('I', itertools.accumulate(counts, initial=0))
+    firsts.pop()
+    segs = stream.read_records(seg_layout)
+    if 'partner' in segs:  # GL segs end where the next seg starts
+        starts = segs['start']
+        ends = starts[1:] + starts[:1]
+        for first, n in zip(firsts, counts):
+            if n:
+                ends[first + n - 1] = starts[first]
+        segs['end'] = ends
+    nodes = stream.read_records(node_layout)
+    if node_layout[0][1] == 'i':
+        for key in ('x', 'y', 'dx', 'dy'):
+            nodes[key] = array.array('d', (v / 65536 for v in nodes[key]))
+    return dict(format=signature.decode('ascii'), vertexes=vertexes,
+                original_vertexes=original,
+                subsectors=dict(count=counts, first=firsts),
+                segs=segs, nodes=nodes)
+
+@instrument.timed("sectors")
+def build_sectors(linedefs, sidedefs, vertexes, count=None):
+    """Rebuild the outline of every sector from its linedefs.
+
+    Each linedef is an edge of the sector of its front sidedef, and
+    when reversed, of the sector of its back sidedef, so that the
+    sector always lies to the right of the edge. Every sector's edges
+    are chained into closed loops through a map of vertex to outgoing
+    edges; where several edges leave one vertex the sharpest right
+    turn is taken. A sector may have any number of loops, and a loop
+    inside another loop of the same sector is a hole, so loops are
+    meant to be filled with the even-odd rule.
+
+    Arguments are columns (see 'read_columns'). Return a list with one
+    dictionary per sector: 'loops' is a list of vertex index lists,
+    'area' is the area in square map units, and 'bbox' is the left,
+    bottom, right and top extents, or None if no loop closed.
+    """
+    xs, ys = vertexes['x'], vertexes['y']
+    sides = sidedefs['sector']
+    if count is None:
+        count = max(sides) + 1 if sides else 0
+    edges = [[] for x in range(count)]
+    nverts, nsides = len(xs), len(sides)
+    for start, end, front, back in zip(linedefs['start'], linedefs['end'],
+                                       linedefs['front'], linedefs['back']):
+        if start >= nverts or end >= nverts or start == end:
+            continue
+        a = sides[front] if front < nsides else -1
+        b = sides[back] if back < nsides else -1
+        if a == b:  # both sides in one sector bound nothing
+            continue
+        if 0 <= a < count:
+            edges[a].append((start, end))
+        if 0 <= b < count:
+            edges[b].append((end, start))
+    shapes = []
+    for sector_edges in edges:
+        loops = _chain_loops(sector_edges, xs, ys)
+        area, bbox = 0, None
+        for loop in loops:
+            area -= _get_signed_area(loop, xs, ys)
+            lx = [xs[v] for v in loop]
+            ly = [ys[v] for v in loop]
+            box = (min(lx), min(ly), max(lx), max(ly))
+            if bbox is None:
+                bbox = box
+            else:
+                bbox = (min(bbox[0], box[0]), min(bbox[1], box[1]),
+                        max(bbox[2], box[2]), max(bbox[3], box[3]))
+        shapes.append(dict(loops=loops, area=abs(area), bbox=bbox))
+    return shapes
+
+def _chain_loops(edges, xs, ys):
+    """Return the closed loops formed by a list of directed edges."""
+    outgoing = {}
+    for edge in edges:
+        outgoing.setdefault(edge[0], []).append(edge[1])
+    loops = []
+    for first in list(outgoing):
+        while outgoing.get(first):
+            loop, previous, vertex = [first], first, outgoing[first].pop()
+            while vertex != first:
+                choices = outgoing.get(vertex)
+                if not choices:
+                    loop = None  # an unclosed sector
+                    break
+                loop.append(vertex)
+                if len(choices) == 1:
+                    following = choices.pop()
+                else:
+                    following = _get_right_turn(previous, vertex, choices,
+                                                xs, ys)
+                    choices.remove(following)
+                previous, vertex = vertex, following
+            if loop and len(loop) > 2:
+                loops.append(loop)
+    return loops
+
+def _get_right_turn(previous, vertex, choices, xs, ys):
+    """Return the choice of next vertex that turns furthest right."""
+    ax, ay = xs[vertex] - xs[previous], ys[vertex] - ys[previous]
+    best, turn = None, None
+    for choice in choices:
+        bx, by = xs[choice] - xs[vertex], ys[choice] - ys[vertex]
+        angle = math.atan2(ax * by - ay * bx, ax * bx + ay * by)
+        if turn is None or angle < turn:
+            best, turn = choice, angle
+    return best
+
+def _get_signed_area(loop, xs, ys):
+    """Return the area of a loop, positive if it runs anticlockwise."""
+    area = 0
+    previous = loop[-1]
+    for vertex in loop:
+        area += xs[previous] * ys[vertex] - xs[vertex] * ys[previous]
+        previous = vertex
+    return area / 2
+
+class _NodeStream():
+    """Sections of an extended nodes lump, inflated as they are read.
+
+    A compressed lump is fed to 'zlib.decompressobj' a chunk at a time
+    and only as many bytes as the next section needs are inflated, so
+    neither the whole lump nor the whole payload is ever copied.
+    """
+
+    chunk_size = 1 << 16
+
+    def __init__(self, data, compressed):
+        self.view = memoryview(data)[4:]
+        self.pos = 0
+        self.inflate = zlib.decompressobj() if compressed else None
+
+    def read(self, size):
+        """Return the next 'size' bytes, or raise ValueError."""
+        if self.inflate is None:
+            data = bytes(self.view[self.pos: self.pos + size])
+            self.pos += len(data)
+        else:
+            parts, needed = [], size
+            while needed and not self.inflate.eof:
+                chunk = self.inflate.unconsumed_tail
+                if not chunk:
+                    chunk = self.view[self.pos: self.pos + self.chunk_size]
+                    self.pos += len(chunk)
+                    if not chunk:
+                        break
+                part = self.inflate.decompress(chunk, needed)
+                parts.append(part)
+                needed -= len(part)
+            data = b"".join(parts)
+        if len(data) < size:
+            raise ValueError("nodes: lump ends early")
+        return data
+
+    def read_array(self, code, count):
+        """Return the next 'count' little-endian values as an array."""
+        values = array.array(code)
+        values.frombytes(self.read(count * values.itemsize))
+        if sys.byteorder == 'big':
+            values.byteswap()
+        return values
+
+    def read_records(self, layout):
+        """Return the next count-prefixed records as columns."""
+        count = self.read_array('I', 1)[0]
+        size = sum(8 if code == '8s' else array.array(code).itemsize
+                   for name, code in layout)
+        return read_columns(self.read(count * size), layout)
+
+
 class Playpal():
     """A collection of 256-color palettes."""
 
     def __init__(self, data):
         # TODO: ability to self-generate a palette on command instead
+        self.data = bytes(data)
         map0 = []
         for x in range(0, 768, 3):
             map0.append(data[x: x + 3].hex())
         self.maps = [map0,]
 
+    def get_quantizer(self, index=0, bits=5):
+        """Return a shared Quantizer for the palette at 'index'."""
+        return get_quantizer(self.data[index * 768: index * 768 + 768],
+                             bits)
+
     def get_translate(self, word):
         """Change greens to a classic GIBR multiplayer variant."""
         trans = 0
@@ -79,6 +432,226 @@ class Playpal():
         return transmap
 
 
+class Colormap():
+    """A collection of 34 light-level translation maps.
+
+    Each map is 256 bytes that translate a palette index into the index
+    of a darker color. Maps 0 to 31 run from full brightness to nearly
+    black, map 32 is the invulnerability effect and map 33 is all
+    black. Maps are kept as 'bytes.translate' tables so that any
+    sequence of palette indices, such as a flat or a rendered picture,
+    can be shaded in a single call.
+    """
+
+    def __init__(self, data):
+        self.maps = []
+        for x in range(0, len(data) - 255, 256):
+            self.maps.append(bytes(data[x: x + 256]))
+
+    def get_level(self, light):
+        """Return the map index for a sector light level of 0-255."""
+        light = max(0, min(light, 255))
+        return 31 - light // 8
+
+    def get_playpal(self, playpal, level=0):
+        """Return a 768-byte palette with map 'level' applied to it."""
+        palette = bytearray()
+        for x in self.maps[level]:
+            palette.extend(playpal[x * 3: x * 3 + 3])
+        return bytes(palette)
+
+    def translate(self, pixels, level=0):
+        """Return palette indices 'pixels' shaded by map 'level'."""
+        if not isinstance(pixels, (bytes, bytearray)):
+            pixels = bytes(pixels)
+        return pixels.translate(self.maps[level])
+
+    def translate_all(self, pixmaps, levels=None):
+        """Yield every pixmap shaded at every requested light level.
+
+        'pixmaps' is a dictionary or sequence of (name, pixels) pairs,
+        e.g. every flat in a namespace. Each item yielded is a tuple of
+        (name, level, pixels) so that a caller can stream the results
+        to disk without holding every shaded copy in memory.
+        """
+        if levels is None:
+            levels = range(len(self.maps))
+        if isinstance(pixmaps, dict):
+            pixmaps = pixmaps.items()
+        tables = [(level, self.maps[level]) for level in levels]
+        for name, pixels in pixmaps:
+            if not isinstance(pixels, (bytes, bytearray)):
+                pixels = bytes(pixels)
+            for level, table in tables:
+                yield name, level, pixels.translate(table)
+
+
+class Quantizer():
+    """Find the nearest palette colors for truecolor pixels.
+
+    A brute-force search compares every pixel against all 256 palette
+    entries. Instead the RGB cube is split into 512 blocks and each
+    block keeps the short list of palette entries that can possibly be
+    nearest to any color inside it. That list is used to fill a lookup
+    cube of 'bits' bits per channel, so the fast path costs one table
+    lookup per pixel. With 'exact' the candidate list is searched for
+    each distinct color instead, which gives true nearest colors at the
+    cost of some speed.
+
+    Quantizers are expensive to build, so use 'get_quantizer' to share
+    one per palette.
+    """
+
+    def __init__(self, palette, bits=5):
+        if not 1 <= bits <= 8:
+            raise ValueError("Quantizer: bits must be from 1 to 8, not %r"
+                             % bits)
+        self.palette = bytes(palette[:768])
+        self.bits = bits
+        self.colors = [tuple(self.palette[x: x + 3])
+                       for x in range(0, 768, 3)]
+        self.candidates = self._get_candidates()
+        self.cube = self._get_cube()
+
+    def _get_candidates(self):
+        """Return the candidate palette entries of each 32^3 block."""
+        reds = [c[0] for c in self.colors]
+        greens = [c[1] for c in self.colors]
+        blues = [c[2] for c in self.colors]
+        # nearest and farthest squared distance along one axis from
+        # each block edge range to every palette value
+        near, far = [], []
+        for lo in range(0, 256, 32):
+            hi = lo + 31
+            near.append([[(lo - v) ** 2 if v < lo else
+                          (v - hi) ** 2 if v > hi else 0 for v in values]
+                         for values in (reds, greens, blues)])
+            far.append([[max(v - lo, hi - v) ** 2 for v in values]
+                        for values in (reds, greens, blues)])
+        entries = range(len(self.colors))
+        candidates = []
+        for r in range(8):
+            for g in range(8):
+                for b in range(8):
+                    nr, ng, nb = near[r][0], near[g][1], near[b][2]
+                    fr, fg, fb = far[r][0], far[g][1], far[b][2]
+                    limit = min([fr[i] + fg[i] + fb[i] for i in entries])
+                    candidates.append(tuple(
+                        i for i in entries
+                        if nr[i] + ng[i] + nb[i] <= limit))
+        return candidates
+
+    def _get_cube(self):
+        """Return the nearest palette entry for each cell of the cube."""
+        bits = self.bits
+        size = 1 << bits
+        step = 256 >> bits
+        half = step // 2
+        cube = bytearray(size ** 3)
+        colors = self.colors
+        for r in range(size):
+            red = r * step + half
+            for g in range(size):
+                green = g * step + half
+                for b in range(size):
+                    blue = b * step + half
+                    block = (red >> 5) << 6 | (green >> 5) << 3 | blue >> 5
+                    best, nearest = 1 << 20, 0
+                    for i in self.candidates[block]:
+                        cr, cg, cb = colors[i]
+                        d = ((cr - red) ** 2 + (cg - green) ** 2
+                             + (cb - blue) ** 2)
+                        if d < best:
+                            best, nearest = d, i
+                    cube[(r << bits | g) << bits | b] = nearest
+        return bytes(cube)
+
+    def get_nearest(self, red, green, blue):
+        """Return the index of the palette color nearest to an RGB."""
+        block = (red >> 5) << 6 | (green >> 5) << 3 | blue >> 5
+        best, nearest = 1 << 20, 0
+        for i in self.candidates[block]:
+            cr, cg, cb = self.colors[i]
+            d = (cr - red) ** 2 + (cg - green) ** 2 + (cb - blue) ** 2
+            if d < best:
+                best, nearest = d, i
+        return nearest
+
+    def quantize(self, rgb, width=None, dither=False, exact=False):
+        """Return palette indices for a sequence of RGB byte triples.
+
+        'dither' spreads the quantization error to neighbouring pixels
+        (Floyd-Steinberg) and needs the image 'width'. 'exact' looks
+        up true nearest colors instead of the lookup cube.
+        """
+        if dither:
+            return self._dither(rgb, width or len(rgb) // 3, exact)
+        rgb = bytes(rgb)
+        reds, greens, blues = rgb[0::3], rgb[1::3], rgb[2::3]
+        if exact:
+            cache = {}
+            nearest = self.get_nearest
+            indices = bytearray()
+            for key in zip(reds, greens, blues):
+                value = cache.get(key)
+                if value is None:
+                    value = cache[key] = nearest(*key)
+                indices.append(value)
+            return indices
+        bits, shift = self.bits, 8 - self.bits
+        rtable = [(v >> shift) << (2 * bits) for v in range(256)]
+        gtable = [(v >> shift) << bits for v in range(256)]
+        btable = [v >> shift for v in range(256)]
+        cube = self.cube
+        return bytearray([cube[rtable[r] | gtable[g] | btable[b]]
+                          for r, g, b in zip(reds, greens, blues)])
+
+    def _dither(self, rgb, width, exact):
+        """Quantize with Floyd-Steinberg error diffusion."""
+        bits, shift = self.bits, 8 - self.bits
+        cube, colors = self.cube, self.colors
+        indices = bytearray()
+        below = [0] * (width * 3 + 6)
+        for y in range(0, len(rgb), width * 3):
+            row = rgb[y: y + width * 3]
+            error, below = below, [0] * (width * 3 + 6)
+            for x in range(0, len(row), 3):
+                e = x + 3
+                red = min(max(row[x] + (error[e] >> 4), 0), 255)
+                green = min(max(row[x + 1] + (error[e + 1] >> 4), 0), 255)
+                blue = min(max(row[x + 2] + (error[e + 2] >> 4), 0), 255)
+                if exact:
+                    value = self.get_nearest(red, green, blue)
+                else:
+                    value = cube[((red >> shift) << bits
+                                  | green >> shift) << bits | blue >> shift]
+                indices.append(value)
+                cr, cg, cb = colors[value]
+                for c, diff in enumerate((red - cr, green - cg, blue - cb)):
+                    error[e + c + 3] += diff * 7
+                    below[e + c - 3] += diff * 3
+                    below[e + c] += diff * 5
+                    below[e + c + 3] += diff
+        return indices
+
+
+_quantizers = {}
+
+def get_quantizer(palette, bits=5):
+    """Return a shared Quantizer for a palette, building it once.
+
+    Quantizers are cached by a hash of the palette bytes so that any
+    number of images can be imported against the same PLAYPAL without
+    rebuilding the lookup cube.
+    """
+    key = (hashlib.sha1(bytes(palette[:768])).hexdigest(), bits)
+    instrument.count("quantizer_cache_hits" if key in _quantizers else
+                     "quantizers_built")
+    if key not in _quantizers:
+        _quantizers[key] = Quantizer(palette, bits)
+    return _quantizers[key]
+
+
 class Level():
     """Standard Doom level data.
 
@@ -98,6 +671,8 @@ class Level():
     """
 
     def __init__(self, **lumps):
+        self.lumps = lumps
+        self.columns = {}
         if 'Header' in lumps:
             self.header = lumps['Header']
         if 'THINGS' in lumps:
@@ -125,6 +700,44 @@ class Level():
                 vertex = Vertex(vertex_data[x: x + 4])
                 self.vertexes.append(vertex)
 
+    def get_columns(self, name):
+        """Return the records of lump 'name' as columns of values.
+
+        Unlike the per-record objects built by the constructor, columns
+        are decoded in bulk (see 'read_columns') and cached, which
+        suits processing whole maps at once. A UDMF map's TEXTMAP is
+        parsed into the same columns (see 'udmf.load_columns').
+        """
+        if 'TEXTMAP' in self.lumps and not self.columns:
+            self.columns = udmf.load_textmap(self.lumps['TEXTMAP'])
+            instrument.count("lumps_decoded")
+        elif name in self.columns:
+            instrument.count("column_cache_hits")
+        if name not in self.columns:
+            instrument.count("lumps_decoded")
+            tables = layouts
+            if 'BEHAVIOR' in self.lumps and name in hexen_layouts:
+                tables = hexen_layouts
+            self.columns[name] = read_columns(self.lumps[name], tables[name])
+        return self.columns[name]
+
+    def get_nodes(self):
+        """Return the BSP tree of the map in any node format.
+
+        GL nodes in ZNODES or SSECTORS are preferred to NODES, as they
+        are what ports build them for. See 'load_nodes'.
+        """
+        count = len(self.lumps.get('VERTEXES', b"")) // 4
+        for name in ('ZNODES', 'SSECTORS', 'NODES'):
+            data = self.lumps.get(name, b"")
+            if bytes(data[1:4]) in (b"NOD", b"GLN", b"GL2", b"GL3"):
+                return load_nodes(data, count)
+        nodes = load_nodes(self.lumps.get('NODES', b""), count)
+        for name, key in (('SEGS', 'segs'), ('SSECTORS', 'subsectors')):
+            if self.lumps.get(name):
+                nodes[key] = self.get_columns(name)
+        return nodes
+
 
 class Vertex():
     def __init__(self, data):
@@ -154,12 +767,12 @@ class Linedef():
 
 class Sidedef():
     def __init__(self, data):
-        self.xoffs = read_int(bytemap[0: 2])
-        self.yoffs = read_int(bytemap[2: 4])
-        self.upper = read_str(bytemap[4: 12])
-        self.lower = read_str(bytemap[12: 20])
-        self.middle = read_str(bytemap[20: 28])
-        self.sector = read_int(bytemap[28: 30])
+        self.xoffs = read_int(data[0: 2])
+        self.yoffs = read_int(data[2: 4])
+        self.upper = read_str(data[4: 12])
+        self.lower = read_str(data[12: 20])
+        self.middle = read_str(data[20: 28])
+        self.sector = read_int(data[28: 30])
 
 
 if __name__ == "__main__":
@@ -34,6 +34,33 @@ levels - collect and save multiple lumps as level data
 
 Doom - interpret lumps specific to the Doom engine
 
+flats - interpret lumps of Doom flat format and pack them in atlases
+
+patch - interpret lumps of Doom picture format
+
+png - write PNG image files without third-party libraries
+
+cache - keep rendered images in a directory named by content hashes
+
+check - find damage in WAD headers, directories and lumps
+
+instrument - count and time work for the '--profile' options
+
+lumps - tell the kind of each lump from its name, namespace and header
+
+query - find lumps by name prefix, shell-style pattern or regular
+expression
+
+search - search the data of lumps for byte patterns
+
+stats - compute and cache statistics of Doom level maps
+
+textures - index the wall textures and flats used by Doom level maps
+
+udmf - parse TEXTMAP lumps of the Universal Doom Map Format
+
+daemon - answer WAD queries from a resident process
+
 FOOTNOTES
 
 According to the Doom Bible, WAD is an acronym for "Where's All the
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+#Copyright 2022 Eric Duhamel
+#
+#    This file is part of Wadder.
+#
+#    Wadder is free software: you can redistribute it and/or modify it
+#    under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Wadder is distributed in the hope that it will be useful, but
+#    WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+#    General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Wadder. If not, see <https://www.gnu.org/licenses/>.
+#
+"""Cache rendered images by the content they were rendered from.
+
+A 'RenderCache' is a directory of encoded images, each named by a key
+hashing everything that went into it: the lump data, the palette and
+the render parameters (see 'get_key'). The same picture in two WADs,
+or in the same WAD rendered twice, has the same key and is drawn only
+once. 'render' copies a cached image to where it is wanted, or draws it
+and keeps a copy.
+
+Images are written under a temporary name and moved into place with
+'os.replace', so any number of worker processes can share a directory
+and never see half of a file. Every hit touches the modification time
+of the image, and when the directory grows past 'max_bytes' the least
+recently used images are removed until it is down to three quarters of
+that. Each process counts what is in the directory again after storing
+a sixty-fourth of 'max_bytes' itself, so the images stored by other
+workers are counted too and the directory stays near its limit however
+many share it.
+"""
+import hashlib
+import os
+import shutil
+
+from xwadder import instrument
+
+def get_key(*parts):
+    """Return a hexadecimal key hashing 'parts' in order.
+
+    Bytes-like parts are hashed as they are and anything else by its
+    'repr', so numbers, strings and tuples of parameters can be given.
+    """
+    digest = hashlib.sha1()
+    for part in parts:
+        if isinstance(part, (bytes, bytearray, memoryview)):
+            tag, part = b"b", bytes(part)
+        else:
+            tag, part = b"r", repr(part).encode('utf_8')
+        digest.update(tag + len(part).to_bytes(8, 'little'))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+class RenderCache():
+    """A directory of rendered images with a limit on its size."""
+
+    def __init__(self, dirname, max_bytes=1 << 28):
+        self.dirname = dirname
+        self.max_bytes = max_bytes
+        self.size = None  # bytes held when last counted
+        self.stored = 0  # bytes stored here since
+        os.makedirs(dirname, exist_ok=True)
+
+    def get_path(self, key, ext):
+        """Return the path of an image, under a subdirectory named by the
+        first two characters of its key.
+        """
+        return os.path.join(self.dirname, key[:2], key + "." + ext)
+
+    def fetch(self, key, ext, path):
+        """Copy a cached image to 'path' and return True, or return False
+        if there is none.
+        """
+        source = self.get_path(key, ext)
+        try:
+            shutil.copyfile(source, path)
+            os.utime(source)
+        except FileNotFoundError:  # never stored, or just evicted
+            instrument.count("render_cache_misses")
+            return False
+        instrument.count("render_cache_hits")
+        return True
+
+    def store(self, key, ext, path):
+        """Keep a copy of the image at 'path', then evict if need be."""
+        target = self.get_path(key, ext)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        temp = "%s.%d.tmp" % (target, os.getpid())
+        shutil.copyfile(path, temp)
+        os.replace(temp, target)
+        self.stored += os.path.getsize(target)
+        if (self.size is None or self.stored >= self.max_bytes // 64 or
+                self.size + self.stored > self.max_bytes):
+            self.size = sum(size for mtime, size, name in self.get_files())
+            self.stored = 0
+            if self.size > self.max_bytes:
+                self.evict()
+
+    def render(self, key, ext, path, draw):
+        """Write the image 'key' to 'path' and return 'path'.
+
+        'draw' is called with 'path' to draw the image only if it is
+        not cached.
+        """
+        if not self.fetch(key, ext, path):
+            draw(path)
+            self.store(key, ext, path)
+        return path
+
+    def get_files(self):
+        """Return the modification time, size and path of every image."""
+        files = []
+        for folder in os.scandir(self.dirname):
+            if not folder.is_dir():
+                continue
+            for item in os.scandir(folder.path):
+                if item.name.endswith(".tmp"):
+                    continue
+                try:
+                    stat = item.stat()
+                except FileNotFoundError:  # evicted by another process
+                    continue
+                files.append((stat.st_mtime_ns, stat.st_size, item.path))
+        return files
+
+    @instrument.timed("evict")
+    def evict(self):
+        """Remove the least recently used images until the directory
+        holds no more than three quarters of 'max_bytes'.
+        """
+        files = sorted(self.get_files())
+        total = sum(size for mtime, size, path in files)
+        for mtime, size, path in files:
+            if total <= self.max_bytes * 3 // 4:
+                break
+            try:
+                os.remove(path)
+                instrument.count("render_cache_evictions")
+            except FileNotFoundError:
+                pass
+            total -= size
+        self.size, self.stored = total, 0
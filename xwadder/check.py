@@ -0,0 +1,492 @@
+#!/usr/bin/env python3
+#Copyright 2022 Eric Duhamel
+#
+#    This file is part of Wadder.
+#
+#    Wadder is free software: you can redistribute it and/or modify it
+#    under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Wadder is distributed in the hope that it will be useful, but
+#    WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+#    General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Wadder. If not, see <https://www.gnu.org/licenses/>.
+#
+"""Check WAD files for damage before anything else reads them.
+
+'check_directory' reads the header and directory itself, without
+trusting either, and makes one pass over the entries sorted by position
+to find lumps past the end of the file, lumps overlapping the header,
+the directory or each other, and unbalanced namespace markers. It also
+decides which lumps to look inside and how, from their names, their
+namespace and the maps they belong to.
+
+'check_lump' and 'check_map' then validate the structure of one lump,
+or of the lumps of one map and the references between them, such as
+linedefs to vertexes. Every check is a bounded walk over the data: a
+picture's posts are followed at most to the end of the lump, and no
+count read from a lump is trusted before it is compared with the
+lump's length. 'scan' shares the lumps of many WADs out among worker
+processes.
+
+A finding is a dictionary of 'wad', 'index' and 'name' (of the entry,
+or None for the file as a whole), 'level' ("error" or "warning") and
+'message'.
+"""
+import array
+import concurrent.futures
+import mmap
+import re
+import struct
+import sys
+import zlib
+
+from xwadder import Doom, levels, udmf
+
+# lump name: (smallest size, size must be a multiple of)
+fixed_sizes = dict(PLAYPAL=(768, 768), COLORMAP=(256, 256),
+                   ENDOOM=(4000, 4000))
+# record sizes of binary map lumps
+record_sizes = {name: sum(8 if code == '8s' else array.array(code).itemsize
+                          for field, code in layout)
+                for name, layout in Doom.layouts.items()}
+hexen_record_sizes = dict(record_sizes, THINGS=20, LINEDEFS=16)
+required_lumps = ("THINGS", "LINEDEFS", "SIDEDEFS", "VERTEXES", "SECTORS")
+# at most this many findings are reported of each kind in one lump
+most_findings = 8
+_marker = re.compile(r"([A-Z]{1,2}[0-9]?)_(START|END)$")
+_errors = (ValueError, IndexError, KeyError, struct.error, zlib.error,
+           OverflowError, UnicodeDecodeError)
+
+def finding(wad, index, name, level, message):
+    """Return a finding as a dictionary."""
+    return dict(wad=wad, index=index, name=name, level=level,
+                message=message)
+
+def read_directory(data):
+    """Return the header fields, entries and findings of WAD bytes.
+
+    'data' is bytes or an mmap of the whole file. Entries are (index,
+    filepos, size, name) for as much of the directory as is in the
+    file; anything that cannot be read is reported instead.
+    """
+    problems = []
+    if len(data) < 12:
+        return None, [], [(None, None, "error",
+                           "file is too short for a WAD header")]
+    identification = bytes(data[0:4])
+    numlumps, infotableofs = struct.unpack("<II", data[4:12])
+    if identification not in (b"IWAD", b"PWAD"):
+        if identification[1:] != b"WAD":
+            return identification, [], [(None, None, "error",
+                                         "file does not have a WAD "
+                                         "signature")]
+        problems.append((None, None, "warning",
+                         "non-standard signature %r" % identification))
+    end = infotableofs + 16 * numlumps
+    if end > len(data):
+        problems.append((None, None, "error",
+                         "directory of %d entries at %d runs past the end "
+                         "of the file (%d bytes)" % (numlumps, infotableofs,
+                                                      len(data))))
+        numlumps = max(0, len(data) - infotableofs) // 16
+    table = bytes(data[infotableofs: infotableofs + 16 * numlumps])
+    entries = []
+    for i, (filepos, size, raw) in enumerate(struct.iter_unpack("<II8s",
+                                                                table)):
+        name = raw.split(b"\0", 1)[0].decode('ascii', 'replace')
+        entries.append((i, filepos, size, name))
+        if not name or not re.fullmatch(r"[A-Z0-9_\[\]\\\-^]+", name):
+            problems.append((i, name, "warning",
+                             "name %r has unusual characters" % raw))
+    return identification, entries, problems
+
+def check_directory(data):
+    """Return findings about the layout of a WAD and the lumps to check.
+
+    The findings are (index, name, level, message) tuples. Lump checks
+    are ('lump', kind, index, name, filepos, size) for one lump, or
+    ('map', index, name, lumps) for a map marker, where 'lumps' maps
+    each lump name of the map to (index, filepos, size).
+    """
+    identification, entries, problems = read_directory(data)
+    if not entries:
+        return problems, []
+    infotableofs = struct.unpack("<I", data[8:12])[0]
+    directory_end = infotableofs + 16 * len(entries)
+    good = set()
+    spans = []
+    for i, filepos, size, name in entries:
+        if not size:
+            good.add(i)
+            continue
+        if filepos + size > len(data):
+            problems.append((i, name, "error",
+                             "lump of %d bytes at %d runs past the end of "
+                             "the file" % (size, filepos)))
+            continue
+        if filepos < 12:
+            problems.append((i, name, "error", "lump overlaps the header"))
+        elif filepos < directory_end and infotableofs < filepos + size:
+            problems.append((i, name, "error",
+                             "lump overlaps the directory"))
+        else:
+            good.add(i)
+        spans.append((filepos, size, i, name))
+    spans.sort()
+    last_end, last = 0, None
+    for filepos, size, i, name in spans:
+        if last and filepos < last_end and (filepos, size) != last[0:2]:
+            problems.append((i, name, "error",
+                             "lump overlaps lump %d (%s)" % (last[2],
+                                                             last[3])))
+            good.discard(i)
+        if filepos + size > last_end:
+            last_end, last = filepos + size, (filepos, size, i, name)
+    depth = {}
+    for i, filepos, size, name in entries:
+        match = _marker.match(name)
+        if match:
+            prefix = match.group(1)[0]
+            if match.group(2) == "START":
+                depth[prefix] = depth.get(prefix, 0) + 1
+            elif depth.get(prefix):
+                depth[prefix] -= 1
+            else:
+                problems.append((i, name, "warning",
+                                 "end marker without a start marker"))
+    for prefix, count in sorted(depth.items()):
+        if count:
+            problems.append((None, None, "warning",
+                             "%s_START without %s_END" % (prefix, prefix)))
+    patch_names = set()
+    for i, filepos, size, name in entries:
+        if name == "PNAMES" and i in good and size >= 4:
+            lump = bytes(data[filepos: filepos + size])
+            count = min(struct.unpack_from("<I", lump)[0], (size - 4) // 8)
+            patch_names.update(Doom.read_names(lump[4: 4 + 8 * count], 0, 8))
+    return problems, get_checks(entries, good, patch_names)
+
+def get_checks(entries, good, patch_names=()):
+    """Return the lump and map checks for the readable entries.
+
+    Lumps between P_START and P_END or S_START and S_END, or named in
+    'patch_names', are checked as pictures.
+    """
+    checks = []
+    names = [entry[3] for entry in entries]
+    in_map = set()
+    for i in range(len(entries) - 1):
+        if names[i + 1] not in ("THINGS", "TEXTMAP"):
+            continue
+        lumps = {}
+        for n in range(i + 1, len(entries)):
+            if names[n] not in levels.map_lumps or names[n] in lumps:
+                break
+            lumps[names[n]] = entries[n][0:3]
+            in_map.add(n)
+        if all(lumps[name][0] in good for name in lumps):
+            checks.append(('map', i, names[i], lumps))
+    namespace = None
+    for i, filepos, size, name in entries:
+        match = _marker.match(name)
+        if match:
+            namespace = match.group(1)[0] if match.group(2) == "START" else (
+                None)
+            continue
+        if i not in good or not size or i in in_map:
+            if name in ("ZNODES", "TEXTMAP") and i in good and size:
+                checks.append(('lump', name, i, name, filepos, size))
+            continue
+        kind = None
+        if namespace in ("P", "S") or (name in patch_names and
+                                       namespace != "F"):
+            kind = 'picture'
+        elif namespace == "F":
+            kind = 'flat'
+        elif name in fixed_sizes or name == "PNAMES":
+            kind = name
+        elif re.fullmatch(r"TEXTURE[12]", name):
+            kind = 'TEXTURE'
+        if kind:
+            checks.append(('lump', kind, i, name, filepos, size))
+    return checks
+
+def check_picture(data):
+    """Return problems with a lump in the Doom picture format.
+
+    Every column is followed post by post only while it stays inside
+    the lump, and columns sharing an offset are followed once, so the
+    time taken is bounded by the size of the lump.
+    """
+    if len(data) < 8:
+        return ["too short for a picture header"]
+    width, height, left, top = struct.unpack_from("<HHhh", data)
+    if not width or not height:
+        return ["picture is %d by %d pixels" % (width, height)]
+    start = 8 + 4 * width
+    if start > len(data):
+        return ["%d column offsets run past the end of the lump" % width]
+    offsets = array.array('I', bytes(data[8:start]))
+    if sys.byteorder == 'big':
+        offsets.byteswap()
+    problems, followed = [], {}
+    for x, offset in enumerate(offsets):
+        if offset in followed:
+            problem = followed[offset]
+        else:
+            problem = followed[offset] = _follow_column(data, offset,
+                                                        start, height)
+        if problem:
+            problems.append("column %d: %s" % (x, problem))
+    if len(problems) > most_findings:
+        problems[most_findings:] = ["%d more columns are damaged"
+                                    % (len(problems) - most_findings)]
+    return problems
+
+def _follow_column(data, offset, start, height):
+    """Return a problem with the column at 'offset', or None."""
+    if not start <= offset < len(data):
+        return "offset %d is outside the lump" % offset
+    pos, end = offset, len(data)
+    while pos < end:
+        topdelta = data[pos]
+        if topdelta == 255:
+            return None
+        if pos + 3 > end:
+            break
+        length = data[pos + 1]
+        pos += length + 4
+        if pos > end:
+            break
+    return "posts run past the end of the lump"
+
+def check_patch_names(data):
+    """Return problems with a PNAMES lump."""
+    if len(data) < 4:
+        return ["too short for a count of names"]
+    count = struct.unpack_from("<I", data)[0]
+    if 4 + 8 * count > len(data):
+        return ["%d names run past the end of the lump" % count]
+    return []
+
+def check_textures(data):
+    """Return problems with a TEXTURE1 or TEXTURE2 lump."""
+    if len(data) < 4:
+        return ["too short for a count of textures"]
+    count = struct.unpack_from("<I", data)[0]
+    if 4 + 4 * count > len(data):
+        return ["%d texture offsets run past the end of the lump" % count]
+    problems = []
+    for n, offset in enumerate(struct.unpack_from("<%dI" % count, data, 4)):
+        if offset + 22 > len(data):
+            problems.append("texture %d is outside the lump" % n)
+            continue
+        patches = struct.unpack_from("<H", data, offset + 20)[0]
+        if offset + 22 + 10 * patches > len(data):
+            problems.append("patches of texture %d run past the end of "
+                            "the lump" % n)
+        if len(problems) > most_findings:
+            problems.append("and perhaps more")
+            break
+    return problems
+
+def check_nodes(data):
+    """Return problems with extended nodes, decoding them in full."""
+    if bytes(data[1:4]) not in (b"NOD", b"GLN", b"GL2", b"GL3"):
+        return ["unknown nodes signature %r" % bytes(data[0:4])]
+    Doom.load_nodes(data)
+    return []
+
+def check_textmap(data):
+    """Return problems with a UDMF TEXTMAP, parsing it in full."""
+    for block in udmf.parse(udmf.read_chunks(data)):
+        pass
+    return []
+
+def check_lump(kind, data):
+    """Return problems with the structure of one lump of type 'kind'.
+
+    'kind' is 'picture', 'flat', 'PNAMES', 'TEXTURE', 'ZNODES',
+    'TEXTMAP' or a name in 'fixed_sizes'. Each problem is a message.
+    """
+    try:
+        if kind == 'picture':
+            return check_picture(data)
+        elif kind == 'flat':
+            if len(data) % 64:
+                return ["%d bytes is not a whole number of 64-pixel rows"
+                        % len(data)]
+            return []
+        elif kind in fixed_sizes:
+            least, multiple = fixed_sizes[kind]
+            if len(data) < least or len(data) % multiple:
+                return ["%d bytes is not a multiple of %d"
+                        % (len(data), multiple)]
+            return []
+        elif kind == 'PNAMES':
+            return check_patch_names(data)
+        elif kind == 'TEXTURE':
+            return check_textures(data)
+        elif kind == 'ZNODES':
+            return check_nodes(data)
+        elif kind == 'TEXTMAP':
+            return check_textmap(data)
+    except _errors as error:
+        return ["cannot be decoded: %s" % error]
+    return []
+
+def check_map(lumps):
+    """Return problems with the lumps of one map.
+
+    'lumps' maps each lump name to its data. Return (lump name,
+    message) pairs, lump name None for the map as a whole. A binary map
+    must have its essential lumps, whole records in each, and linedefs,
+    sidedefs and the blockmap referring only to what exists.
+    """
+    if 'TEXTMAP' in lumps:
+        return []  # checked as a lump
+    problems = []
+    for name in required_lumps:
+        if name not in lumps:
+            problems.append((None, "map has no %s lump" % name))
+    sizes = hexen_record_sizes if 'BEHAVIOR' in lumps else record_sizes
+    counts = {}
+    for name, data in lumps.items():
+        if name in sizes and bytes(data[1:4]) not in (b"NOD", b"GLN",
+                                                      b"GL2", b"GL3"):
+            counts[name] = len(data) // sizes[name]
+            if len(data) % sizes[name]:
+                problems.append((name, "%d bytes is not a multiple of %d-"
+                                 "byte records" % (len(data), sizes[name])))
+    if problems:
+        return problems
+    for name in ('SSECTORS', 'NODES'):
+        data = lumps.get(name, b"")
+        if bytes(data[1:4]) in (b"NOD", b"GLN", b"GL2", b"GL3"):
+            problems += [(name, message) for message in check_nodes(data)]
+    level = Doom.Level()
+    level.lumps = lumps
+    linedefs = level.get_columns('LINEDEFS')
+    sides = level.get_columns('SIDEDEFS')['sector']
+    vertex_count = counts['VERTEXES']
+    side_count, sector_count = counts['SIDEDEFS'], counts['SECTORS']
+    bad = sum(1 for v in linedefs['start'] if v >= vertex_count) + sum(
+        1 for v in linedefs['end'] if v >= vertex_count)
+    if bad:
+        problems.append(('LINEDEFS', "%d linedef ends refer to missing "
+                         "vertexes" % bad))
+    bad = sum(1 for s in linedefs['front'] if s >= side_count)
+    if bad:
+        problems.append(('LINEDEFS', "%d linedefs have no front sidedef"
+                         % bad))
+    bad = sum(1 for s in linedefs['back'] if side_count <= s != 0xffff)
+    if bad:
+        problems.append(('LINEDEFS', "%d linedefs refer to missing back "
+                         "sidedefs" % bad))
+    bad = sum(1 for s in sides if not 0 <= s < sector_count)
+    if bad:
+        problems.append(('SIDEDEFS', "%d sidedefs refer to missing "
+                         "sectors" % bad))
+    reject = lumps.get('REJECT')
+    if reject and len(reject) < (sector_count ** 2 + 7) // 8:
+        problems.append(('REJECT', "%d bytes is too short for %d sectors"
+                         % (len(reject), sector_count)))
+    blockmap = lumps.get('BLOCKMAP')
+    if blockmap:
+        problems += [('BLOCKMAP', message)
+                     for message in check_blockmap(blockmap)]
+    return problems
+
+def check_blockmap(data):
+    """Return problems with a BLOCKMAP lump."""
+    if len(data) < 8:
+        return ["too short for a blockmap header"]
+    columns, rows = struct.unpack_from("<HH", data, 4)
+    if 8 + 2 * columns * rows > len(data):
+        return ["%d by %d block offsets run past the end of the lump"
+                % (columns, rows)]
+    offsets = array.array('H', bytes(data[8: 8 + 2 * columns * rows]))
+    if sys.byteorder == 'big':
+        offsets.byteswap()
+    words = len(data) // 2
+    bad = sum(1 for offset in offsets if offset >= words)
+    if bad and words < 0x10000:  # large blockmaps wrap 16-bit offsets
+        return ["%d block offsets are outside the lump" % bad]
+    return []
+
+def run_checks(filename, data, checks):
+    """Return the findings of lump and map checks on WAD bytes."""
+    findings = []
+    for check in checks:
+        if check[0] == 'map':
+            kind, index, name, lumps = check
+            datas = {lump: data[filepos: filepos + size]
+                     for lump, (i, filepos, size) in lumps.items()}
+            try:
+                problems = check_map(datas)
+            except _errors as error:
+                problems = [(None, "cannot be decoded: %s" % error)]
+            for lump, message in problems:
+                if lump:
+                    findings.append(finding(filename, lumps[lump][0], lump,
+                                            "error", name + ": " + message))
+                else:
+                    findings.append(finding(filename, index, name, "error",
+                                            message))
+        else:
+            kind, lump_kind, index, name, filepos, size = check
+            for message in check_lump(lump_kind,
+                                      data[filepos: filepos + size]):
+                findings.append(finding(filename, index, name, "error",
+                                        message))
+    return findings
+
+def check_wad(filename):
+    """Return every finding in one WAD file, checked in this process."""
+    with open(filename, 'rb') as file, mmap.mmap(
+            file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        problems, checks = check_directory(data)
+        findings = [finding(filename, *problem) for problem in problems]
+        return findings + run_checks(filename, data, checks)
+
+_files = {}  # WADs mapped by a worker process
+
+def _run_checks(filename, checks):
+    """Return the findings of 'checks' in a worker process."""
+    if filename not in _files:
+        with open(filename, 'rb') as file:
+            _files[filename] = mmap.mmap(file.fileno(), 0,
+                                         access=mmap.ACCESS_READ)
+    return run_checks(filename, _files[filename], checks)
+
+def scan(filenames, jobs=None, batch_size=256):
+    """Yield the findings of every WAD file as lists.
+
+    Each directory is checked here in one pass, then its lumps are
+    sent in batches of 'batch_size' checks to 'jobs' worker processes,
+    each of which maps every WAD it is given only once. Lists of
+    findings are yielded as they are finished, those of the
+    directories first. An empty file or one that cannot be mapped is
+    reported rather than raised.
+    """
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = []
+        for filename in filenames:
+            try:
+                with open(filename, 'rb') as file, mmap.mmap(
+                        file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    problems, checks = check_directory(data)
+            except (OSError, ValueError) as error:
+                yield [finding(filename, None, None, "error", str(error))]
+                continue
+            yield [finding(filename, *problem) for problem in problems]
+            for x in range(0, len(checks), batch_size):
+                futures.append(pool.submit(_run_checks, filename,
+                                           checks[x: x + batch_size]))
+        for future in concurrent.futures.as_completed(futures):
+            yield future.result()
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+#Copyright 2022 Eric Duhamel
+#
+#    This file is part of Wadder.
+#
+#    Wadder is free software: you can redistribute it and/or modify it
+#    under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Wadder is distributed in the hope that it will be useful, but
+#    WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+#    General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Wadder. If not, see <https://www.gnu.org/licenses/>.
+#
+"""Answer WAD queries from a resident process.
+
+'serve' listens on a Unix domain socket and keeps every WAD it is asked
+about mapped into memory, with its directory parsed and its names
+packed for queries (see 'query'). A WAD is read again only when its
+size or modification time changes. 'Client' sends queries, so a short-lived
+command pays for neither reading the directory nor, after the first
+query, anything but one round trip.
+
+Each request is one line of JSON, e.g.
+
+    {"op": "find", "file": "/path/DOOM2.WAD", "name": "FLOOR"}
+
+and each reply is one line of JSON with "ok" true and the result, or
+"ok" false and an "error". An "extract" reply is followed by "size"
+bytes of lump data. Operations:
+
+header - the raw header in hex, identification, numlumps and
+infotableofs
+
+list - entries from "start", "count" of them (all by default)
+
+find - entries whose names start with "name"
+
+query - entries whose names match any of "patterns" of "kind", which
+is "prefix", "glob" or "regex"
+
+entry - the entry at "index"
+
+extract - the data of the lump at "index"
+
+shutdown - stop the daemon
+"""
+import json
+import os
+import re
+import socket
+import stat
+import sys
+import tempfile
+import threading
+
+from xwadder import wads
+
+def get_socket_path():
+    """Return the socket path from $WADDER_SOCKET or a per-user default.
+
+    The default is in $XDG_RUNTIME_DIR, or else in a directory of the
+    temporary directory named for the user, which 'serve' creates
+    readable by its owner only.
+    """
+    if os.environ.get('WADDER_SOCKET'):
+        return os.environ['WADDER_SOCKET']
+    dirname = os.environ.get('XDG_RUNTIME_DIR') or os.path.join(
+        tempfile.gettempdir(), "wadder-%d" % os.getuid())
+    return os.path.join(dirname, "wadder.sock")
+
+def check_owner(path):
+    """Raise OSError unless the socket 'path' belongs to this user.
+
+    Its directory must belong to this user too, or be a sticky
+    directory of root's such as /tmp, so that nobody else can put a
+    socket of their own in its place.
+    """
+    uid = os.getuid()
+    info = os.lstat(path)
+    if not stat.S_ISSOCK(info.st_mode) or info.st_uid != uid:
+        raise OSError("daemon: %s is not a socket of this user" % path)
+    info = os.stat(os.path.dirname(os.path.abspath(path)))
+    if info.st_uid != uid and not (info.st_uid == 0 and
+                                   info.st_mode & stat.S_ISVTX):
+        raise OSError("daemon: %s is in a directory of another user" % path)
+
+def make_socket_dir(path):
+    """Create the directory of the default socket path if it is missing,
+    and raise OSError unless it is this user's alone.
+    """
+    dirname = os.path.dirname(path)
+    os.makedirs(dirname, mode=0o700, exist_ok=True)
+    info = os.stat(dirname)
+    if info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise OSError("daemon: %s is not private to this user" % dirname)
+
+
+class Client():
+    """A connection to a running daemon.
+
+    Raise OSError on construction if no daemon is listening, so that a
+    caller can fall back to reading the WAD itself.
+    """
+
+    def __init__(self, path=None):
+        path = path or get_socket_path()
+        check_owner(path)
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.socket.connect(path)
+        except OSError:
+            self.socket.close()
+            raise
+        self.file = self.socket.makefile('rwb')
+
+    def query(self, **request):
+        """Send one request and return its reply as a dictionary.
+
+        The data of an "extract" reply is returned under "data". Raise
+        OSError if the daemon reports an error.
+        """
+        self.file.write(json.dumps(request).encode('utf_8') + b"\n")
+        self.file.flush()
+        line = self.file.readline()
+        if not line:
+            raise OSError("daemon: connection closed")
+        reply = json.loads(line)
+        if not reply.get('ok'):
+            raise OSError("daemon: " + str(reply.get('error')))
+        if 'size' in reply:
+            reply['data'] = self.file.read(reply['size'])
+        return reply
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+
+class Library():
+    """WAD files kept mapped and indexed, reloaded when they change."""
+
+    def __init__(self):
+        self.wads = {}
+        self.lock = threading.Lock()
+
+    def get(self, filename):
+        """Return the Wad for 'filename', loading it if needed."""
+        path = os.path.realpath(filename)
+        stat = os.stat(path)
+        key = (stat.st_size, stat.st_mtime_ns)
+        with self.lock:
+            cached = self.wads.get(path)
+            if cached and cached[0] == key:
+                return cached[1]
+            wad = wads.Wad(path)
+            wad.map_file()
+            wad.get_names()
+            self.wads[path] = (key, wad)
+            if cached:  # views of the old mapping may still be in use
+                cached[1].mapping = None
+        return wad
+
+    def answer(self, request):
+        """Return the reply to a request and any lump data to follow."""
+        wad = self.get(request['file'])
+        op = request['op']
+        if op == "header":
+            return dict(header=wad.header.hex(),
+                        identification=wad.identification,
+                        numlumps=wad.numlumps,
+                        infotableofs=wad.infotableofs), None
+        elif op == "list":
+            start = request.get('start', 0)
+            count = request.get('count', len(wad.directory))
+            return dict(entries=wad.directory[start: start + count]), None
+        elif op in ("find", "query"):
+            if op == "find":
+                indices = wad.query(request['name'])
+            else:
+                indices = wad.query(request['patterns'],
+                                    request.get('kind', "prefix"))
+            return dict(entries=[wad.directory[i] for i in indices]), None
+        elif op == "entry":
+            return dict(entry=wad.directory[request['index']]), None
+        elif op == "extract":
+            data = wad.get_lump(request['index'])
+            return dict(entry=wad.directory[request['index']],
+                        size=len(data)), data
+        raise ValueError("unknown operation " + repr(op))
+
+def serve(path=None):
+    """Answer queries on a Unix domain socket until told to shut down.
+
+    A socket file left behind by a daemon that is no longer running is
+    replaced. The socket is created readable by its owner only.
+    """
+    import socketserver
+    if not path:
+        path = get_socket_path()
+        if not os.environ.get('WADDER_SOCKET'):
+            make_socket_dir(path)
+    if os.path.lexists(path):
+        if os.lstat(path).st_uid != os.getuid():
+            raise OSError("daemon: %s belongs to another user" % path)
+        try:
+            Client(path).close()
+        except OSError:
+            os.unlink(path)
+        else:
+            raise OSError("daemon: already running on " + path)
+    library = Library()
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                data, stop = None, False
+                try:
+                    request = json.loads(line)
+                    if request.get('op') == "shutdown":
+                        reply, stop = dict(ok=True), True
+                    else:
+                        reply, data = library.answer(request)
+                        reply['ok'] = True
+                except (AttributeError, OSError, ValueError, KeyError,
+                        IndexError, TypeError, re.error) as error:
+                    reply = dict(ok=False, error=str(error))
+                self.wfile.write(json.dumps(reply).encode('utf_8') + b"\n")
+                if data is not None:
+                    self.wfile.write(data)
+                self.wfile.flush()
+                if stop:
+                    threading.Thread(target=server.shutdown).start()
+                    return
+
+    umask = os.umask(0o177)  # no moment when others may connect
+    try:
+        server = socketserver.ThreadingUnixStreamServer(path, Handler)
+    finally:
+        os.umask(umask)
+    server.daemon_threads = True
+    print("daemon: listening on", path, file=sys.stderr)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.unlink(path)
+
+if __name__ == "__main__":
+    serve(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+#Copyright 2022 Eric Duhamel
+#
+#    This file is part of Wadder.
+#
+#    Wadder is free software: you can redistribute it and/or modify it
+#    under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Wadder is distributed in the hope that it will be useful, but
+#    WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+#    General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Wadder. If not, see <https://www.gnu.org/licenses/>.
+#
+"""Work with lumps of Doom flat format.
+
+A flat is a headerless block of palette indices stored row by row. The
+usual flat is 64x64 pixels (4096 bytes); high-resolution flats are
+larger squares and some games use 64-pixel-wide flats of other heights.
+
+'Atlas' packs many flats into one image so that they can be served or
+loaded as a single file along with a map of their coordinates.
+"""
+import json
+import math
+import os
+
+from xwadder import png
+
+def get_size(length):
+    """Return the width and height of a flat from its data length."""
+    width = math.isqrt(length)
+    if width * width == length:
+        return width, width
+    return 64, length // 64
+
+def pack_shelves(sizes, width):
+    """Return the (x, y) position of each (width, height) in 'sizes'.
+
+    Rectangles are placed tallest first on horizontal shelves no wider
+    than 'width'. A new shelf starts below the tallest rectangle of the
+    previous one. Also return the total height used.
+    """
+    order = sorted(range(len(sizes)), key=lambda i: -sizes[i][1])
+    positions = [None] * len(sizes)
+    x = y = shelf = 0
+    for i in order:
+        w, h = sizes[i]
+        if x + w > width and x > 0:
+            x, y, shelf = 0, y + shelf, 0
+        positions[i] = (x, y)
+        x += w
+        shelf = max(shelf, h)
+    return positions, y + shelf
+
+
+class Atlas():
+    """Many flats packed into one palette-indexed image.
+
+    'pixels' is a single preallocated bytearray of 'width' * 'height'
+    palette indices and 'entries' maps each flat name to its x, y,
+    width and height within it.
+    """
+
+    def __init__(self, wad, indices, width=None):
+        """Copy the flats at 'indices' of a mapped 'Wad' into place.
+
+        Each row of a flat is copied straight from a view of the mapped
+        WAD into the atlas buffer, so no per-flat copies are made. When
+        a name appears more than once the last lump is used, as a
+        Doom engine would.
+        """
+        lumps = {}
+        for i in indices:
+            entry = wad.get_entry(i)
+            if entry['size']:
+                lumps[entry['name']] = i
+        names = list(lumps)
+        sizes = [get_size(wad.get_entry(lumps[n])['size']) for n in names]
+        area = sum(w * h for w, h in sizes)
+        if width is None:
+            width = 1 << math.isqrt(area).bit_length() if area else 64
+        width = max([width] + [w for w, h in sizes])
+        positions, height = pack_shelves(sizes, width)
+        self.width, self.height = width, height
+        self.pixels = bytearray(width * height)
+        self.entries = {}
+        for name, (w, h), (x, y) in zip(names, sizes, positions):
+            view = wad.get_view(lumps[name])
+            for row in range(h):
+                offset = (y + row) * width + x
+                self.pixels[offset: offset + w] = view[row * w: row * w + w]
+            view.release()
+            self.entries[name] = dict(x=x, y=y, width=w, height=h)
+
+    def save(self, name, playpal=None, level=6):
+        """Save the image as 'name'.png and its map as 'name'.json."""
+        png.save_png(name + ".png", self.width, self.height, self.pixels,
+                     'indexed', playpal, level=level)
+        index = dict(image=os.path.basename(name) + ".png",
+                     width=self.width, height=self.height,
+                     flats=self.entries)
+        with open(name + ".json", 'w') as file:
+            json.dump(index, file, indent=1)
+        return name + ".png", name + ".json"
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+#Copyright 2022 Eric Duhamel
+#
+#    This file is part of Wadder.
+#
+#    Wadder is free software: you can redistribute it and/or modify it
+#    under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Wadder is distributed in the hope that it will be useful, but
+#    WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+#    General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Wadder. If not, see <https://www.gnu.org/licenses/>.
+#
+"""Count and time what Wadder spends its work on.
+
+Modules call 'count' for events such as bytes read or lumps decoded,
+and time larger steps with 'with stage(name):' or the 'timed'
+decorator. Until 'start' is called 'count' returns at once, 'stage'
+returns a shared context manager that does nothing and 'timed'
+functions call straight through, so instrumented code costs only a
+function call.
+
+'finish' prints a breakdown of stages and counters, or saves it as
+JSON, or as cProfile statistics for files named '.prof'. Only the
+calling process is measured; work done in a pool of worker processes
+shows up as the time of the stage that waits for it.
+"""
+import collections
+import contextlib
+import cProfile
+import functools
+import json
+import sys
+import time
+
+enabled = False
+counters = collections.Counter()
+stages = {}  # name: [seconds, calls, seconds not in other stages]
+_running = collections.Counter()  # depth of each stage now running
+_stack = []  # stages now running, innermost last
+_profiler = None
+_began = None
+_idle = contextlib.nullcontext()
+
+def count(name, n=1):
+    """Add 'n' to the counter 'name' if instrumentation is enabled."""
+    if enabled:
+        counters[name] += n
+
+def stage(name):
+    """Return a context manager that times a stage named 'name'.
+
+    Stages may nest, and each one is timed in full, except that a stage
+    inside another of the same name is not counted again. Its self time
+    leaves out the stages inside it, so self times add up to no more
+    than the total.
+    """
+    if enabled:
+        return _Stage(name)
+    return _idle
+
+def timed(name):
+    """Decorate a function so that each call is timed as stage 'name'."""
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return function(*args, **kwargs)
+            with _Stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def start(path=None):
+    """Enable instrumentation, and cProfile too if 'path' ends '.prof'."""
+    global enabled, _began, _profiler
+    counters.clear()
+    stages.clear()
+    _running.clear()
+    del _stack[:]
+    enabled, _began = True, time.perf_counter()
+    if path and path.endswith(".prof"):
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+
+def get_report():
+    """Return the stages and counters measured so far as a dictionary."""
+    total = time.perf_counter() - _began if _began else 0.0
+    return dict(seconds=total,
+                stages={name: dict(seconds=seconds, calls=calls,
+                                   self_seconds=own)
+                        for name, (seconds, calls, own) in stages.items()},
+                counters=dict(sorted(counters.items())))
+
+def finish(path=None, file=sys.stderr):
+    """Disable instrumentation and report it.
+
+    With no 'path' the report is printed to 'file'. A 'path' ending
+    '.prof' saves cProfile statistics for 'pstats' or a viewer as well,
+    and any other 'path' saves the report as JSON.
+    """
+    global enabled, _profiler
+    if _profiler:
+        _profiler.disable()
+        _profiler.dump_stats(path)
+        _profiler = None
+    report = get_report()
+    enabled = False
+    if path and not path.endswith(".prof"):
+        with open(path, 'w') as out:
+            json.dump(report, out, indent=1)
+        return report
+    print("profile: %.3f s in total" % report['seconds'], file=file)
+    print("  %-20s %11s %11s %6s" % ("stage", "total", "self", "self%"),
+          file=file)
+    for name, stage in sorted(report['stages'].items(),
+                              key=lambda item: -item[1]['self_seconds']):
+        share = stage['self_seconds'] / report['seconds'] * 100 if (
+            report['seconds']) else 0
+        print("  %-20s %9.3f s %9.3f s %5.1f%% %8d calls" % (
+            name, stage['seconds'], stage['self_seconds'], share,
+            stage['calls']), file=file)
+    for name, value in report['counters'].items():
+        print("  %-20s %12d" % (name, value), file=file)
+    return report
+
+
+class _Stage():
+    """The timer of one stage while it runs."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        _running[self.name] += 1
+        _stack.append(self)
+        self.inner = 0.0  # seconds spent in stages inside this one
+        self.began = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.began
+        _running[self.name] -= 1
+        if _stack and _stack[-1] is self:
+            _stack.pop()
+        outer = _stack[-1] if _stack else None
+        if not _running[self.name]:
+            totals = stages.setdefault(self.name, [0.0, 0, 0.0])
+            totals[0] += seconds
+            totals[1] += 1
+            totals[2] += seconds - self.inner
+            if outer:
+                outer.inner += seconds
+        elif outer:  # not counted, so its time is its outer stage's own
+            outer.inner += self.inner
+        return False
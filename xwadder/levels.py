@@ -17,8 +17,40 @@
 #    along with Wadder. If not, see <https://www.gnu.org/licenses/>.
 #
 """Work with lumps associated with a level map
+
+A map is a marker lump, named e.g. 'E1M1' or 'MAP01', followed by the
+lumps named in 'map_lumps'. A UDMF map's lumps start with TEXTMAP and
+end with an ENDMAP marker. 'find_maps' finds every map in a WAD and
+'load_level' collects the lumps of one of them.
 """
 
+map_lumps = ("THINGS", "LINEDEFS", "SIDEDEFS", "VERTEXES", "SEGS",
+             "SSECTORS", "NODES", "SECTORS", "REJECT", "BLOCKMAP",
+             "BEHAVIOR", "SCRIPTS", "TEXTMAP", "ZNODES", "DIALOGUE")
+
+def find_maps(wad):
+    """Return (name, index) of every map marker in a 'wads.Wad'.
+
+    A marker is any entry directly followed by a THINGS or TEXTMAP
+    lump, so the directory is scanned once whatever the maps are named.
+    """
+    directory = wad.directory
+    maps = []
+    for i in range(len(directory) - 1):
+        if directory[i + 1]['name'] in ("THINGS", "TEXTMAP"):
+            maps.append((directory[i]['name'], i))
+    return maps
+
+def load_level(wad, index):
+    """Return a Level of the lumps following the marker at 'index'."""
+    level = Level()
+    for i in range(index + 1, len(wad.directory)):
+        name = wad.get_entry(i)['name']
+        if name not in map_lumps or name in level.lumps:
+            break
+        level.add_lump(name, wad.get_lump(i))
+    return level
+
 class Level:
     def __init__(self, **lumps):
         self.lumps = {}
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+#Copyright 2022 Eric Duhamel
+#
+#    This file is part of Wadder.
+#
+#    Wadder is free software: you can redistribute it and/or modify it
+#    under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Wadder is distributed in the hope that it will be useful, but
+#    WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+#    General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Wadder. If not, see <https://www.gnu.org/licenses/>.
+#
+"""Tell what kind of data each lump holds.
+
+'sniff' decides from a lump's name, size and first 'probe_size' bytes
+alone: signatures such as PNG, MUS, MIDI or an embedded WAD come
+first, then well-known names, then the headers of DMX and PC speaker
+sounds and Doom pictures, checked against the size of the lump, then
+text. 'classify' does the same for a whole directory in one pass,
+adding what only the directory shows: marker namespaces and maps.
+Nothing but the first bytes of each lump is read, straight from the
+memory-mapped WAD. 'wads.Wad.get_kinds' keeps the result with the
+directory, so decoders can choose by kind instead of by trial.
+
+Kinds: acs, colormap, endoom, flac, flat, map, map_lump, marker,
+midi, mp3, mus, nodes, ogg, palette, patch, pc_sound, png, pnames,
+sound, text, texture, unknown, wad, wav, zip
+"""
+import os
+import re
+import struct
+
+from xwadder import levels
+
+probe_size = 16
+signatures = ((b"\x89PNG", "png"), (b"MUS\x1a", "mus"), (b"MThd", "midi"),
+              (b"IWAD", "wad"), (b"PWAD", "wad"), (b"RIFF", "wav"),
+              (b"OggS", "ogg"), (b"fLaC", "flac"), (b"ID3", "mp3"),
+              (b"PK\x03\x04", "zip"), (b"ACS\0", "acs"), (b"ACSE", "acs"),
+              (b"ACSe", "acs"), (b"XNOD", "nodes"), (b"ZNOD", "nodes"),
+              (b"XGLN", "nodes"), (b"ZGLN", "nodes"), (b"XGL2", "nodes"),
+              (b"ZGL2", "nodes"), (b"XGL3", "nodes"), (b"ZGL3", "nodes"))
+names = dict(PLAYPAL="palette", COLORMAP="colormap", ENDOOM="endoom",
+             PNAMES="pnames", TEXTURE1="texture", TEXTURE2="texture")
+flat_sizes = (4096, 4160, 8192)
+_text = re.compile(rb"[\t\n\r\x20-\x7e]*")
+_marker = re.compile("([A-Z]+)[0-9]?_(START|END)$")
+
+def get_signature(header):
+    """Return the kind named by a signature at the start of 'header'."""
+    for signature, kind in signatures:
+        if header.startswith(signature):
+            return kind
+
+def is_picture(header, size):
+    """Return True if 'header' may begin a Doom picture of 'size' bytes.
+
+    The width and height must be sensible and the first column must
+    start after the column offsets and before the end of the lump.
+    """
+    if len(header) < 12:
+        return False
+    width, height, left, top, first = struct.unpack_from("<HHhhI", header)
+    return (0 < width <= 4096 and 0 < height <= 4096 and
+            8 + 4 * width <= first < size)
+
+def sniff(header, size, name=""):
+    """Return the kind of a lump from its first bytes, size and name.
+
+    'header' is at least the first 'probe_size' bytes of the lump, or
+    all of it if it is shorter.
+    """
+    if not size:
+        return "marker"
+    kind = get_signature(header)
+    if kind:
+        return kind
+    if name in names:
+        return names[name]
+    if len(header) >= 8:
+        form, rate, count = struct.unpack_from("<HHI", header)
+        if form == 3 and 0 < count <= size - 8:
+            return "sound"
+        if form == 0 and rate == size - 4:
+            return "pc_sound"
+    if is_picture(header, size):
+        return "patch"
+    if size in flat_sizes:
+        return "flat"
+    if _text.fullmatch(header[:probe_size]):
+        return "text"
+    return "unknown"
+
+def sniff_file(filename):
+    """Return the kind of a lump saved as a file, e.g. 'NAME.lmp'."""
+    with open(filename, 'rb') as file:
+        header = file.read(probe_size)
+    name = os.path.splitext(os.path.basename(filename))[0].upper()
+    return sniff(header, os.path.getsize(filename), name)
+
+def classify(wad):
+    """Return the kind of every lump of a 'wads.Wad' as a list.
+
+    Markers are "marker", map markers "map" and the lumps of a map
+    "map_lump". Lumps between F_START and F_END are flats, and lumps
+    between the markers of sprites, patches or textures (S, P and TX)
+    are patches, unless they have a signature such as PNG.
+    """
+    directory = wad.directory
+    data = wad.map_file()
+    kinds = [None] * len(directory)
+    for name, marker in levels.find_maps(wad):
+        kinds[marker] = "map"
+        for i in range(marker + 1, len(directory)):
+            if directory[i]['name'] not in levels.map_lumps:
+                break
+            kinds[i] = "map_lump"
+    namespace = None
+    for i, entry in enumerate(directory):
+        match = _marker.match(entry['name'])
+        if match and not entry['size']:
+            prefix = match.group(1)[:2]
+            if prefix in ("F", "FF", "S", "SS", "P", "PP", "TX"):
+                namespace = prefix[0] if match.group(2) == "START" else None
+            kinds[i] = "marker"
+            continue
+        if kinds[i]:
+            continue
+        filepos, size = entry['filepos'], entry['size']
+        header = data[filepos: filepos + min(size, probe_size)]
+        if namespace and size:
+            kinds[i] = get_signature(header) or (
+                "flat" if namespace == "F" else "patch")
+        else:
+            kinds[i] = sniff(header, size, entry['name'])
+    return kinds
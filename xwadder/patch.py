@@ -20,6 +20,8 @@
 """
 import os
 
+from xwadder import instrument, png
+
 # graymap for rendering images
 default_map = bytearray()
 for x in range(256):
@@ -50,6 +52,19 @@ def unsigned_int_array(data, size):
         array.append(value)
     return array
 
+def get_rgb(pixels, playpal=default_map):
+    """Return RGB bytes for a sequence of palette indices.
+
+    Each color channel is looked up with one 'bytes.translate' call on
+    all of the pixels at once.
+    """
+    if not isinstance(pixels, (bytes, bytearray)):
+        pixels = bytes(pixels)
+    rgb = bytearray(len(pixels) * 3)
+    for c in range(3):
+        rgb[c::3] = pixels.translate(bytes(playpal[c: 768: 3]))
+    return rgb
+
 class Picture():
     """An image in the Doom picture format.
 
@@ -59,6 +74,7 @@ class Picture():
     prevent either outcome.
     """
 
+    @instrument.timed("decode")
     def __init__(self, fd, seek=0):
         try:  # fd is either an open file or a path
             file = open(fd, 'rb')
@@ -83,38 +99,81 @@ class Picture():
                 post = Post(file)
             self.columns.append(posts)
         file.close()
+        instrument.count("lumps_decoded")
 
-    def save_image(self, name="picture", playpal=default_map):
-        """Save a simple Netpbm file based on picture data.
+    def get_pixels(self):
+        """Return the picture as row-major palette indices and a mask.
 
-        The picture format is stored in pixels with values between 0
-        and 255.
+        Both are bytearrays of 'width' * 'height' bytes. A mask byte is
+        255 where a post has drawn a pixel and 0 where the picture is
+        transparent. The indices can be shaded to a light level with
+        'Doom.Colormap.translate'.
         """
         width, height = self.width, self.height
-        map = [b'\xff\x00\xff' for x in range(width * height)]
+        pixels = bytearray(width * height)
+        mask = bytearray(width * height)
+        instrument.count("pixels_rendered", width * height)
         for x, column in enumerate(self.columns):
             for post in column:
-                topdelta = post.topdelta
-                for y, value in enumerate(post.data):
-                    offset = value * 3
-                    color = playpal[offset: offset + 3]
-                    map[x + (topdelta * width) + (y * width)] = color
+                for y, value in enumerate(post.data, post.topdelta):
+                    if y < height:
+                        pixels[x + y * width] = value
+                        mask[x + y * width] = 255
+        return pixels, mask
+
+    @instrument.timed("write")
+    def save_image(self, name="picture", playpal=default_map,
+                   colormap=None, level=0, format="ppm"):
+        """Save a simple Netpbm or PNG file based on picture data.
+
+        The picture format is stored in pixels with values between 0
+        and 255. If a 'Doom.Colormap' is given the pixels are shaded to
+        light map 'level' before the palette is applied. A "png" file
+        keeps the palette indices and marks transparent pixels with a
+        tRNS chunk instead of painting them magenta.
+        """
+        width, height = self.width, self.height
+        pixels, mask = self.get_pixels()
+        if colormap:
+            pixels = colormap.translate(pixels, level)
+        if format == "png":
+            return self.save_png(name, pixels, mask, playpal)
+        colors = [bytes(playpal[x * 3: x * 3 + 3]) for x in range(256)]
+        map = [colors[value] if opaque else b'\xff\x00\xff'
+               for value, opaque in zip(pixels, mask)]
         path = ".".join([name, "ppm"])
         with open(path, 'wb') as file:
             file.write(b"P6 ")
             file.write(bytes(str(width) + " ", 'utf_8'))
             file.write(bytes(str(height) + " ", 'utf_8'))
             file.write(b"255 ")
-            for x in map:
-                file.write(x)
+            file.write(b"".join(map))
+        return path
+
+    def save_png(self, name, pixels, mask, playpal=default_map):
+        """Save palette indices and a mask as an indexed PNG file."""
+        path = ".".join([name, "png"])
+        width, height = self.width, self.height
+        transparent = png.get_transparent(pixels, mask)
+        if transparent:
+            pixels, alpha = transparent
+            return png.save_png(path, width, height, pixels, 'indexed',
+                                playpal, alpha)
+        rgb = get_rgb(pixels, playpal)
+        rgba = bytearray(width * height * 4)
+        for c in range(3):
+            rgba[c::4] = rgb[c::3]
+        rgba[3::4] = mask
+        return png.save_png(path, width, height, rgba, 'rgba')
 
 
 class Post():
     """A short sequence of pixel data."""
 
     def __init__(self, file):
-        # TODO: safety check for 'length' of data
-        self.topdelta = unsigned_int(file.read(1))
+        # a post cut short by the end of the data ends the column
+        byte = file.read(1)
+        self.topdelta = unsigned_int(byte) if byte else 255
         if self.topdelta < 255:
             length = unsigned_int(file.read(1))
             self.unused1 = unsigned_int(file.read(1))
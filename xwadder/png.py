@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+#Copyright 2022 Eric Duhamel
+#
+#    This file is part of Wadder.
+#
+#    Wadder is free software: you can redistribute it and/or modify it
+#    under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Wadder is distributed in the hope that it will be useful, but
+#    WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+#    General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Wadder. If not, see <https://www.gnu.org/licenses/>.
+#
+"""Write Portable Network Graphics files using only the zlib module.
+
+The 'Writer' class streams an image row by row. Each row is compressed
+as soon as it is written and compressed data is flushed to the file in
+IDAT chunks, so an image never has to be held in memory whole.
+
+Modes:
+
+'indexed' - one palette index per pixel, with a 768-byte palette such
+as a PLAYPAL map and optional per-index alpha values
+
+'gray' - one gray value per pixel
+
+'rgb' - three bytes per pixel
+
+'rgba' - four bytes per pixel
+
+[PNG](https://www.w3.org/TR/png/)
+"""
+import struct
+import zlib
+
+from xwadder import instrument
+
+signature = b"\x89PNG\r\n\x1a\n"
+color_types = dict(gray=(0, 1), rgb=(2, 3), indexed=(3, 1), rgba=(6, 4))
+
+def get_transparent(pixels, mask):
+    """Return pixels and tRNS alpha values for a transparency mask.
+
+    A palette index that no opaque pixel uses is given to every
+    transparent pixel and made fully transparent. Return None if all
+    256 indices are in use, in which case 'rgba' must be used instead.
+    """
+    used = set(p for p, m in zip(pixels, mask) if m)
+    for free in range(256):
+        if free not in used:
+            break
+    else:
+        return None
+    pixels = bytes(p if m else free for p, m in zip(pixels, mask))
+    return pixels, b"\xff" * free + b"\x00"
+
+@instrument.timed("write")
+def save_png(path, width, height, pixels, mode='indexed', palette=None,
+             alpha=None, level=6):
+    """Save a whole image held in 'pixels' as a PNG file."""
+    with open(path, 'wb') as file:
+        writer = Writer(file, width, height, mode, palette, alpha, level)
+        writer.write_pixels(pixels)
+        writer.close()
+    return path
+
+
+class Writer():
+    """A PNG image written one row at a time.
+
+    'file' is an open binary file. Rows must be written top to bottom
+    with 'write_row' or 'write_pixels' and the image completed with
+    'close', which does not close 'file'. 'level' is the zlib
+    compression level from 0 (fastest) to 9 (smallest).
+    """
+
+    chunk_size = 1 << 16
+
+    def __init__(self, file, width, height, mode='indexed', palette=None,
+                 alpha=None, level=6):
+        color_type, channels = color_types[mode]
+        self.file = file
+        self.width, self.height = width, height
+        self.stride = width * channels
+        self.rows = 0
+        self.compressor = zlib.compressobj(level)
+        self.buffer = bytearray()
+        file.write(signature)
+        self.write_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height,
+                                              8, color_type, 0, 0, 0))
+        if mode == 'indexed':
+            if palette is None:  # 256 shades of gray
+                palette = bytes(x // 3 for x in range(768))
+            self.write_chunk(b"PLTE", bytes(palette[:768]))
+            if alpha:
+                self.write_chunk(b"tRNS", bytes(alpha)[:256])
+
+    def write_chunk(self, kind, data):
+        """Write one length-prefixed and checksummed chunk."""
+        instrument.count("bytes_written", len(data) + 12)
+        self.file.write(struct.pack(">I", len(data)))
+        self.file.write(kind)
+        self.file.write(data)
+        self.file.write(struct.pack(">I", zlib.crc32(data,
+                                                     zlib.crc32(kind))))
+
+    @instrument.timed("write")
+    def write_row(self, row):
+        """Compress one row of pixel data."""
+        row = b"\x00" + bytes(row[:self.stride])  # filter type None
+        self.buffer += self.compressor.compress(row)
+        self.rows += 1
+        if len(self.buffer) >= self.chunk_size:
+            self.write_chunk(b"IDAT", bytes(self.buffer))
+            self.buffer.clear()
+
+    def write_pixels(self, pixels):
+        """Compress any number of whole rows held in one buffer."""
+        stride = max(self.stride, 1)
+        view = memoryview(pixels)
+        for x in range(0, len(view) - stride + 1, stride):
+            self.write_row(view[x: x + stride])
+
+    def close(self):
+        """Pad any missing rows and write the final chunks."""
+        while self.rows < self.height:
+            self.write_row(bytes(self.stride))
+        self.buffer += self.compressor.flush()
+        self.write_chunk(b"IDAT", bytes(self.buffer))
+        self.buffer.clear()
+        self.write_chunk(b"IEND", b"")
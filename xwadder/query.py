@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+#Copyright 2022 Eric Duhamel
+#
+#    This file is part of Wadder.
+#
+#    Wadder is free software: you can redistribute it and/or modify it
+#    under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Wadder is distributed in the hope that it will be useful, but
+#    WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+#    General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Wadder. If not, see <https://www.gnu.org/licenses/>.
+#
+"""Find the lumps of a directory by name.
+
+A query is one or more patterns of one kind: 'prefix' for names that
+begin with a string, 'glob' for shell-style wildcards such as 'SKY?'
+or '*_START', or 'regex' for regular expressions that must match a
+whole name. A 'NameTable' packs the names of a directory into one
+string, a line each, so that a glob or regex query compiled once into
+a single expression is matched by one pass of 're' over the whole
+table. From the second prefix query on, a table keeps a sorted copy of
+its names, so that each prefix costs a binary search. Either way the
+result is an array of indices in directory order, ready to list or
+extract.
+"""
+import array
+import bisect
+import functools
+import itertools
+import re
+
+kinds = ("prefix", "glob", "regex")
+
+def translate_glob(pattern):
+    """Return a regular expression for a shell-style pattern.
+
+    As in 'fnmatch', '*' matches anything, '?' any one character,
+    '[seq]' any character in 'seq' and '[!seq]' any not in it, and a
+    '[' without a closing ']' is itself. No part matches a line break.
+    """
+    parts, i = [], 0
+    while i < len(pattern):
+        c = pattern[i]
+        i += 1
+        if c == "*":
+            parts.append("[^\\n]*")
+        elif c == "?":
+            parts.append("[^\\n]")
+        elif c == "[":
+            j = i
+            if j < len(pattern) and pattern[j] == "!":
+                j += 1
+            if j < len(pattern) and pattern[j] == "]":
+                j += 1
+            j = pattern.find("]", j)
+            if j < 0:
+                parts.append("\\[")
+                continue
+            chars = pattern[i:j].replace("\\", "\\\\")
+            i = j + 1
+            negate = chars[0:1] == "!"
+            if negate:
+                chars = chars[1:]
+            if chars[0:1] == "^":
+                chars = "\\" + chars
+            chars = re.sub(r"([\[\]&~|])", r"\\\1", chars)
+            parts.append(("[^\\n" if negate else "[") + chars + "]")
+        else:
+            parts.append(re.escape(c))
+    return "".join(parts)
+
+@functools.lru_cache(maxsize=64)
+def compile_query(patterns, kind):
+    """Return one compiled expression matching whole lines for any of
+    'patterns', a tuple of patterns of one kind.
+    """
+    if kind == "prefix":
+        sources = [re.escape(pattern) + "[^\\n]*" for pattern in patterns]
+    elif kind == "glob":
+        sources = [translate_glob(pattern) for pattern in patterns]
+    elif kind == "regex":
+        sources = list(patterns)
+    else:
+        raise ValueError("query: unknown kind of pattern %r" % kind)
+    return re.compile("^(?:" + "|".join("(?:%s)" % source
+                                        for source in sources) + ")$",
+                      re.MULTILINE)
+
+
+class NameTable():
+    """The names of a directory packed for matching all at once.
+
+    'text' holds every name followed by a line break and 'starts' the
+    position of each name in it.
+    """
+
+    def __init__(self, names):
+        self.names = list(names)
+        self.text = "".join(name + "\n" for name in self.names)
+        self.starts = array.array('l', itertools.accumulate(
+            (len(name) + 1 for name in self.names), initial=0))
+        self.starts.pop()
+        self.sorted = None  # (names, indices) sorted, for prefixes
+        self.prefix_queries = 0
+
+    def find(self, patterns, kind="prefix"):
+        """Return an array of the index of every name matching any of
+        'patterns', a pattern or a list of them, in ascending order.
+        """
+        if isinstance(patterns, str):
+            patterns = [patterns]
+        if kind == "prefix":
+            self.prefix_queries += 1
+            if self.prefix_queries > 1:  # worth sorting for the next ones
+                return self.find_prefixes(patterns)
+        regex = compile_query(tuple(patterns), kind)
+        found, starts = [], self.starts
+        if not self.names:
+            return array.array('l')
+        # the last line break is left out, or '$' would match after it
+        for match in regex.finditer(self.text, 0, len(self.text) - 1):
+            if "\n" in match.group():  # matched across several names
+                return self.find_each(regex)
+            found.append(bisect.bisect_right(starts, match.start()) - 1)
+        return array.array('l', found)
+
+    def find_each(self, regex):
+        """Return the indices of names 'regex' matches one at a time."""
+        return array.array('l', (i for i, name in enumerate(self.names)
+                                 if regex.fullmatch(name)))
+
+    def find_prefixes(self, prefixes):
+        """Return the indices of names beginning with any of 'prefixes'."""
+        if self.sorted is None:
+            order = sorted(range(len(self.names)),
+                           key=self.names.__getitem__)
+            self.sorted = ([self.names[i] for i in order],
+                           array.array('l', order))
+        names, indices = self.sorted
+        found = set()
+        for prefix in prefixes:
+            first = bisect.bisect_left(names, prefix)
+            last = first
+            while last < len(names) and names[last].startswith(prefix):
+                last += 1
+            found.update(indices[first:last])
+        return array.array('l', sorted(found))
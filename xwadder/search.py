@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+#Copyright 2022 Eric Duhamel
+#
+#    This file is part of Wadder.
+#
+#    Wadder is free software: you can redistribute it and/or modify it
+#    under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Wadder is distributed in the hope that it will be useful, but
+#    WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+#    General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Wadder. If not, see <https://www.gnu.org/licenses/>.
+#
+"""Search the data of lumps for a byte pattern.
+
+'search' runs a compiled bytes regular expression over a memoryview of
+each chosen lump in a memory-mapped WAD, so that 're' reads the page
+cache directly and no lump is ever copied. Each lump is a subject of
+its own, so '^', '\\b' and lookbehinds never see a neighbouring lump.
+'get_indices' chooses lumps by namespace, name and kind, and 'scan'
+shares the lumps of many WADs out among worker processes in batches of
+similar size.
+
+A hit is a dictionary of 'wad', 'index' and 'name' of the lump,
+'offset' of the match from the start of the lump, and 'match', the
+matched bytes as text with anything but printable ASCII escaped.
+"""
+import concurrent.futures
+import re
+import sys
+
+from xwadder import wads
+
+def compile_pattern(pattern, fixed=False, ignore_case=False):
+    """Return a compiled bytes pattern from text.
+
+    'fixed' matches 'pattern' literally instead of as a regular
+    expression.
+    """
+    raw = pattern.encode('latin_1')
+    if fixed:
+        raw = re.escape(raw)
+    return re.compile(raw, re.IGNORECASE if ignore_case else 0)
+
+def escape(data):
+    """Return bytes as text with every byte but printable ASCII escaped,
+    as in the 'repr' of bytes.
+    """
+    return repr(bytes(data))[2:-1]
+
+def get_indices(wad, namespace=None, name=None, kind=None):
+    """Return the index of every lump with data to search.
+
+    'namespace' is the letter of a marker namespace (see
+    'wads.Wad.locate_namespace'), 'name' a shell-style pattern (see
+    'wads.Wad.locate_glob') and 'kind' a kind of lump (see 'lumps').
+    """
+    if namespace:
+        indices = wad.locate_namespace(namespace)
+    else:
+        indices = range(len(wad.directory))
+    if name:
+        indices = wad.locate_glob(name, indices)
+    if kind:
+        kinds = wad.get_kinds()
+        indices = [i for i in indices if kinds[i] == kind]
+    return [i for i in indices if wad.directory[i]['size']]
+
+def search(wad, pattern, indices):
+    """Yield a hit for every match of 'pattern' in the lumps 'indices'.
+
+    A lump running past the end of the file is searched as far as the
+    end.
+    """
+    data = memoryview(wad.map_file())
+    try:
+        for i in indices:
+            entry = wad.directory[i]
+            start = entry['filepos']
+            with data[start: start + entry['size']] as lump:
+                for match in pattern.finditer(lump):
+                    yield dict(wad=wad.filename, index=i, name=entry['name'],
+                               offset=match.start(),
+                               match=escape(match.group()))
+    finally:
+        data.release()
+
+_wads = {}  # WADs opened by a worker process
+
+def _search(filename, pattern, indices):
+    """Return the hits in some lumps of a WAD in a worker process."""
+    if filename not in _wads:
+        _wads[filename] = wads.open_wad(filename)
+    return list(search(_wads[filename], pattern, indices))
+
+def scan(filenames, pattern, jobs=None, namespace=None, name=None,
+         kind=None, batch_bytes=1 << 22):
+    """Yield lists of hits in the chosen lumps of every WAD file.
+
+    Each directory is read here, and its lumps are sent to 'jobs'
+    worker processes in batches of about 'batch_bytes' of data, so a
+    few large lumps and many small ones are shared out evenly. Each
+    worker maps a WAD once. Hits are yielded in the order of the files
+    and lumps. A file that is not a WAD or cannot be read is reported to
+    standard error and skipped.
+    """
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = []
+        for filename in filenames:
+            try:
+                wad = wads.open_wad(filename)
+                indices = get_indices(wad, namespace, name, kind)
+            except (OSError, ValueError) as error:
+                print("search: skipping", error, file=sys.stderr)
+                continue
+            batch, size = [], 0
+            for i in indices:
+                batch.append(i)
+                size += wad.directory[i]['size']
+                if size >= batch_bytes:
+                    futures.append((filename, pool.submit(
+                        _search, filename, pattern, batch)))
+                    batch, size = [], 0
+            if batch:
+                futures.append((filename, pool.submit(
+                    _search, filename, pattern, batch)))
+        for filename, future in futures:
+            try:
+                yield future.result()
+            except (OSError, ValueError) as error:
+                print("search: could not search %s: %s" % (filename, error),
+                      file=sys.stderr)
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+#Copyright 2022 Eric Duhamel
+#
+#    This file is part of Wadder.
+#
+#    Wadder is free software: you can redistribute it and/or modify it
+#    under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Wadder is distributed in the hope that it will be useful, but
+#    WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+#    General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Wadder. If not, see <https://www.gnu.org/licenses/>.
+#
+"""Compute statistics of Doom level maps.
+
+'get_stats' summarizes one 'Doom.Level' from the columns of its lumps.
+Counts are taken with 'collections.Counter' over whole columns and flag
+bits are tested once per distinct value, never once per record.
+
+'scan' runs over any number of WAD files with a pool of worker
+processes. Statistics are cached by a hash of each map's lumps, so a
+map that has not changed is never decoded twice. 'add_stats' sums the
+results of a whole corpus.
+"""
+import collections
+import concurrent.futures
+import hashlib
+import json
+import os
+import sys
+
+from xwadder import Doom, instrument, levels, wads
+
+# THINGS flag bits
+skills = dict(easy=1, medium=2, hard=4)
+ambush, multiplayer = 8, 16
+
+def get_hash(level):
+    """Return a hash of the name and content of every lump of a map."""
+    digest = hashlib.sha1()
+    for name, lump in sorted(level.lumps.items()):
+        digest.update(name.encode('ascii'))
+        digest.update(len(lump).to_bytes(4, 'little'))
+        digest.update(lump)
+    return digest.hexdigest()
+
+def count_flags(flags, bits):
+    """Return how many values of 'flags' have each named bit set."""
+    tally = collections.Counter(flags)
+    return {name: sum(n for value, n in tally.items() if value & bit)
+            for name, bit in bits.items()}
+
+def get_stats(level):
+    """Return a dictionary of statistics about a 'Doom.Level'.
+
+    Missing lumps count as empty. Keys of the 'thing_types',
+    'specials', 'tags' and 'sector_specials' counts are strings so that
+    the result can be stored as JSON.
+    """
+    def columns(name):
+        if level.lumps.get(name) or level.lumps.get('TEXTMAP'):
+            return level.get_columns(name)
+        return collections.defaultdict(list)
+    things = columns('THINGS')
+    linedefs = columns('LINEDEFS')
+    sidedefs = columns('SIDEDEFS')
+    vertexes = columns('VERTEXES')
+    sectors = columns('SECTORS')
+    stats = dict(
+        things=len(things['type']),
+        linedefs=len(linedefs['start']),
+        sidedefs=len(sidedefs['sector']),
+        vertexes=len(vertexes['x']),
+        sectors=len(sectors['light']),
+        )
+    stats['thing_types'] = _count(things['type'])
+    stats['skills'] = count_flags(things['flags'], skills)
+    stats['skills'].update(count_flags(things['flags'], dict(
+        ambush=ambush, multiplayer=multiplayer)))
+    stats['specials'] = _count(linedefs['type'], skip=0)
+    stats['tags'] = _count(linedefs.get('tag', ()), skip=0)  # not Hexen
+    stats['sector_specials'] = _count(sectors['special'], skip=0)
+    specials = collections.Counter(sectors['special'])
+    # sector type 9, or the Boom generalized secret bit
+    stats['secrets'] = sum(n for value, n in specials.items()
+                           if value == 9 or value & 128)
+    stats['secret_lines'] = count_flags(linedefs['flags'],
+                                        dict(secret=32))['secret']
+    xs, ys = vertexes['x'], vertexes['y']
+    stats['bbox'] = [min(xs), min(ys), max(xs), max(ys)] if xs else None
+    return stats
+
+def add_stats(total, stats):
+    """Add the counts of one map's statistics into a running total.
+
+    Numbers and count dictionaries are summed and the bounding box
+    grows to hold every map. Return 'total' with 'maps' incremented.
+    """
+    total['maps'] = total.get('maps', 0) + 1
+    for key, value in stats.items():
+        if key == 'bbox':
+            old = total.get(key)
+            if value and old:
+                value = [min(old[0], value[0]), min(old[1], value[1]),
+                         max(old[2], value[2]), max(old[3], value[3])]
+            total[key] = value or old
+        elif isinstance(value, dict):
+            counts = total.setdefault(key, {})
+            for name, n in value.items():
+                counts[name] = counts.get(name, 0) + n
+        elif isinstance(value, int):
+            total[key] = total.get(key, 0) + value
+    return total
+
+def _count(values, skip=None):
+    """Return a Counter of values as a dictionary with string keys."""
+    tally = collections.Counter(values)
+    tally.pop(skip, None)
+    return {str(value): n for value, n in sorted(tally.items())}
+
+def get_map_stats(wad, map_name, index, cache=None):
+    """Return statistics of one map, using a cache directory if given."""
+    level = Doom.Level()  # only columns, never per-record objects
+    level.lumps = levels.load_level(wad, index).lumps
+    key = get_hash(level)
+    path = os.path.join(cache, key + ".json") if cache else None
+    if path and os.path.isfile(path):
+        instrument.count("stats_cache_hits")
+        with open(path) as file:
+            stats = json.load(file)
+    else:
+        stats = get_stats(level)
+        if path:
+            temp = "%s.%d.tmp" % (path, os.getpid())
+            with open(temp, 'w') as file:
+                json.dump(stats, file)
+            os.replace(temp, path)
+    result = dict(wad=wad.filename, map=map_name, hash=key)
+    result.update(stats)
+    return result
+
+_wads = {}  # WADs opened by a worker process
+
+def _scan_map(filename, map_name, index, cache):
+    """Return the statistics of one map in a worker process."""
+    if filename not in _wads:
+        _wads[filename] = wads.open_wad(filename)
+        _wads[filename].map_file()
+    return get_map_stats(_wads[filename], map_name, index, cache)
+
+def scan(filenames, jobs=None, cache=None):
+    """Yield the statistics of every map in every WAD file.
+
+    Each WAD directory is read once here to find its maps, then the
+    maps are shared out among 'jobs' worker processes, each of which
+    maps every WAD it is given only once. Results are yielded in the
+    order of the files and maps, so that two runs can be compared. A
+    file that is not a WAD or cannot be read is reported to standard
+    error and skipped.
+    """
+    if cache and not os.path.isdir(cache):
+        os.makedirs(cache)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = []
+        for filename in filenames:
+            try:
+                maps = levels.find_maps(wads.open_wad(filename))
+            except (OSError, ValueError) as error:
+                print("stats: skipping", error, file=sys.stderr)
+                continue
+            for map_name, index in maps:
+                futures.append((filename, map_name, pool.submit(
+                    _scan_map, filename, map_name, index, cache)))
+        for filename, map_name, future in futures:
+            try:
+                yield future.result()
+            except (OSError, ValueError, IndexError, KeyError) as error:
+                print("stats: could not read %s of %s: %s" % (
+                    map_name, filename, error), file=sys.stderr)
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+#Copyright 2022 Eric Duhamel
+#
+#    This file is part of Wadder.
+#
+#    Wadder is free software: you can redistribute it and/or modify it
+#    under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Wadder is distributed in the hope that it will be useful, but
+#    WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+#    General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Wadder. If not, see <https://www.gnu.org/licenses/>.
+#
+"""Find which maps use which wall textures and flats.
+
+Each sidedef names an upper, lower and middle texture and each sector a
+floor and ceiling flat. 'Index' reads only those name fields of the
+SIDEDEFS and SECTORS lumps of every map and records, for each distinct
+name, the maps that use it. An index can be saved as JSON and loaded
+again to answer questions about a whole corpus without reading any WAD.
+"""
+import fnmatch
+import json
+import sys
+
+from xwadder import Doom, levels, udmf
+
+# offsets of name fields in SIDEDEFS and SECTORS records
+sidedef_names = (30, (4, 12, 20))
+sector_names = (26, (4, 12))
+
+def get_name_set(data, size, offsets):
+    """Return the set of distinct names at 'offsets' of each record.
+
+    Raw 8-byte fields are gathered into a set first, so each distinct
+    name is decoded and interned once however many records use it.
+    Blank names and "-" (no texture) are left out.
+    """
+    data = data[:len(data) - len(data) % size]
+    raw = set()
+    for offset in offsets:
+        raw.update(data[x: x + 8] for x in range(offset, len(data), size))
+    names = set()
+    for field in raw:
+        text = field.split(b"\0", 1)[0].decode('ascii', 'replace')
+        names.add(sys.intern(text.upper()))
+    names.discard("")
+    names.discard("-")
+    return names
+
+def get_map_names(wad, index):
+    """Return the (textures, flats) used by the map at 'index'."""
+    textures, flats = set(), set()
+    for i in range(index + 1, len(wad.directory)):
+        name = wad.get_entry(i)['name']
+        if name not in levels.map_lumps:
+            break
+        if name == "TEXTMAP":
+            columns = udmf.load_textmap(wad.get_lump(i))
+            sides, sectors = columns['SIDEDEFS'], columns['SECTORS']
+            textures = set(sides['upper'] + sides['lower'] + sides['middle'])
+            flats = set(sectors['floorpic'] + sectors['ceilingpic'])
+            textures.discard("-")
+            flats.discard("-")
+        elif name == "SIDEDEFS":
+            textures = get_name_set(wad.get_lump(i), *sidedef_names)
+        elif name == "SECTORS":
+            flats = get_name_set(wad.get_lump(i), *sector_names)
+    return textures, flats
+
+def read_texture_names(data):
+    """Return the names of the textures defined in a TEXTURE1/2 lump."""
+    count = Doom.read_int(data[0:4])
+    names = []
+    for x in range(4, 4 + count * 4, 4):
+        offset = Doom.read_int(data[x: x + 4])
+        name = bytes(data[offset: offset + 8]).split(b"\0", 1)[0]
+        names.append(name.decode('ascii', 'replace').upper())
+    return names
+
+
+class Index():
+    """An inverted index of texture and flat names to maps.
+
+    'maps' is a list of [WAD filename, map name] pairs, and 'textures'
+    and 'flats' map each name to a sorted list of positions in 'maps'.
+    """
+
+    def __init__(self, maps=None, textures=None, flats=None):
+        self.maps = maps or []
+        self.textures = textures or {}
+        self.flats = flats or {}
+
+    def add_wad(self, wad):
+        """Add every map of a 'wads.Wad' to the index.
+
+        The WAD is mapped into memory and only the SIDEDEFS and SECTORS
+        lumps of each map are read.
+        """
+        wad.map_file()
+        for map_name, index in levels.find_maps(wad):
+            textures, flats = get_map_names(wad, index)
+            self.add_map(wad.filename, map_name, textures, flats)
+
+    def add_map(self, filename, map_name, textures, flats):
+        """Add the names used by one map to the index."""
+        number = len(self.maps)
+        self.maps.append([filename, map_name])
+        for name in textures:
+            self.textures.setdefault(name, []).append(number)
+        for name in flats:
+            self.flats.setdefault(name, []).append(number)
+
+    def find(self, pattern, kind=None):
+        """Return the [filename, map] pairs using names like 'pattern'.
+
+        'pattern' is a name or a shell-style pattern such as "SW1*".
+        'kind' limits the search to "textures" or "flats".
+        """
+        pattern = pattern.upper()
+        ids = set()
+        for table in self._get_tables(kind):
+            if pattern in table:
+                ids.update(table[pattern])
+            elif any(c in pattern for c in "*?["):
+                for name in table:
+                    if fnmatch.fnmatchcase(name, pattern):
+                        ids.update(table[name])
+        return [self.maps[number] for number in sorted(ids)]
+
+    def get_unused(self, names, kind=None):
+        """Return the names in 'names' which no map in the index uses."""
+        tables = self._get_tables(kind)
+        return [name for name in names
+                if not any(name.upper() in table for table in tables)]
+
+    def _get_tables(self, kind):
+        if kind == "textures":
+            return [self.textures]
+        elif kind == "flats":
+            return [self.flats]
+        return [self.textures, self.flats]
+
+    def save(self, path):
+        """Save the index as a JSON file."""
+        with open(path, 'w') as file:
+            json.dump(dict(maps=self.maps, textures=self.textures,
+                           flats=self.flats), file, separators=(",", ":"))
+        return path
+
+    @classmethod
+    def load(cls, path):
+        """Return an index loaded from a JSON file."""
+        with open(path) as file:
+            data = json.load(file)
+        return cls(data['maps'], data['textures'], data['flats'])
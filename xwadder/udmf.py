@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+#Copyright 2022 Eric Duhamel
+#
+#    This file is part of Wadder.
+#
+#    Wadder is free software: you can redistribute it and/or modify it
+#    under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Wadder is distributed in the hope that it will be useful, but
+#    WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+#    General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Wadder. If not, see <https://www.gnu.org/licenses/>.
+#
+"""Read maps in the Universal Doom Map Format.
+
+A UDMF map is a marker lump followed by a TEXTMAP lump, any number of
+other lumps and an ENDMAP marker. TEXTMAP is text made of global
+assignments such as 'namespace = "doom";' and blocks such as:
+
+    vertex { x = 64.0; y = -128.0; }
+
+'parse' reads TEXTMAP a chunk at a time from any iterable of bytes,
+e.g. 'read_chunks' over a lump or memory-mapped WAD, and yields each
+block as soon as it is complete, so a large map is never tokenized all
+at once. 'load_columns' fills the same columns of values that
+'Doom.read_columns' decodes from binary map lumps.
+
+[UDMF](https://doomwiki.org/wiki/UDMF)
+"""
+import array
+import re
+import sys
+import time
+
+from xwadder import instrument
+
+# whitespace and comments, then an assignment, a block or a block end
+_space = rb"(?:\s|//[^\n]*|/\*.*?\*/)*"
+_token = re.compile(_space + rb"(?:([A-Za-z_][A-Za-z0-9_]*)" + _space +
+                    rb"(?:=" + _space + rb"(\"(?:[^\"\\]|\\.)*\"|[^;\"\s/]+)" +
+                    _space + rb";|(\{))|(\}))", re.DOTALL)
+_end = re.compile(_space, re.DOTALL)
+_escape = re.compile(rb"\\(.)", re.DOTALL)
+
+# block fields copied into the columns of binary map lumps as
+# (column, key, default, typecode)
+fields = dict(
+    THINGS=('thing', (('x', 'x', 0, 'd'), ('y', 'y', 0, 'd'),
+                      ('angle', 'angle', 0, 'l'), ('type', 'type', 0, 'l'))),
+    LINEDEFS=('linedef', (('start', 'v1', 0, 'l'), ('end', 'v2', 0, 'l'),
+                          ('type', 'special', 0, 'l'),
+                          ('tag', 'arg0', 0, 'l'),
+                          ('front', 'sidefront', 0xffff, 'l'),
+                          ('back', 'sideback', 0xffff, 'l'))),
+    SIDEDEFS=('sidedef', (('xoffs', 'offsetx', 0, 'l'),
+                          ('yoffs', 'offsety', 0, 'l'),
+                          ('upper', 'texturetop', "-", '8s'),
+                          ('lower', 'texturebottom', "-", '8s'),
+                          ('middle', 'texturemiddle', "-", '8s'),
+                          ('sector', 'sector', 0, 'l'))),
+    VERTEXES=('vertex', (('x', 'x', 0, 'd'), ('y', 'y', 0, 'd'))),
+    SECTORS=('sector', (('floor', 'heightfloor', 0, 'l'),
+                        ('ceiling', 'heightceiling', 0, 'l'),
+                        ('floorpic', 'texturefloor', "-", '8s'),
+                        ('ceilingpic', 'textureceiling', "-", '8s'),
+                        ('light', 'lightlevel', 160, 'l'),
+                        ('special', 'special', 0, 'l'),
+                        ('tag', 'id', 0, 'l'))),
+    )
+# boolean fields gathered into the binary 'flags' column
+flag_bits = dict(
+    THINGS=(('skill1', 1), ('skill2', 1), ('skill3', 2), ('skill4', 4),
+            ('skill5', 4), ('ambush', 8)),
+    LINEDEFS=(('blocking', 1), ('blockmonsters', 2), ('twosided', 4),
+              ('dontpegtop', 8), ('dontpegbottom', 16), ('secret', 32),
+              ('blocksound', 64), ('dontdraw', 128), ('mapped', 256)),
+    )
+
+def read_chunks(data, size=1 << 20):
+    """Yield 'data' (bytes, mmap or an open binary file) in chunks."""
+    if hasattr(data, 'read') and not hasattr(data, '__getitem__'):
+        chunk = data.read(size)
+        while chunk:
+            yield chunk
+            chunk = data.read(size)
+        return
+    for x in range(0, len(data), size):
+        yield data[x: x + size]
+
+def get_value(raw):
+    """Return the Python value of a raw UDMF value."""
+    if raw[0:1] == b'"':
+        text = _escape.sub(rb"\1", raw[1:-1]) if b"\\" in raw else raw[1:-1]
+        return text.decode('utf_8', 'replace')
+    lower = raw.lower()
+    if lower == b"true":
+        return True
+    elif lower == b"false":
+        return False
+    try:
+        return int(raw, 0)
+    except ValueError:
+        pass
+    try:
+        return float(raw)
+    except ValueError:
+        return raw.decode('ascii', 'replace')
+
+def parse(chunks):
+    """Yield (name, fields) for each block of a TEXTMAP.
+
+    'chunks' is any iterable of bytes. 'name' is the lowercase block
+    type, e.g. 'vertex', and 'fields' a dictionary of lowercase keys
+    to values. A global assignment is yielded with 'name' None.
+
+    Each match of one regular expression is a whole assignment with any
+    whitespace and comments before it, so the Python loop runs once per
+    field rather than once per character or token. Raw keys and values
+    are converted once each. An incomplete assignment at the end of a
+    chunk is kept until the next. Raise ValueError at the first thing
+    that is not UDMF.
+    """
+    buffer, offset = b"", 0
+    name, block = None, None
+    keys, values = {}, {}  # raw keys and values seen, most of which repeat
+    for chunk in chunks:
+        buffer = buffer + bytes(chunk)
+        pos = 0
+        match = _token.match(buffer)
+        while match:
+            key, raw, opening, closing = match.groups()
+            if key is not None:
+                text = keys.get(key)
+                if text is None:
+                    text = keys[key] = key.decode('ascii').lower()
+            if raw is not None:
+                value = values.get(raw)
+                if value is None:
+                    value = values[raw] = get_value(raw)
+                if block is None:
+                    yield None, {text: value}
+                else:
+                    block[text] = value
+            elif opening:
+                if block is not None:
+                    raise ValueError("udmf: nested block at byte %d"
+                                     % (offset + match.start(1)))
+                name, block = text, {}
+            else:
+                if block is None:
+                    raise ValueError("udmf: unexpected '}' at byte %d"
+                                     % (offset + match.start(4)))
+                yield name, block
+                name, block = None, None
+            pos = match.end()
+            match = _token.match(buffer, pos)
+        buffer = buffer[pos:]
+        offset += pos
+    if block is not None or not _end.fullmatch(buffer):
+        raise ValueError("udmf: incomplete or invalid data at byte %d"
+                         % offset)
+
+@instrument.timed("decode")
+def load_columns(blocks):
+    """Return columns of values for each binary map lump name.
+
+    'blocks' are (name, fields) pairs from 'parse'. The result is a
+    dictionary such as {'VERTEXES': {'x': array, 'y': array}, ...}
+    with the column names of 'Doom.layouts', so either map format can
+    be processed by the same code. Coordinates are floating point and
+    a missing side is 0xffff as in binary maps. Also return the value
+    of 'namespace' under the key 'namespace'.
+    """
+    lumps = {}
+    kinds = {}
+    for lump, (kind, spec) in fields.items():
+        lumps[lump] = {column: ([] if code == '8s' else array.array(code))
+                       for column, key, default, code in spec}
+        if lump in flag_bits:
+            lumps[lump]['flags'] = array.array('l')
+        kinds[kind] = lump
+    lumps['namespace'] = None
+    for name, block in blocks:
+        if name is None:
+            if 'namespace' in block:
+                lumps['namespace'] = block['namespace']
+            continue
+        lump = kinds.get(name)
+        if lump is None:
+            continue
+        columns = lumps[lump]
+        for column, key, default, code in fields[lump][1]:
+            value = block.get(key, default)
+            if code == '8s':
+                value = sys.intern(str(value).upper())
+            elif default == 0xffff and value < 0:  # 'sideback = -1;'
+                value = 0xffff
+            columns[column].append(value)
+        if lump in flag_bits:
+            flags = 0
+            for key, bit in flag_bits[lump]:
+                if block.get(key):
+                    flags |= bit
+            if lump == 'THINGS' and not block.get('single'):
+                flags |= 16  # multiplayer only
+            columns['flags'].append(flags)
+    return lumps
+
+def load_textmap(data, size=1 << 20):
+    """Return the columns of a TEXTMAP held in bytes, mmap or a file."""
+    return load_columns(parse(read_chunks(data, size)))
+
+if __name__ == "__main__":
+    # benchmark: python3 -m xwadder.udmf TEXTMAP.lmp
+    for filename in sys.argv[1:]:
+        with open(filename, 'rb') as file:
+            data = file.read()
+        began = time.perf_counter()
+        count = sum(1 for block in parse(read_chunks(data)))
+        parsed = time.perf_counter()
+        load_textmap(data)
+        loaded = time.perf_counter()
+        megabytes = len(data) / 1e6
+        print("%s: %.1f MB, %d blocks" % (filename, megabytes, count))
+        print("  parse: %.2f s, %.1f MB/s" % (parsed - began,
+                                             megabytes / (parsed - began)))
+        print("  columns: %.2f s, %.1f MB/s" % (loaded - parsed,
+                                               megabytes / (loaded - parsed)))
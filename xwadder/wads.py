@@ -22,12 +22,23 @@ a module for working with WAD files and content
 The 'Wad' class encapsulates metadata from a WAD file and provides
 methods to retrieve lump data.
 
+Its 'rebuild' method writes a compacted copy of a WAD, with the help
+of 'copy_range'. 'insert_lump', 'replace_lump' and 'delete_lump' edit
+a WAD in place and 'commit' saves the edits, leaving replaced and
+deleted data in the file until 'compact' rebuilds it.
+
 'readint' and 'readstr' functions interpret binary data in a standard
 way.
 """
+import hashlib
+import mmap
 import os
+import re
+import struct
 import sys
 
+from xwadder import instrument, levels, lumps, query
+
 def readint(data):
     """Interpret binary data as an integer."""
     return int.from_bytes(data, byteorder='little')
@@ -36,6 +47,44 @@ def readstr(data):
     """Interpret binary data as a string."""
     return data.decode('ascii').strip("\0")
 
+def copy_range(source, target, offset, count):
+    """Copy 'count' bytes at 'offset' of 'source' to the end of 'target'.
+
+    Both are unbuffered files. The kernel copies the bytes itself with
+    'os.copy_file_range' or 'os.sendfile' where the system allows it,
+    so they never pass through Python; otherwise they are read and
+    written in chunks.
+    """
+    while count:
+        copied = 0
+        try:
+            copied = os.copy_file_range(source.fileno(), target.fileno(),
+                                        count, offset)
+        except (AttributeError, OSError):
+            try:
+                copied = os.sendfile(target.fileno(), source.fileno(),
+                                     offset, count)
+            except (AttributeError, OSError):
+                data = os.pread(source.fileno(), min(count, 1 << 20),
+                                offset)
+                copied = target.write(data)
+        if not copied:
+            raise OSError("wads: unexpected end of file copying lumps")
+        offset += copied
+        count -= copied
+
+def open_wad(filename):
+    """Return a 'Wad' for 'filename', raising ValueError if the file is
+    not a WAD or its directory cannot be read.
+    """
+    try:
+        wad = Wad(filename)
+    except (IndexError, UnicodeDecodeError, struct.error) as error:
+        raise ValueError("%s: damaged WAD directory: %s" % (filename, error))
+    if not hasattr(wad, 'directory'):
+        raise ValueError("%s: not a WAD file" % filename)
+    return wad
+
 class Wad:
     """Represent a WAD binary data file.
 
@@ -48,8 +97,18 @@ class Wad:
     'entry' is the metadata for one lump in dictionary form.
 
     'lump' is the raw binary data in bytes form.
+
+    A WAD can be edited without rewriting it. New and replaced lump
+    data is appended to the end of the file as it is given, and the
+    directory is changed only in memory until 'commit' appends the new
+    directory and then points the header at it. Until the header is
+    written the file still reads as it did before, so an edit that is
+    interrupted loses nothing. The cost of an edit is the size of the
+    data given plus one directory; the space left behind by replaced
+    lumps and old directories is reclaimed by 'rebuild'.
     """
 
+    @instrument.timed("directory")
     def __init__(self, filename):
         """Construct header and directory from WAD file.
 
@@ -76,27 +135,76 @@ class Wad:
                         name=name
                         )
                     self.directory.append(entry)
+                instrument.count("directory_entries", self.numlumps)
         self.filename = filename
+        self.mapping = None
+        self.editor = None
+        self.names = None
+        self.kinds = None
+
+    def map_file(self):
+        """Map the WAD file into memory for repeated lump reads.
+
+        Once mapped, 'get_lump' slices the mapping instead of opening
+        the file for every lump, and 'get_view' can return lump data
+        without copying it. The mapping is read-only and shares the
+        operating system's page cache with any other process that maps
+        the same file.
+        """
+        if self.mapping is None:
+            with open(self.filename, 'rb') as file:
+                self.mapping = mmap.mmap(file.fileno(), 0,
+                                         access=mmap.ACCESS_READ)
+        return self.mapping
+
+    def close(self):
+        """Release the memory mapping, and close the file if editing.
+
+        Edits not yet committed are not saved.
+        """
+        if self.mapping is not None:
+            self.mapping.close()
+            self.mapping = None
+        if self.editor is not None:
+            self.editor.close()
+            self.editor = None
+
+    def get_names(self):
+        """Return a 'query.NameTable' of the directory, built once."""
+        if self.names is None:
+            self.names = query.NameTable(entry['name']
+                                         for entry in self.directory)
+        return self.names
+
+    def get_kinds(self):
+        """Return the kind of every lump as a list, classified once.
+
+        See 'lumps' for the kinds. Editing the directory drops the list.
+        """
+        if self.kinds is None:
+            self.kinds = lumps.classify(self)
+        return self.kinds
+
+    def query(self, patterns, kind="prefix"):
+        """Return an array of the index of every entry matching a query.
+
+        'patterns' is one pattern or a list of them and 'kind' is
+        "prefix", "glob" or "regex" (see 'query').
+        """
+        return self.get_names().find(patterns, kind)
 
     def locate(self, name, n=0):
         """Return the location of the nth entry matching 'name'."""
-        instances = []
-        for i, entry in enumerate(self.directory):
-            if entry['name'][:len(name)] == name:
-                instances.append(i)
+        instances = self.query(name)
         if len(instances) > n:
             return instances[n]
 
     def locate_name(self, name, multi=False):
         """Return the location of the first entry matching 'name'."""
-        locates = []
-        for i, entry in enumerate(self.directory):
-            if entry['name'][:len(name)] == name:
-                if multi:
-                    locates.append(i)
-                else:
-                    return i
-        return locates
+        locates = self.query(name)
+        if locates and not multi:
+            return locates[0]
+        return list(locates)
 
     def get_data(self, index):
         return self.get_lump(index)
@@ -108,11 +216,259 @@ class Wad:
     def get_lump(self, index):
         """Return lump data as bytes."""
         entry = self.directory[index]
-        with open(self.filename, 'rb') as file:
+        if instrument.enabled:  # checked here as this is the hottest path
+            instrument.count("read_calls")
+            instrument.count("bytes_read", entry['size'])
+        if self.mapping is not None:
+            filepos = entry['filepos']
+            return self.mapping[filepos: filepos + entry['size']]
+        with instrument.stage("read"), open(self.filename, 'rb') as file:
             file.seek(entry['filepos'])
             lump = file.read(entry['size'])
+        instrument.count("file_opens")
         return lump
 
+    def get_view(self, index):
+        """Return lump data as a memoryview of the mapped file.
+
+        No data is copied. Views must be released before 'close'.
+        """
+        entry = self.directory[index]
+        filepos = entry['filepos']
+        if instrument.enabled:
+            instrument.count("view_calls")
+            instrument.count("bytes_viewed", entry['size'])
+        return memoryview(self.map_file())[filepos: filepos + entry['size']]
+
+    def locate_namespace(self, prefix):
+        """Return the index of every lump in a marker namespace.
+
+        'prefix' is the letter of the markers, e.g. 'S' for sprites
+        between S_START and S_END, 'F' for flats or 'P' for patches.
+        Doubled and numbered markers such as SS_START, FF_END or
+        P1_START are accepted and nested markers are skipped.
+        """
+        marker = re.compile(re.escape(prefix) + "{1,2}[0-9]?_(START|END)$")
+        indices, depth = [], 0
+        for i, entry in enumerate(self.directory):
+            match = marker.match(entry['name'])
+            if match:
+                depth += 1 if match.group(1) == "START" else -1
+                depth = max(depth, 0)
+            elif depth and entry['size']:
+                indices.append(i)
+        return indices
+
+    def locate_glob(self, pattern, indices=None):
+        """Return the index of every entry whose name matches 'pattern'.
+
+        'pattern' is a shell-style wildcard such as 'TROO*' or 'SKY?'.
+        """
+        matches = self.query(pattern.upper(), "glob")
+        if indices is None:
+            return list(matches)
+        matches = set(matches)
+        return [i for i in indices if i in matches]
+
+    def get_groups(self):
+        """Return a group key for every entry, for keeping lumps together.
+
+        The lumps of one map share the index of its marker, lumps
+        between markers such as F_START and F_END share the letter of
+        the namespace, wherever its sections are, and any other lump is
+        a group of its own.
+        """
+        groups = list(range(len(self.directory)))
+        for name, marker in levels.find_maps(self):
+            for i in range(marker + 1, len(self.directory)):
+                if self.directory[i]['name'] not in levels.map_lumps:
+                    break
+                groups[i] = marker
+        marker = re.compile("([A-Z])[A-Z]?[0-9]?_(START|END)$")
+        namespace = None
+        for i, entry in enumerate(self.directory):
+            match = marker.match(entry['name'])
+            if match:
+                groups[i] = match.group(1)
+                namespace = match.group(1) if match.group(2) == "START" else (
+                    None)
+            elif namespace:
+                groups[i] = namespace
+        return groups
+
+    @instrument.timed("write")
+    def rebuild(self, filename):
+        """Write a compacted copy of the WAD to 'filename'.
+
+        The directory keeps its order, but lump data is laid out group
+        by group (see 'get_groups') in the order each group first
+        appears, so a map or a namespace is read from one stretch of
+        the file. Identical lumps are written once and share it, and
+        bytes no entry refers to are left out. Lumps are copied by
+        'copy_range' in runs that are contiguous in both files. The
+        copy is written beside 'filename' and moved over it when
+        complete, with the permissions of the file it replaces (or of
+        this WAD's), so 'filename' may be this WAD's own file. If
+        anything fails the copy is removed. Return the number of bytes
+        written and of lumps shared.
+        """
+        data = self.map_file()
+        groups = self.get_groups()
+        first = {}
+        for i, group in enumerate(groups):
+            first.setdefault(group, i)
+        order = sorted(range(len(self.directory)),
+                       key=lambda i: (first[groups[i]], i))
+        temp = "%s.%d.tmp" % (filename, os.getpid())
+        positions, copies, shared = [0] * len(self.directory), {}, 0
+        try:
+            with open(self.filename, 'rb', buffering=0) as source, open(
+                    temp, 'wb', buffering=0) as target:
+                original = filename if os.path.exists(filename) else (
+                    self.filename)
+                os.fchmod(target.fileno(), os.stat(original).st_mode & 0o7777)
+                target.write(bytes(12))
+                run_start = run_end = None
+                for i in order:
+                    entry = self.directory[i]
+                    filepos, size = entry['filepos'], entry['size']
+                    if not size:
+                        continue
+                    if filepos + size > len(data):
+                        raise ValueError("wads: lump %d runs past the end of "
+                                         "the file" % i)
+                    key = (size, hashlib.sha1(data[filepos: filepos + size])
+                           .digest())
+                    if key in copies:
+                        positions[i] = copies[key]
+                        shared += 1
+                        continue
+                    if filepos != run_end:
+                        if run_start is not None:
+                            copy_range(source, target, run_start,
+                                       run_end - run_start)
+                        run_start = filepos
+                    positions[i] = copies[key] = target.tell() + (
+                        filepos - run_start)
+                    run_end = filepos + size
+                if run_start is not None:
+                    copy_range(source, target, run_start, run_end - run_start)
+                infotableofs = target.seek(0, os.SEEK_END)
+                target.write(b"".join(
+                    struct.pack("<II8s", positions[i], entry['size'],
+                                entry['name'].encode('ascii'))
+                    for i, entry in enumerate(self.directory)))
+                target.seek(0)
+                target.write(self.header[0:4] + struct.pack(
+                    "<II", len(self.directory), infotableofs))
+                os.fsync(target.fileno())
+                written = target.seek(0, os.SEEK_END)
+            os.replace(temp, filename)
+        except BaseException:
+            if os.path.exists(temp):
+                os.remove(temp)
+            raise
+        return written, shared
+
+    def append_data(self, data):
+        """Append lump data to the end of the file and return its position.
+
+        The data is flushed, so 'get_lump' and a new mapping see it
+        before 'commit'. The memory mapping, which cannot see past the
+        old end of the file, is dropped; views already taken of it stay
+        valid.
+        """
+        if self.editor is None:
+            self.editor = open(self.filename, 'r+b')
+        self.mapping = None
+        filepos = self.editor.seek(0, os.SEEK_END)
+        self.editor.write(data)
+        self.editor.flush()
+        instrument.count("bytes_written", len(data))
+        return filepos
+
+    def insert_lump(self, name, data, index=None):
+        """Insert a lump before entry 'index', or at the end if None.
+
+        The data is appended to the file now and the entry is added to
+        the directory, to be saved by 'commit'. Return its index.
+        """
+        if index is None:
+            index = len(self.directory)
+        name = name.upper()
+        if len(name) > 8 or not name.isascii():
+            raise ValueError("wads: invalid lump name %r" % name)
+        filepos = self.append_data(data) if len(data) else 0
+        self.directory.insert(index, dict(index=index, filepos=filepos,
+                                          size=len(data), name=name))
+        self.names = self.kinds = None
+        for i in range(index + 1, len(self.directory)):
+            self.directory[i]['index'] = i
+        return index
+
+    def replace_lump(self, index, data):
+        """Replace the data of entry 'index', to be saved by 'commit'.
+
+        The old data stays in the file, unreferenced, until 'compact',
+        and the new data is appended unless it is the same.
+        """
+        entry = self.directory[index]
+        if len(data) == entry['size'] and data == self.get_lump(index):
+            return
+        entry['filepos'] = self.append_data(data) if len(data) else 0
+        entry['size'] = len(data)
+        self.kinds = None
+
+    def delete_lump(self, index):
+        """Remove entry 'index' from the directory, to be saved by 'commit'.
+
+        Nothing but the directory is changed; the data stays in the
+        file until 'compact'.
+        """
+        del self.directory[index]
+        self.names = self.kinds = None
+        for i in range(index, len(self.directory)):
+            self.directory[i]['index'] = i
+
+    @instrument.timed("write")
+    def commit(self):
+        """Save edits by appending the directory and updating the header.
+
+        The directory is written and flushed to disk before the header
+        is changed to point to it, and the header is flushed too before
+        returning, so the file holds either the old WAD or the new one
+        whenever it is read.
+        """
+        self.append_data(b"".join(
+            struct.pack("<II8s", entry['filepos'], entry['size'],
+                        entry['name'].encode('ascii'))
+            for entry in self.directory))
+        infotableofs = self.editor.tell() - 16 * len(self.directory)
+        self.editor.flush()
+        os.fsync(self.editor.fileno())
+        header = self.header[0:4] + struct.pack("<II", len(self.directory),
+                                                infotableofs)
+        self.editor.seek(0)
+        self.editor.write(header)
+        self.editor.flush()
+        os.fsync(self.editor.fileno())
+        self.editor.close()
+        self.editor = None
+        self.header, self.numlumps = header, len(self.directory)
+        self.infotableofs = infotableofs
+
+    def compact(self):
+        """Rebuild this WAD's own file, edits included, and reload it.
+
+        Data left behind by 'replace_lump' and 'delete_lump' is dropped
+        (see 'rebuild'). Uncommitted edits are saved too. Return what
+        'rebuild' returns.
+        """
+        result = self.rebuild(self.filename)
+        self.close()
+        self.__init__(self.filename)
+        return result
+
     def save_lump(self, index, dirname, filename=None):
         entry = self.directory[index]
         if not filename: